@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -79,13 +80,33 @@ WSGI_APPLICATION = 'alx_backend_graphql_crm.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connections are kept open for CONN_MAX_AGE seconds and checked before
+# reuse. On PostgreSQL, OPTIONS {'pool': True} (psycopg 3 with
+# psycopg-pool) adds a connection pool per process; CONN_MAX_AGE must
+# then be 0.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    },
 }
 
+# Local stand-in for a read replica, defined only when CRM_REPLICA_DATABASE
+# names its SQLite file; it only receives reads once it is listed in
+# CRM_DATABASE_ROUTING['REPLICAS']. The replica routing tests run when it is
+# defined.
+if os.environ.get('CRM_REPLICA_DATABASE'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['CRM_REPLICA_DATABASE'],
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    }
+
+DATABASE_ROUTERS = ['crm.routing.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -128,5 +149,56 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 GRAPHENE = {
-    'SCHEMA': 'alx_backend_graphql_crm.schema.schema'
-}
\ No newline at end of file
+    'SCHEMA': 'alx_backend_graphql_crm.schema.schema',
+    # graphene-django adds DjangoDebugMiddleware when DEBUG is on; the
+    # schema has no _debug field for it to serve, and it wraps the cursor
+    # of every connection, replicas included, for each operation
+    'MIDDLEWARE': [],
+}
+# Result cache for read-only GraphQL queries (crm.response_cache), off by
+# default. crm.response_cache.LocMemBackend keeps entries and versions per
+# process: a write only invalidates the worker that made it, and the others
+# serve stale results for up to TIMEOUT seconds. Use it with a single
+# worker only; with several, share RedisBackend between them:
+#
+# CRM_RESPONSE_CACHE = {
+#     'BACKEND': 'crm.response_cache.RedisBackend',
+#     'OPTIONS': {'url': 'redis://localhost:6379/0'},
+#     'TIMEOUT': 60,
+# }
+CRM_RESPONSE_CACHE = None
+
+# Maximum estimated cost and selection depth of a GraphQL operation
+# (crm.cost); None disables a check.
+CRM_QUERY_COST_LIMIT = 10000
+CRM_QUERY_DEPTH_LIMIT = 10
+
+# Resolver and SQL tracing (crm.tracing). Clients get a trace in the
+# response extensions by sending {"tracing": true}; SAMPLE_RATE traces a
+# fraction of all operations for the crm.tracing log and /metrics/.
+CRM_TRACING = {
+    'REQUESTABLE': DEBUG,
+    'SAMPLE_RATE': 0.0,
+    'LOG': True,
+    'METRICS': True,
+    'N_PLUS_ONE_THRESHOLD': 3,
+}
+
+# How scheduled jobs (crm.jobs) run their GraphQL operations: 'inprocess'
+# against the schema, or 'http' against a running server's /graphql/jobs/
+# endpoint at URL. That endpoint, and loadtest_graphql against a running
+# server, authenticate with TOKEN; it rejects every request while unset.
+CRM_JOBS = {
+    'MODE': 'inprocess',
+    'URL': 'http://localhost:8000/graphql/jobs/',
+    'TOKEN': None,
+}
+
+# Read-replica routing (crm.routing). GraphQL queries read from one of
+# REPLICAS; mutations and everything outside the GraphQL views use the
+# primary, and a client with a session that ran a mutation reads from the
+# primary for STICKY_SECONDS to see its own writes.
+CRM_DATABASE_ROUTING = {
+    'REPLICAS': [],
+    'STICKY_SECONDS': 5,
+}
@@ -16,10 +16,17 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
+from crm.views import (
+    AsyncCRMGraphQLView, AsyncJobGraphQLView, CRMGraphQLView, JobGraphQLView, export_view, metrics_view,
+)
 from alx_backend_graphql_crm.schema import schema
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('graphql/', GraphQLView.as_view(graphiql=True, schema=schema)),
+    path('graphql/', CRMGraphQLView.as_view(graphiql=True, schema=schema)),
+    path('graphql/async/', AsyncCRMGraphQLView.as_view(schema=schema)),
+    path('graphql/jobs/', JobGraphQLView.as_view(schema=schema)),
+    path('graphql/async/jobs/', AsyncJobGraphQLView.as_view(schema=schema)),
+    path('metrics/', metrics_view),
+    path('export/<str:kind>/', export_view),
 ]
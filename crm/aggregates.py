@@ -0,0 +1,93 @@
+"""Denormalized order aggregates on ``Customer``.
+
+``last_order_date``, ``order_count`` and ``total_spend`` are kept up to date
+by the signal handlers in ``crm.signals``: a new order or a change to an
+order's total is applied as an ``F()`` delta on its customer, and anything
+that cannot be expressed as a delta (deletes, product-side relinks that
+reprice many orders) recomputes the affected customers with one correlated
+``UPDATE``. ``reconcile_customer_aggregates`` repairs any drift left by
+writes that bypass signals or edit saved orders directly. ``update()``
+sends no ``post_save``, so every helper expires cached ``Customer``
+results itself.
+"""
+from decimal import Decimal
+from django.db.models import Count, F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from .models import Customer, Order
+from .response_cache import invalidate_models
+
+
+def _order_aggregate(model, aggregate):
+    return (
+        model.objects.filter(customer_id=OuterRef('pk'))
+        .order_by()
+        .values('customer_id')
+        .annotate(value=aggregate)
+        .values('value')
+    )
+
+
+def aggregate_updates(order_model=Order):
+    """``update()`` kwargs recomputing every aggregate from the order table."""
+    return {
+        'order_count': Coalesce(Subquery(_order_aggregate(order_model, Count('pk'))), 0),
+        'total_spend': Coalesce(Subquery(_order_aggregate(order_model, Sum('total_amount'))), Decimal('0.00')),
+        'last_order_date': Subquery(_order_aggregate(order_model, Max('order_date'))),
+    }
+
+
+def refresh_customer_aggregates(customer_ids):
+    """Recompute the aggregates of ``customer_ids`` (ids or a queryset) in one UPDATE."""
+    updated = Customer.objects.filter(pk__in=customer_ids).update(**aggregate_updates())
+    invalidate_models(Customer)
+    return updated
+
+
+def refresh_order_customers(order_ids):
+    refresh_customer_aggregates(Order.objects.filter(pk__in=order_ids).values('customer_id'))
+
+
+def record_new_order(order):
+    """Fold a freshly created order into its customer's aggregates."""
+    Customer.objects.filter(pk=order.customer_id).update(
+        order_count=F('order_count') + 1,
+        total_spend=F('total_spend') + Value(Decimal(order.total_amount or 0)),
+        last_order_date=Coalesce(Greatest('last_order_date', Value(order.order_date)), Value(order.order_date)),
+    )
+    invalidate_models(Customer)
+
+
+def record_total_change(order, old_total, new_total):
+    delta = Decimal(new_total or 0) - Decimal(old_total or 0)
+    if delta:
+        Customer.objects.filter(pk=order.customer_id).update(total_spend=F('total_spend') + Value(delta))
+        invalidate_models(Customer)
+
+
+def reconcile_customer_aggregates(batch_size=1000, dry_run=False):
+    """Compare every customer's aggregates with its orders and fix the drifted ones.
+
+    Walks customers in primary-key batches; returns ``(checked, drifted)``.
+    """
+    checked = drifted = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            Customer.objects.filter(pk__gt=last_pk).order_by('pk')
+            .annotate(**{f'expected_{name}': value for name, value in aggregate_updates().items()})
+            .values_list(
+                'pk', 'order_count', 'total_spend', 'last_order_date',
+                'expected_order_count', 'expected_total_spend', 'expected_last_order_date',
+            )[:batch_size]
+        )
+        if not batch:
+            return checked, drifted
+        last_pk = batch[-1][0]
+        checked += len(batch)
+        stale = [
+            pk for pk, count, spend, last, expected_count, expected_spend, expected_last in batch
+            if (count, Decimal(spend), last) != (expected_count, Decimal(expected_spend), expected_last)
+        ]
+        drifted += len(stale)
+        if stale and not dry_run:
+            refresh_customer_aggregates(stale)
@@ -0,0 +1,194 @@
+"""Vectorized order analytics with NumPy.
+
+Order and line-item columns are streamed from the database with
+``values_list(...).iterator()`` into compact arrays: ``datetime64[D]``
+days, ``int64`` amounts in cents and ``int32`` ids. Group-bys,
+percentiles and cohort retention then run as array operations instead of
+one aggregate query per report. Amounts are converted to cents and days
+truncated by the database, so rows cross into Python as plain integers
+and dates.
+
+NumPy is an optional dependency: importing this module without it raises
+``ImportError``, and the GraphQL fields backed by it report an error.
+"""
+from dataclasses import dataclass
+from datetime import timedelta
+from itertools import islice
+import numpy as np
+from django.db.models import BigIntegerField, F, Min
+from django.db.models.functions import Cast, Round, TruncDate
+from .models import LINE_TOTAL, Order, OrderItem
+from .rollups import day_start
+
+LOAD_CHUNK_SIZE = 50000
+
+
+@dataclass
+class OrderColumns:
+    ids: np.ndarray          # int32, ascending
+    days: np.ndarray         # datetime64[D]
+    customer_ids: np.ndarray  # int32
+    totals: np.ndarray       # int64 cents
+
+    def __len__(self):
+        return len(self.ids)
+
+
+@dataclass
+class ItemColumns:
+    orders: np.ndarray       # int32 row of the item's order in OrderColumns
+    product_ids: np.ndarray  # int32
+    quantities: np.ndarray   # int32
+    totals: np.ndarray       # int64 cents
+
+    def __len__(self):
+        return len(self.orders)
+
+
+def _cents(expression):
+    return Cast(Round(expression * 100), BigIntegerField())
+
+
+def _stream(rows, dtypes, chunk_size):
+    """Read ``rows`` tuples chunk by chunk into one array per column."""
+    columns = [[] for _ in dtypes]
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        for parts, values, dtype in zip(columns, zip(*chunk), dtypes):
+            parts.append(np.array(values, dtype=dtype))
+    return [np.concatenate(parts) if parts else np.empty(0, dtype=dtype) for parts, dtype in zip(columns, dtypes)]
+
+
+def _placed_between(queryset, first, last, prefix=''):
+    if first is not None:
+        queryset = queryset.filter(**{f'{prefix}order_date__gte': day_start(first)})
+    if last is not None:
+        queryset = queryset.filter(**{f'{prefix}order_date__lt': day_start(last + timedelta(days=1))})
+    return queryset
+
+
+def load_orders(first=None, last=None, chunk_size=LOAD_CHUNK_SIZE):
+    """Orders placed from day ``first`` to ``last`` (inclusive) as columns."""
+    rows = (
+        _placed_between(Order.objects.order_by('pk'), first, last)
+        .annotate(day=TruncDate('order_date'), cents=_cents(F('total_amount')))
+        .values_list('pk', 'day', 'customer_id', 'cents')
+        .iterator(chunk_size=chunk_size)
+    )
+    ids, days, customer_ids, totals = _stream(
+        rows, (np.int32, 'datetime64[D]', np.int32, np.int64), chunk_size
+    )
+    return OrderColumns(ids, days, customer_ids, totals)
+
+
+def first_order_days(first=None, last=None, chunk_size=LOAD_CHUNK_SIZE):
+    """``(customer ids, days)`` of the first order ever placed by each customer
+    with orders from day ``first`` to ``last``, ordered by id."""
+    customers = _placed_between(Order.objects.order_by(), first, last).values('customer_id')
+    rows = (
+        Order.objects.filter(customer_id__in=customers).order_by('customer_id')
+        .values('customer_id').annotate(day=Min(TruncDate('order_date')))
+        .values_list('customer_id', 'day')
+        .iterator(chunk_size=chunk_size)
+    )
+    ids, days = _stream(rows, (np.int32, 'datetime64[D]'), chunk_size)
+    return ids, days
+
+
+def load_items(orders, first=None, last=None, chunk_size=LOAD_CHUNK_SIZE):
+    """Line items of ``orders``, loaded for the same days, as columns."""
+    rows = (
+        _placed_between(OrderItem.objects.order_by(), first, last, prefix='order__')
+        .annotate(cents=_cents(LINE_TOTAL))
+        .values_list('order_id', 'product_id', 'quantity', 'cents')
+        .iterator(chunk_size=chunk_size)
+    )
+    order_ids, product_ids, quantities, totals = _stream(
+        rows, (np.int32, np.int32, np.int32, np.int64), chunk_size
+    )
+    # drop items of orders placed after the orders were loaded
+    positions = np.searchsorted(orders.ids, order_ids)
+    positions[positions == len(orders)] = 0
+    keep = (orders.ids[positions] == order_ids) if len(orders) else np.zeros(len(order_ids), dtype=bool)
+    return ItemColumns(positions[keep].astype(np.int32), product_ids[keep], quantities[keep], totals[keep])
+
+
+def _sum_by(keys, *weights):
+    """Unique ``keys`` and the per-key sums of each of ``weights``."""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    sums = [np.bincount(inverse, weights=weight, minlength=len(unique)) for weight in weights]
+    return unique, [np.rint(total).astype(np.int64) for total in sums]
+
+
+def sales_by_day(orders, items):
+    """``(days, order counts, items sold, revenue in cents)`` for every day with orders."""
+    days, (counts, revenue) = _sum_by(orders.days, np.ones(len(orders)), orders.totals)
+    sold = np.zeros(len(days), dtype=np.int64)
+    if len(items):
+        day_of_item = np.searchsorted(days, orders.days[items.orders])
+        sold = np.rint(np.bincount(day_of_item, weights=items.quantities, minlength=len(days))).astype(np.int64)
+    return days, counts, sold, revenue
+
+
+def _top(keys, limit, *weights):
+    unique, sums = _sum_by(keys, *weights)
+    revenue = sums[-1]
+    # highest revenue first, ties by ascending id
+    order = np.lexsort((unique, -revenue))[:limit]
+    return (unique[order], *(total[order] for total in sums))
+
+
+def top_products(items, limit=10):
+    """``(product ids, order counts, quantities, revenue in cents)`` by revenue."""
+    return _top(items.product_ids, limit, np.ones(len(items)), items.quantities, items.totals)
+
+
+def top_customers(orders, limit=10):
+    """``(customer ids, order counts, revenue in cents)`` by revenue."""
+    return _top(orders.customer_ids, limit, np.ones(len(orders)), orders.totals)
+
+
+def order_value_percentiles(orders, percentiles=(50, 90, 99)):
+    """Order totals in cents at ``percentiles``, taking the lower of two ranks."""
+    if not len(orders):
+        return np.zeros(len(percentiles), dtype=np.int64)
+    return np.percentile(orders.totals, percentiles, method='lower').astype(np.int64)
+
+
+def cohort_retention(orders, first_orders=None):
+    """Monthly retention of customers grouped by the month of their first order.
+
+    Returns ``(cohorts, sizes, retention)``: the cohort months, the number
+    of customers in each and a ``cohorts x months`` array with the share
+    of each cohort ordering again ``n`` months after its first month.
+    ``orders`` may cover only part of the history; with ``first_orders``
+    from ``first_order_days``, customers whose first order comes before
+    the loaded ones are left out instead of starting a cohort late.
+    """
+    if first_orders is not None and len(orders):
+        customers, inverse = np.unique(orders.customer_ids, return_inverse=True)
+        loaded = np.full(len(customers), orders.days.max())
+        np.minimum.at(loaded, inverse, orders.days)
+        ids, days = first_orders
+        new = (days[np.searchsorted(ids, customers)] >= loaded)[inverse]
+        orders = OrderColumns(orders.ids[new], orders.days[new], orders.customer_ids[new], orders.totals[new])
+    if not len(orders):
+        return np.empty(0, dtype='datetime64[M]'), np.empty(0, dtype=np.int64), np.empty((0, 0))
+    # months since the epoch
+    months = orders.days.astype('datetime64[M]').astype(np.int64)
+    customers, inverse = np.unique(orders.customer_ids, return_inverse=True)
+    first = np.full(len(customers), months.max())
+    np.minimum.at(first, inverse, months)
+    offsets = months - first[inverse]
+    span = int(offsets.max()) + 1
+    # one entry per customer and active month
+    active = np.unique(inverse.astype(np.int64) * span + offsets)
+    active_customers, active_offsets = np.divmod(active, span)
+    cohorts, cohort_of = np.unique(first, return_inverse=True)
+    counts = np.zeros((len(cohorts), span), dtype=np.int64)
+    np.add.at(counts, (cohort_of[active_customers], active_offsets), 1)
+    sizes = counts[:, 0]
+    return cohorts.astype('datetime64[M]'), sizes, counts / sizes[:, None]
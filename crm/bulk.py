@@ -0,0 +1,179 @@
+from collections import Counter
+from django.core.exceptions import ValidationError
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+from .aggregates import refresh_customer_aggregates
+from .inventory import InsufficientStock, order_quantities, reserve_stock
+from .models import Customer, Product, Order, OrderItem
+from .response_cache import invalidate_models
+from .rollups import record_new_orders
+
+BULK_BATCH_SIZE = 1000
+
+DUPLICATE_EMAIL = ValidationError({'email': ['Customer with this Email already exists.']})
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _validate_customer(data):
+    """Run the model's field and ``clean`` validation without touching the database."""
+    customer = Customer(name=data.name, email=data.email, phone=data.phone or '')
+    customer.clean_fields()
+    customer.clean()
+    return customer
+
+
+def bulk_create_customers(rows, batch_size=BULK_BATCH_SIZE):
+    """Validate and insert ``rows`` set-wise.
+
+    Formats are checked in memory, duplicates are found with one ``email__in``
+    query per chunk and the survivors are written with ``bulk_create``.
+    Returns ``(customers, errors)`` where ``errors`` is a list of
+    ``(index, message)`` pairs referring to positions in ``rows``.
+    """
+    errors = []
+    candidates = []
+    seen_emails = set()
+    for index, data in enumerate(rows):
+        try:
+            customer = _validate_customer(data)
+        except ValidationError as e:
+            errors.append((index, str(e)))
+            continue
+        if customer.email in seen_emails:
+            errors.append((index, str(DUPLICATE_EMAIL)))
+            continue
+        seen_emails.add(customer.email)
+        candidates.append((index, customer))
+
+    created = []
+    for chunk in _chunks(candidates, batch_size):
+        existing = set(
+            Customer.objects.filter(email__in=[customer.email for _, customer in chunk])
+            .values_list('email', flat=True)
+        )
+        fresh = []
+        for index, customer in chunk:
+            if customer.email in existing:
+                errors.append((index, str(DUPLICATE_EMAIL)))
+            else:
+                fresh.append((index, customer))
+        try:
+            with transaction.atomic():
+                created.extend(Customer.objects.bulk_create([customer for _, customer in fresh]))
+        except IntegrityError:
+            # a concurrent writer claimed one of the emails; retry row by row
+            for index, customer in fresh:
+                try:
+                    with transaction.atomic():
+                        customer.save()
+                    created.append(customer)
+                except IntegrityError as e:
+                    errors.append((index, str(e)))
+
+    if created:
+        # bulk_create sends no post_save
+        invalidate_models(Customer)
+    errors.sort()
+    return created, errors
+
+
+def _parse_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def bulk_create_orders(rows):
+    """Create many orders with a constant number of queries.
+
+    Every referenced customer and product is resolved with one query each,
+    line items are priced and totals summed from the prices already loaded,
+    and the orders and their items are written with one ``bulk_create`` each.
+    Stock for the whole batch is reserved with one conditional ``UPDATE``;
+    if that falls short, orders reserve one at a time in input order and
+    those that cannot be covered are reported as errors.
+    Returns ``(orders, errors)`` like ``bulk_create_customers``.
+    """
+    errors = []
+    parsed = []
+    for index, row in enumerate(rows):
+        try:
+            quantities = order_quantities(row)
+        except ValueError as e:
+            errors.append((index, str(e)))
+            continue
+        if not quantities:
+            errors.append((index, "At least one product is required"))
+            continue
+        parsed.append((index, row, quantities))
+
+    customer_ids = {_parse_id(row.customer_id) for _, row, _ in parsed}
+    product_ids = {pid for _, _, quantities in parsed for pid in quantities}
+    customer_ids.discard(None)
+    known_customers = set(Customer.objects.filter(pk__in=customer_ids).values_list('pk', flat=True))
+    prices = dict(Product.objects.filter(pk__in=product_ids).values_list('pk', 'price'))
+
+    pending = []
+    for index, row, quantities in parsed:
+        customer_id = _parse_id(row.customer_id)
+        if customer_id not in known_customers:
+            errors.append((index, "Invalid customer ID"))
+            continue
+        if any(pid not in prices for pid in quantities):
+            errors.append((index, "One or more invalid product IDs"))
+            continue
+        order = Order(
+            customer_id=customer_id,
+            order_date=row.order_date or timezone.now(),
+            total_amount=sum(prices[pid] * quantity for pid, quantity in quantities.items())
+        )
+        pending.append((index, order, quantities))
+
+    orders = []
+    if pending:
+        with transaction.atomic():
+            pending = _reserve_stock(pending, errors)
+            orders = [order for _, order, _ in pending]
+            if orders:
+                Order.objects.bulk_create(orders)
+                placed = [
+                    (order, [
+                        OrderItem(order_id=order.pk, product_id=pid, quantity=quantity, unit_price=prices[pid])
+                        for pid, quantity in quantities.items()
+                    ])
+                    for _, order, quantities in pending
+                ]
+                OrderItem.objects.bulk_create(item for _, items in placed for item in items)
+                # bulk_create bypasses the post_save aggregate updates
+                refresh_customer_aggregates({order.customer_id for order in orders})
+                record_new_orders(placed)
+        invalidate_models(Order, OrderItem, Product, Customer)
+    errors.sort()
+    return orders, errors
+
+
+def _reserve_stock(pending, errors):
+    """Reserve stock for ``(index, order, quantities)`` rows; return the covered ones."""
+    demand = Counter()
+    for _, _, quantities in pending:
+        demand.update(quantities)
+    try:
+        with transaction.atomic():
+            reserve_stock(dict(demand))
+        return pending
+    except InsufficientStock:
+        pass
+    covered = []
+    for index, order, quantities in pending:
+        try:
+            with transaction.atomic():
+                reserve_stock(quantities)
+            covered.append((index, order, quantities))
+        except InsufficientStock:
+            errors.append((index, "Insufficient stock"))
+    return covered
@@ -0,0 +1,88 @@
+"""Batched deletion of inactive customers.
+
+``Customer.objects.filter(...).delete()`` makes Django's collector load
+every matching customer, order and order-product link into memory and
+send a signal per row, all inside one long transaction. Here customers
+are deleted in primary-key ordered batches, each in its own short
+transaction, with plain ``DELETE ... WHERE ... IN`` statements for their
+order-product links, orders and finally the customers themselves. The
+sales rollups of the days their orders fell on are recomputed after each
+batch commits, outside its locks.
+"""
+import logging
+import time
+from datetime import timedelta
+from django.db import router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Customer, DailyCustomerSales, Product, Order, OrderItem
+from .response_cache import invalidate_models
+from .rollups import refresh_rollups
+
+logger = logging.getLogger('crm.cleanup')
+
+CLEANUP_BATCH_SIZE = 500
+
+
+def inactive_customers(days=365, include_never_ordered=False, now=None):
+    """Customers whose last order is older than ``days``.
+
+    Customers who never ordered are only included, once they are ``days``
+    old, with ``include_never_ordered``.
+    """
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    condition = Q(last_order_date__lt=cutoff)
+    if include_never_ordered:
+        condition |= Q(last_order_date__isnull=True, created_at__lt=cutoff)
+    return Customer.objects.filter(condition)
+
+
+def _delete_batch(customer_ids):
+    using = router.db_for_write(Customer)
+    orders = Order.objects.using(using).filter(customer_id__in=customer_ids)
+    days = list(orders.dates('order_date', 'day'))
+    # _raw_delete skips the collector and the per-row signals; the caches
+    # are invalidated by the caller
+    OrderItem.objects.using(using).filter(order__in=orders.values('pk'))._raw_delete(using)
+    orders._raw_delete(using)
+    DailyCustomerSales.objects.using(using).filter(customer_id__in=customer_ids)._raw_delete(using)
+    deleted = Customer.objects.using(using).filter(pk__in=customer_ids)._raw_delete(using)
+    return deleted, days
+
+
+def delete_inactive_customers(days=365, batch_size=CLEANUP_BATCH_SIZE, sleep=0.0,
+                              include_never_ordered=False, dry_run=False, progress=None):
+    """Delete inactive customers and their orders in bounded batches.
+
+    Every batch re-selects up to ``batch_size`` matching ids after the last
+    one deleted and locks them, so a customer who orders in the meantime is
+    skipped. ``sleep`` seconds pass between batches to let other writers
+    in. Returns the number of customers deleted (or matching, with
+    ``dry_run``); ``progress`` is called with the running total.
+    """
+    queryset = inactive_customers(days, include_never_ordered)
+    if dry_run:
+        return queryset.count()
+
+    deleted = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic(using=router.db_for_write(Customer)):
+            ids = list(
+                queryset.select_for_update().filter(pk__gt=last_pk)
+                .order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            count, days = _delete_batch(ids)
+            deleted += count
+            invalidate_models(Customer, Order, Product)
+        # recomputing whole days would hold the batch's write lock for long
+        refresh_rollups(days)
+        last_pk = ids[-1]
+        logger.info("Deleted %d inactive customers (up to id %d)", deleted, last_pk)
+        if progress is not None:
+            progress(deleted)
+        if sleep:
+            time.sleep(sleep)
+    return deleted
@@ -0,0 +1,119 @@
+"""Static cost estimate for GraphQL operations, checked before execution.
+
+Every field that returns an object costs ``FieldCost.cost`` (1 by default)
+and multiplies the cost of its selection by the number of items it can
+return: ``first``/``last`` for connections (the relay max limit when
+absent) and ``FieldCost.list_size`` for plain lists. Scalars are free.
+Object types tune this per field with a ``field_costs`` mapping.
+
+``CRM_QUERY_COST_LIMIT`` and ``CRM_QUERY_DEPTH_LIMIT`` bound the estimate
+and the nesting depth of field selections; ``None`` disables either check.
+"""
+from collections import namedtuple
+from django.conf import settings
+from graphene.utils.str_converters import to_snake_case
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode, FragmentDefinitionNode, FragmentSpreadNode, GraphQLError, InlineFragmentNode,
+    get_named_type, get_nullable_type, get_operation_ast, is_list_type,
+)
+from graphql.execution.values import get_argument_values
+
+FieldCost = namedtuple('FieldCost', ['cost', 'list_size'], defaults=[1, None])
+
+DEFAULT_LIST_SIZE = 10
+
+
+def _is_connection(graphql_type):
+    fields = getattr(graphql_type, 'fields', {})
+    return 'edges' in fields and 'pageInfo' in fields
+
+
+def _field_hint(parent_type, field_name):
+    graphene_type = getattr(parent_type, 'graphene_type', None)
+    return getattr(graphene_type, 'field_costs', {}).get(to_snake_case(field_name))
+
+
+class CostEstimator:
+    def __init__(self, schema, document, variables=None):
+        self.schema = schema
+        self.variables = variables or {}
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if isinstance(definition, FragmentDefinitionNode)
+        }
+        self.default_page_size = graphene_settings.RELAY_CONNECTION_MAX_LIMIT or DEFAULT_LIST_SIZE
+        self.depth = 0
+
+    def selection_cost(self, selection_set, parent_type, depth=1):
+        self.depth = max(self.depth, depth)
+        total = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                total += self.field_cost(selection, parent_type, depth)
+            elif isinstance(selection, InlineFragmentNode):
+                condition = selection.type_condition
+                fragment_type = self.schema.get_type(condition.name.value) if condition else parent_type
+                total += self.selection_cost(selection.selection_set, fragment_type, depth)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = self.fragments[selection.name.value]
+                fragment_type = self.schema.get_type(fragment.type_condition.name.value)
+                total += self.selection_cost(fragment.selection_set, fragment_type, depth)
+        return total
+
+    def field_cost(self, node, parent_type, depth=1):
+        name = node.name.value
+        field_def = getattr(parent_type, 'fields', {}).get(name)
+        if field_def is None or node.selection_set is None:
+            return 0
+        hint = _field_hint(parent_type, name) or FieldCost()
+        field_type = field_def.type
+        named_type = get_named_type(field_type)
+        child_cost = self.selection_cost(node.selection_set, named_type, depth + 1)
+
+        if _is_connection(named_type):
+            try:
+                args = get_argument_values(field_def, node, self.variables)
+            except GraphQLError:
+                # bad variables are reported by the executor
+                args = {}
+            size = args.get('first') or args.get('last') or hint.list_size or self.default_page_size
+            # negative sizes fail at execution; they must not offset siblings
+            size = max(size, 0)
+        elif is_list_type(get_nullable_type(field_type)) and not _is_connection(parent_type):
+            # a connection's edges are already multiplied by its page size
+            size = hint.list_size or DEFAULT_LIST_SIZE
+        else:
+            size = 1
+        return hint.cost + size * child_cost
+
+
+def estimate_cost(schema, document, operation_name=None, variables=None):
+    """Return ``(cost, depth)`` of the selected operation."""
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return 0, 0
+    root_type = schema.get_root_type(operation.operation)
+    estimator = CostEstimator(schema, document, variables)
+    cost = estimator.selection_cost(operation.selection_set, root_type)
+    return cost, estimator.depth
+
+
+def check_cost(schema, document, operation_name=None, variables=None):
+    """Return ``(extensions, error)``; ``error`` is set when a limit is exceeded."""
+    limit = getattr(settings, 'CRM_QUERY_COST_LIMIT', None)
+    depth_limit = getattr(settings, 'CRM_QUERY_DEPTH_LIMIT', None)
+    cost, depth = estimate_cost(schema, document, operation_name, variables)
+    extensions = {'cost': {'requested': cost, 'limit': limit, 'depth': depth}}
+    if depth_limit is not None and depth > depth_limit:
+        return extensions, GraphQLError(
+            f"Query depth {depth} exceeds the limit of {depth_limit}",
+            extensions={'code': 'QUERY_TOO_DEEP', 'depth': depth, 'limit': depth_limit},
+        )
+    if limit is not None and cost > limit:
+        return extensions, GraphQLError(
+            f"Query cost {cost} exceeds the limit of {limit}",
+            extensions={'code': 'QUERY_TOO_COSTLY', 'cost': cost, 'limit': limit},
+        )
+    return extensions, None
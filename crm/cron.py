@@ -1,7 +1,8 @@
-from gql import gql, Client
-from gql.transport.aiohttp import AIOHTTPTransport
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
+from django.utils import timezone
+from .jobs import get_executor, job
+from .models import JobCheckpoint
 
 # Configure logging for heartbeat
 logging.basicConfig(
@@ -18,56 +19,118 @@ low_stock_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s', da
 low_stock_logger.addHandler(low_stock_handler)
 low_stock_logger.setLevel(logging.INFO)
 
-async def query_graphql_hello():
-    """Query the GraphQL hello field to verify endpoint responsiveness."""
-    transport = AIOHTTPTransport(url="http://localhost:8000/graphql")
-    client = Client(transport=transport, fetch_schema_from_transport=True)
-    query = gql("""
-        query {
-            hello
+# Configure logging for order reminders
+reminder_logger = logging.getLogger('order_reminders')
+reminder_handler = logging.FileHandler('/tmp/order_reminders_log.txt')
+reminder_handler.setFormatter(logging.Formatter('%(asctime)s - Order ID: %(message)s'))
+reminder_logger.addHandler(reminder_handler)
+reminder_logger.setLevel(logging.INFO)
+reminder_logger.propagate = False
+
+HELLO_QUERY = """
+    query {
+        hello
+    }
+"""
+
+LOW_STOCK_MUTATION = """
+    mutation ($after: ID) {
+        updateLowStockProducts(after: $after) {
+            updatedCount
+            updatedProducts {
+                name
+                stock
+            }
+            endCursor
+            hasNextPage
+        }
+    }
+"""
+
+NEW_ORDERS_QUERY = """
+    query ($since: DateTime, $until: DateTime, $first: Int, $after: String) {
+        allOrders(orderDate_Gte: $since, orderDate_Lte: $until, first: $first, after: $after) {
+            edges {
+                cursor
+                node {
+                    id
+                    customer {
+                        email
+                    }
+                }
+            }
+            pageInfo {
+                hasNextPage
+                endCursor
+            }
         }
-    """)
-    async with client as session:
-        result = await session.execute(query)
-        return result.get('hello', 'No response')
+    }
+"""
 
+REMINDER_WINDOW = timedelta(days=7)
+# orders committed late with an earlier order_date than the newest one seen
+# would fall behind the high-water mark; leave the last minute for next run
+REMINDER_LAG = timedelta(minutes=1)
+REMINDER_BATCH_SIZE = 100
+
+@job('heartbeat')
 def log_crm_heartbeat():
-    """Log a heartbeat message and verify GraphQL endpoint."""
-    import asyncio
+    """Log a heartbeat message and verify the GraphQL schema responds."""
     timestamp = datetime.now().strftime('%d/%m/%Y-%H:%M:%S')
     try:
-        hello_response = asyncio.run(query_graphql_hello())
+        hello_response = get_executor().execute(HELLO_QUERY)['hello']
         message = f"{timestamp} CRM is alive - GraphQL hello: {hello_response}"
     except Exception as e:
         message = f"{timestamp} CRM is alive - GraphQL error: {str(e)}"
     logging.info(message)
 
-async def update_low_stock_products():
-    """Execute GraphQL mutation to update low-stock products."""
-    transport = AIOHTTPTransport(url="http://localhost:8000/graphql")
-    client = Client(transport=transport, fetch_schema_from_transport=True)
-    mutation = gql("""
-        mutation {
-            updateLowStockProducts {
-                successMessage
-                updatedProducts {
-                    name
-                    stock
-                }
-            }
-        }
-    """)
-    async with client as session:
-        result = await session.execute(mutation)
-        return result['updateLowStockProducts']
-
+@job('update_low_stock')
 def update_low_stock():
-    """Run the low-stock update mutation and log results."""
-    import asyncio
+    """Run the low-stock update mutation page by page and log results."""
     try:
-        result = asyncio.run(update_low_stock_products())
-        for product in result['updatedProducts']:
-            low_stock_logger.info(f"Updated {product['name']} to stock: {product['stock']}")
-        low_stock_logger.info(result['successMessage'])
+        executor = get_executor()
+        variables = {'after': None}
+        updated = 0
+        while True:
+            result = executor.execute(LOW_STOCK_MUTATION, variables)['updateLowStockProducts']
+            for product in result['updatedProducts']:
+                low_stock_logger.info(f"Updated {product['name']} to stock: {product['stock']}")
+            updated += result['updatedCount']
+            if not result['hasNextPage']:
+                break
+            variables['after'] = result['endCursor']
+        low_stock_logger.info(f"Updated {updated} low-stock products")
     except Exception as e:
-        low_stock_logger.error(f"Error updating low-stock products: {str(e)}")
\ No newline at end of file
+        low_stock_logger.error(f"Error updating low-stock products: {str(e)}")
+
+@job('send_order_reminders')
+def send_order_reminders(batch_size=REMINDER_BATCH_SIZE):
+    """Log a reminder for every order placed since the previous run.
+
+    Orders are paged by their ``(order_date, id)`` keyset cursor and the
+    cursor of the last logged order is kept as the job's high-water mark,
+    so each order is logged once and a run only reads new orders. The first
+    run starts ``REMINDER_WINDOW`` back.
+    """
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name='send_order_reminders')
+    now = timezone.now()
+    variables = {
+        'since': (now - REMINDER_WINDOW).isoformat(),
+        'until': (now - REMINDER_LAG).isoformat(),
+        'first': batch_size,
+        'after': checkpoint.cursor or None,
+    }
+    executor = get_executor()
+    sent = 0
+    while True:
+        page = executor.execute(NEW_ORDERS_QUERY, variables)['allOrders']
+        for edge in page['edges']:
+            order = edge['node']
+            reminder_logger.info(f"{order['id']} - Customer Email: {order['customer']['email']}")
+        if page['edges']:
+            checkpoint.cursor = page['edges'][-1]['cursor']
+            checkpoint.save(update_fields=['cursor', 'updated_at'])
+            sent += len(page['edges'])
+        if not page['pageInfo']['hasNextPage']:
+            return sent
+        variables['after'] = page['pageInfo']['endCursor']
@@ -3,8 +3,8 @@
 # Get current timestamp
 TIMESTAMP=$(date '+%Y-%m-%d %H:%M:%S')
 
-# Run Django command to delete inactive customers and capture count
-DELETED_COUNT=$(python manage.py shell -c "from django.utils import timezone; from datetime import timedelta; from crm.models import Customer; count = Customer.objects.filter(last_order_date__lt=timezone.now() - timedelta(days=365)).delete()[0]; print(count)")
+# Delete inactive customers in batches and capture the count
+DELETED_COUNT=$(python manage.py clean_inactive_customers --days 365 --batch-size 500 --sleep 0.1 2>>/tmp/customer_cleanup_log.txt)
 
 # Log the result with timestamp
 echo "[$TIMESTAMP] Deleted $DELETED_COUNT inactive customers" >> /tmp/customer_cleanup_log.txt
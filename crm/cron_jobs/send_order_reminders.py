@@ -1,39 +1,16 @@
-from gql import gql, Client
-from gql.transport.aiohttp import AIOHTTPTransport
-from datetime import datetime, timedelta
-import logging
+import os
+import sys
 
-# Set up logging to /tmp/order_reminders_log.txt
-logging.basicConfig(
-    filename='/tmp/order_reminders_log.txt',
-    level=logging.INFO,
-    format='%(asctime)s - Order ID: %(message)s'
-)
+# Run the reminder job in-process instead of querying the web server
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_backend_graphql_crm.settings')
 
-# Set up GraphQL client
-transport = AIOHTTPTransport(url="http://localhost:8000/graphql")
-client = Client(transport=transport, fetch_schema_from_transport=True)
+import django
 
-# Define GraphQL query for orders within the last 7 days
-query = gql("""
-    query {
-        orders(orderDate_Gte: "%s") {
-            id
-            customer {
-                email
-            }
-        }
-    }
-""" % (datetime.now() - timedelta(days=7)).isoformat())
+django.setup()
 
-# Execute query and log results
-async def main():
-    async with client as session:
-        result = await session.execute(query)
-        for order in result['orders']:
-            logging.info(f"{order['id']} - Customer Email: {order['customer']['email']}")
-    print("Order reminders processed!")
+from crm.cron import send_order_reminders
 
-# Run the async function
-import asyncio
-asyncio.run(main())
\ No newline at end of file
+send_order_reminders()
+print("Order reminders processed!")
@@ -0,0 +1,135 @@
+"""Parsed-document cache and persisted-query (APQ) store for the GraphQL view."""
+import hashlib
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from graphql import parse
+from graphql.error import GraphQLError
+from graphql.validation import validate
+from graphene_django.settings import graphene_settings
+from .tracing import metrics
+
+PERSISTED_QUERY_PREFIX = 'crm:apq:'
+
+
+class LRUCache:
+    """Small thread-safe LRU mapping with hit/miss/eviction counters.
+
+    With a ``metric`` prefix the counters are also published in the
+    ``/metrics/`` counters as ``<metric>_hits_total`` and so on.
+    """
+
+    def __init__(self, maxsize, metric=None):
+        self.maxsize = maxsize
+        self.metric = metric
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def _publish(self, event, count=1):
+        if self.metric is not None and count:
+            metrics.inc(f'{self.metric}_{event}_total', count)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                self._publish('misses')
+                return default
+            self.hits += 1
+            self._publish('hits')
+            return self._data[key]
+
+    def set(self, key, value):
+        """Store ``value`` under ``key``; returns the number of entries evicted."""
+        evicted = 0
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+            self._publish('evictions', evicted)
+        return evicted
+
+    def pop(self, key):
+        with self._lock:
+            return self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+
+document_cache = LRUCache(getattr(settings, 'CRM_DOCUMENT_CACHE_SIZE', 512), metric='crm_document_cache')
+
+
+def get_document(schema, query, validation_rules=None):
+    """Return ``(document, errors)`` for ``query``, parsing and validating it at most once."""
+    key = (query, tuple(validation_rules or ()))
+    cached = document_cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        document = parse(query)
+    except GraphQLError as e:
+        # syntax errors are cheap to reproduce and not worth a cache slot
+        return None, [e]
+    errors = validate(schema, document, validation_rules, graphene_settings.MAX_VALIDATION_ERRORS)
+    document_cache.set(key, (document, errors))
+    return document, errors
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+def _persisted_store():
+    return caches[getattr(settings, 'CRM_PERSISTED_QUERY_CACHE', 'default')]
+
+
+def resolve_persisted_query(query, extensions):
+    """Apply the APQ protocol to a request.
+
+    Returns ``(query, error)``. A request carrying only a known hash gets its
+    stored document back; a request with both a document and its hash
+    registers the document for later hash-only calls.
+    """
+    persisted = (extensions or {}).get('persistedQuery')
+    if not persisted:
+        return query, None
+    if persisted.get('version') != 1:
+        return None, GraphQLError('Unsupported persisted query version', extensions={'code': 'PERSISTED_QUERY_NOT_SUPPORTED'})
+    sha256 = persisted.get('sha256Hash')
+    store = _persisted_store()
+    if query:
+        if query_hash(query) != sha256:
+            return None, GraphQLError('provided sha does not match query', extensions={'code': 'PERSISTED_QUERY_HASH_MISMATCH'})
+        store.set(PERSISTED_QUERY_PREFIX + sha256, query, None)
+        metrics.inc('crm_persisted_query_registrations_total')
+        return query, None
+    query = store.get(PERSISTED_QUERY_PREFIX + str(sha256))
+    if query is None:
+        metrics.inc('crm_persisted_query_misses_total')
+        return None, GraphQLError('PersistedQueryNotFound', extensions={'code': 'PERSISTED_QUERY_NOT_FOUND'})
+    metrics.inc('crm_persisted_query_hits_total')
+    return query, None
@@ -0,0 +1,191 @@
+import base64
+import json
+from decimal import Decimal
+import graphene
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from graphene.relay import PageInfo
+from graphene_django.filter import DjangoFilterConnectionField
+from graphql import GraphQLError
+from .loaders import get_loaders, is_async
+from .optimizer import selection_tree
+
+DEFAULT_PAGE_SIZE = 100
+
+
+class KeysetConnection(graphene.relay.Connection):
+    """Connection paged by value instead of offset.
+
+    Cursors encode the ``(order key, id)`` of an edge and the next page is
+    found with ``WHERE (key, id) > cursor``, so page N costs the same as page
+    1. ``totalCount`` runs a ``COUNT(*)`` only when it is selected.
+    The node type names its default order key with a ``keyset_key``
+    attribute; an ``orderBy`` argument on a single non-null field replaces it.
+    """
+
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int()
+
+    def resolve_total_count(self, info):
+        if is_async(info):
+            return self.iterable.acount()
+        return self.iterable.count()
+
+
+def encode_cursor(value, pk):
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    elif isinstance(value, Decimal):
+        value = str(value)
+    return base64.urlsafe_b64encode(json.dumps([value, pk]).encode()).decode()
+
+
+def decode_cursor(cursor, field):
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return field.to_python(value), int(pk)
+    except (ValueError, TypeError, ValidationError):
+        raise GraphQLError(f"Invalid cursor: {cursor}")
+
+
+def keyset_order(node_type, args):
+    """Return the ``(field name, descending)`` the page is ordered by."""
+    ordering = args.get('order_by')
+    if ordering:
+        name = ordering.split(',')[0].strip()
+        return name.lstrip('-'), name.startswith('-')
+    return getattr(node_type, 'keyset_key', 'id'), False
+
+
+def _seek(queryset, key, lookup, cursor):
+    value, pk = cursor
+    if key == 'id':
+        return queryset.filter(**{f'id__{lookup}': pk})
+    return queryset.filter(Q(**{f'{key}__{lookup}': value}) | Q(**{key: value, f'id__{lookup}': pk}))
+
+
+class KeysetPage:
+    """The seek query for one keyset page and the connection built from its rows."""
+
+    def __init__(self, connection, args, iterable, max_limit):
+        node_type = connection._meta.node
+        self.connection = connection
+        self.iterable = iterable
+        key, descending = keyset_order(node_type, args)
+        field = node_type._meta.model._meta.get_field(key)
+        self.first, self.last = args.get('first'), args.get('last')
+        self.after, self.before = args.get('after'), args.get('before')
+        if self.first is None and self.last is None:
+            self.first = max_limit or DEFAULT_PAGE_SIZE
+
+        queryset = iterable.annotate(keyset_value=F(key))
+        after, before = ('lt', 'gt') if descending else ('gt', 'lt')
+        if self.after:
+            queryset = _seek(queryset, key, after, decode_cursor(self.after, field))
+        if self.before:
+            queryset = _seek(queryset, key, before, decode_cursor(self.before, field))
+        ordering = [f'-{key}', '-id'] if descending else [key, 'id']
+        self.forward = self.first is not None
+        if self.forward:
+            self.queryset = queryset.order_by(*ordering)[:self.first + 1]
+        else:
+            reverse = [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+            self.queryset = queryset.order_by(*reverse)[:self.last + 1]
+
+    def build(self, rows):
+        first, last = self.first, self.last
+        if self.forward:
+            has_next = len(rows) > first
+            rows = rows[:first]
+            has_previous = bool(self.after)
+            if last is not None:
+                has_previous = has_previous or len(rows) > last
+                rows = rows[-last:] if last else []
+        else:
+            has_previous = len(rows) > last
+            rows = rows[:last][::-1]
+            has_next = bool(self.before)
+
+        connection = self.connection
+        edges = [connection.Edge(node=row, cursor=encode_cursor(row.keyset_value, row.pk)) for row in rows]
+        result = connection(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=has_previous,
+                has_next_page=has_next,
+            ),
+        )
+        result.iterable = self.iterable
+        return result
+
+
+def _uses_keyset(connection, args, iterable):
+    # offset paging, ranked search results and orderings on several or
+    # nullable fields keep the offset-based cursors
+    if not issubclass(connection, KeysetConnection) or args.get('offset'):
+        return False
+    if 'search_rank' in iterable.query.extra_select or 'search_rank' in iterable.query.annotations:
+        return False
+    ordering = args.get('order_by')
+    if ordering:
+        key, _ = keyset_order(connection._meta.node, args)
+        return ',' not in ordering and not iterable.model._meta.get_field(key).null
+    return True
+
+
+class CRMFilterConnectionField(DjangoFilterConnectionField):
+    """Filter connection that hands each resolved page to the request loaders."""
+
+    @classmethod
+    def connection_resolver(cls, resolver, connection, default_manager, queryset_resolver,
+                            max_limit, enforce_first_or_last, root, info, **args):
+        if is_async(info):
+            return cls.aconnection_resolver(
+                resolver, connection, default_manager, queryset_resolver,
+                max_limit, enforce_first_or_last, root, info, **args
+            )
+        result = super().connection_resolver(
+            resolver, connection, default_manager, queryset_resolver,
+            max_limit, enforce_first_or_last, root, info, **args
+        )
+        get_loaders(info).prime((edge.node for edge in result.edges), selection_tree(info))
+        return result
+
+    @classmethod
+    async def aconnection_resolver(cls, resolver, connection, default_manager, queryset_resolver,
+                                   max_limit, enforce_first_or_last, root, info, **args):
+        # reuse graphene-django's argument checks with a class whose
+        # resolve_connection returns a coroutine
+        result = await DjangoFilterConnectionField.connection_resolver.__func__(
+            _AsyncResolution, resolver, connection, default_manager, queryset_resolver,
+            max_limit, enforce_first_or_last, root, info, **args
+        )
+        get_loaders(info).prime((edge.node for edge in result.edges), selection_tree(info))
+        return result
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        if not _uses_keyset(connection, args, iterable):
+            return super().resolve_connection(connection, args, iterable, max_limit=max_limit)
+        page = KeysetPage(connection, args, iterable, max_limit)
+        return page.build(list(page.queryset))
+
+    @classmethod
+    async def aresolve_connection(cls, connection, args, iterable, max_limit=None):
+        if not _uses_keyset(connection, args, iterable):
+            return await sync_to_async(DjangoFilterConnectionField.resolve_connection)(
+                connection, args, iterable, max_limit=max_limit
+            )
+        page = KeysetPage(connection, args, iterable, max_limit)
+        return page.build([row async for row in page.queryset])
+
+
+class _AsyncResolution(CRMFilterConnectionField):
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        return CRMFilterConnectionField.aresolve_connection(connection, args, iterable, max_limit)
@@ -1,19 +1,39 @@
 # crm/filters.py
 import django_filters
 from django_filters import CharFilter, NumberFilter, DateTimeFilter, IsoDateTimeFilter
+from django_filters.constants import EMPTY_VALUES
 from .models import Customer, Product, Order
 from django.db.models import Q
+from .search import get_search_backend
+
+
+class SearchFilter(CharFilter):
+    """Substring filter served by the configured search backend."""
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        return get_search_backend().filter(qs, self.field_name, value)
 
 class CustomerFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(lookup_expr='icontains')
-    email = django_filters.CharFilter(lookup_expr='icontains')
+    name = SearchFilter()
+    email = SearchFilter()
     created_at__gte = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='gte')
     created_at__lte = django_filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='lte')
     phone_pattern = django_filters.CharFilter(method='filter_phone_pattern')
+    last_order_date__gte = django_filters.IsoDateTimeFilter(field_name='last_order_date', lookup_expr='gte')
+    last_order_date__lte = django_filters.IsoDateTimeFilter(field_name='last_order_date', lookup_expr='lte')
+    order_count__gte = django_filters.NumberFilter(field_name='order_count', lookup_expr='gte')
+    order_count__lte = django_filters.NumberFilter(field_name='order_count', lookup_expr='lte')
+    total_spend__gte = django_filters.NumberFilter(field_name='total_spend', lookup_expr='gte')
+    total_spend__lte = django_filters.NumberFilter(field_name='total_spend', lookup_expr='lte')
+    order_by = django_filters.OrderingFilter(fields=('created_at', 'last_order_date', 'order_count', 'total_spend'))
     
     class Meta:
         model = Customer
-        fields = ['name', 'email', 'created_at__gte', 'created_at__lte', 'phone_pattern']
+        fields = ['name', 'email', 'created_at__gte', 'created_at__lte', 'phone_pattern',
+                 'last_order_date__gte', 'last_order_date__lte', 'order_count__gte', 'order_count__lte',
+                 'total_spend__gte', 'total_spend__lte', 'order_by']
     
     def filter_phone_pattern(self, queryset, name, value):
         if value.startswith('+1'):
@@ -21,7 +41,7 @@ class CustomerFilter(django_filters.FilterSet):
         return queryset
 
 class ProductFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(lookup_expr='icontains')
+    name = SearchFilter()
     price__gte = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
     price__lte = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
     stock__gte = django_filters.NumberFilter(field_name='stock', lookup_expr='gte')
@@ -42,8 +62,8 @@ class OrderFilter(django_filters.FilterSet):
     total_amount__lte = django_filters.NumberFilter(field_name='total_amount', lookup_expr='lte')
     order_date__gte = django_filters.IsoDateTimeFilter(field_name='order_date', lookup_expr='gte')
     order_date__lte = django_filters.IsoDateTimeFilter(field_name='order_date', lookup_expr='lte')
-    customer_name = django_filters.CharFilter(field_name='customer__name', lookup_expr='icontains')
-    product_name = django_filters.CharFilter(field_name='products__name', lookup_expr='icontains')
+    customer_name = SearchFilter(field_name='customer__name')
+    product_name = SearchFilter(field_name='products__name')
     product_id = django_filters.NumberFilter(field_name='products__id', lookup_expr='exact')
     
     class Meta:
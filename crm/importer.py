@@ -0,0 +1,159 @@
+"""Chunked CSV/NDJSON import of customers and products.
+
+Records are read lazily, validated with the models' own field validators
+and ``clean`` (``validate_phone``, ``Product.clean``) and upserted one
+batch per transaction, so memory is bounded by the batch size:
+
+* customers are upserted on ``email`` with ``ON CONFLICT ... DO UPDATE``;
+* products are matched on ``name``, which is not unique in the schema, so
+  each batch looks the names up first and upserts on the primary key.
+
+Within a batch the last record for an email or name wins.
+"""
+import csv
+import json
+from dataclasses import dataclass, field
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from .models import Customer, Product
+from .response_cache import invalidate_models
+
+IMPORT_BATCH_SIZE = 1000
+
+
+def read_records(stream, fmt):
+    """Yield ``(number, record)`` pairs, numbered from 1, from a text stream."""
+    if fmt == 'csv':
+        for number, record in enumerate(csv.DictReader(stream), 1):
+            yield number, record
+        return
+    number = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            record = e
+        yield number, record
+
+
+def _chunks(records, size):
+    chunk = []
+    for item in records:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class CustomerImporter:
+    model = Customer
+    key = 'email'
+
+    def build(self, record):
+        customer = Customer(
+            name=(record.get('name') or '').strip(),
+            email=(record.get('email') or '').strip(),
+            phone=(record.get('phone') or '').strip(),
+        )
+        customer.clean_fields()
+        customer.clean()
+        return customer
+
+    def upsert(self, instances):
+        Customer.objects.bulk_create(
+            instances, update_conflicts=True, unique_fields=['email'], update_fields=['name', 'phone']
+        )
+
+
+class ProductImporter:
+    model = Product
+    key = 'name'
+
+    def build(self, record):
+        product = Product(
+            name=(record.get('name') or '').strip(),
+            price=record.get('price'),
+            stock=record.get('stock') or 0,
+        )
+        product.clean_fields()
+        product.clean()
+        return product
+
+    def upsert(self, instances):
+        existing = dict(
+            Product.objects.filter(name__in=[product.name for product in instances])
+            .order_by('-id').values_list('name', 'id')
+        )
+        new, known = [], []
+        for product in instances:
+            product.pk = existing.get(product.name)
+            (new if product.pk is None else known).append(product)
+        Product.objects.bulk_create(new)
+        Product.objects.bulk_create(
+            known, update_conflicts=True, unique_fields=['id'], update_fields=['price', 'stock']
+        )
+
+
+IMPORTERS = {
+    'customers': CustomerImporter,
+    'products': ProductImporter,
+}
+
+
+@dataclass
+class ImportResult:
+    processed: int = 0
+    imported: int = 0
+    rejected: int = 0
+    last_record: int = 0
+    rejects: list = field(default_factory=list)
+
+
+def _errors(error):
+    if isinstance(error, ValidationError):
+        return error.message_dict if hasattr(error, 'error_dict') else {'__all__': error.messages}
+    return {'__all__': [str(error)]}
+
+
+def import_records(kind, records, batch_size=IMPORT_BATCH_SIZE, start_after=0, on_batch=None, on_reject=None):
+    """Validate and upsert ``(number, record)`` pairs one batch per transaction.
+
+    Records numbered ``start_after`` or lower are skipped. ``on_reject`` is
+    called with ``(number, record, errors)`` for every invalid record and
+    ``on_batch`` with the running ``ImportResult`` after each commit; when
+    no ``on_reject`` is given the rejects are collected on the result.
+    """
+    importer = IMPORTERS[kind]()
+    result = ImportResult(last_record=start_after)
+    records = ((number, record) for number, record in records if number > start_after)
+    for chunk in _chunks(records, batch_size):
+        valid = {}
+        for number, record in chunk:
+            try:
+                if not isinstance(record, dict):
+                    raise ValidationError(f"Malformed record: {record}")
+                instance = importer.build(record)
+            except (ValidationError, TypeError, ValueError) as e:
+                result.rejected += 1
+                if on_reject is not None:
+                    on_reject(number, record, _errors(e))
+                else:
+                    result.rejects.append((number, _errors(e)))
+                continue
+            valid[getattr(instance, importer.key)] = instance
+        with transaction.atomic():
+            if valid:
+                importer.upsert(list(valid.values()))
+                # bulk_create sends no post_save
+                invalidate_models(importer.model)
+        result.processed += len(chunk)
+        result.imported += len(valid)
+        result.last_record = chunk[-1][0]
+        if on_batch is not None:
+            on_batch(result)
+    return result
@@ -0,0 +1,88 @@
+"""Stock reservation for new orders.
+
+Stock is taken with one conditional ``UPDATE`` per order, covering every
+product in it::
+
+    UPDATE crm_product
+       SET stock = stock - CASE id WHEN 1 THEN 2 WHEN 7 THEN 1 END
+     WHERE id IN (1, 7)
+       AND stock >= CASE id WHEN 1 THEN 2 WHEN 7 THEN 1 END
+
+The database checks and decrements each row atomically, so concurrent
+orders can never drive stock below zero and no row is read first. If
+fewer rows than products were updated, at least one product is short and
+``InsufficientStock`` is raised so the caller's transaction rolls the
+partial reservation back.
+"""
+from collections import Counter
+from django.db.models import Case, F, IntegerField, Value, When
+from .models import Product
+
+
+class InsufficientStock(Exception):
+    """Raised when an order asks for more of a product than is in stock."""
+
+    def __init__(self, quantities):
+        self.quantities = quantities
+        super().__init__("Insufficient stock")
+
+
+def _product_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError("One or more invalid product IDs")
+
+
+def order_quantities(row):
+    """``{product_id: quantity}`` for an ``OrderInput``-like ``row``.
+
+    Each entry of ``product_ids`` counts once and each of ``items`` adds its
+    ``quantity``. Raises ``ValueError`` for a malformed id or quantity.
+    """
+    quantities = Counter()
+    for product_id in getattr(row, 'product_ids', None) or ():
+        quantities[_product_id(product_id)] += 1
+    for item in getattr(row, 'items', None) or ():
+        quantity = 1 if item.quantity is None else item.quantity
+        if quantity < 1:
+            raise ValueError("Quantity must be positive")
+        quantities[_product_id(item.product_id)] += quantity
+    return dict(quantities)
+
+
+def _per_product(quantities):
+    return Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+
+
+def reserve_stock(quantities):
+    """Take ``{product_id: quantity}`` out of stock in one statement.
+
+    Must run inside a transaction: on shortfall some rows may already have
+    been decremented, and raising ``InsufficientStock`` is what undoes them.
+    """
+    if not quantities:
+        return
+    requested = _per_product(quantities)
+    updated = Product.objects.filter(pk__in=quantities, stock__gte=requested).update(
+        stock=F('stock') - requested
+    )
+    if updated != len(quantities):
+        raise InsufficientStock(quantities)
+
+
+def stock_report(quantities, reserved):
+    """Per-product ``(product_id, requested, stock, sufficient)`` rows.
+
+    ``stock`` is what is left after a successful reservation, or what is
+    available now after a failed one, in which case ``sufficient`` is false
+    for every product that could not cover its quantity.
+    """
+    stock = dict(Product.objects.filter(pk__in=quantities).values_list('pk', 'stock'))
+    return [
+        (pk, quantity, stock[pk], reserved or stock[pk] >= quantity)
+        for pk, quantity in quantities.items()
+    ]
@@ -0,0 +1,174 @@
+import asyncio
+from collections import defaultdict
+from asgiref.sync import sync_to_async
+from .models import Customer, Product, Order, OrderItem
+from .optimizer import selection_tree
+
+
+class DataLoader:
+    """Batch and cache ``key -> value`` lookups for the lifetime of one request.
+
+    Keys are queued with ``prime`` as soon as a list of parent objects is known
+    (a connection page, the result of another loader) and fetched together the
+    first time any one of them is ``load``ed, so resolving a relation for N
+    siblings costs one query instead of N.
+    """
+
+    def __init__(self, batch_load_fn, default_factory=None):
+        self.batch_load_fn = batch_load_fn
+        self.default_factory = default_factory
+        self._cache = {}
+        self._pending = {}
+        self._inflight = None
+
+    def prime(self, keys):
+        for key in keys:
+            if key not in self._cache:
+                self._pending[key] = None
+
+    def load(self, key):
+        if key not in self._cache:
+            self._pending[key] = None
+            self.dispatch()
+        return self._cache[key]
+
+    def load_many(self, keys):
+        keys = list(keys)
+        self.prime(keys)
+        return [self.load(key) for key in keys]
+
+    async def aload(self, key):
+        """Async ``load``: concurrent callers share one in-flight batch."""
+        while key not in self._cache:
+            if self._inflight is None:
+                self._pending[key] = None
+                self._inflight = asyncio.ensure_future(self._adispatch())
+            await self._inflight
+        return self._cache[key]
+
+    async def _adispatch(self):
+        try:
+            keys = list(self._pending)
+            self._pending.clear()
+            if keys:
+                self._store(keys, await sync_to_async(self.batch_load_fn)(keys))
+        finally:
+            self._inflight = None
+
+    def dispatch(self):
+        keys = list(self._pending)
+        self._pending.clear()
+        if not keys:
+            return
+        self._store(keys, self.batch_load_fn(keys))
+
+    def _store(self, keys, results):
+        for key in keys:
+            if key in results:
+                self._cache[key] = results[key]
+            else:
+                self._cache[key] = self.default_factory() if self.default_factory else None
+
+
+def _merge(selection, other):
+    for name, children in other.items():
+        _merge(selection.setdefault(name, {}), children)
+    return selection
+
+
+class Loaders:
+    """The set of relation loaders shared by every resolver in a request.
+
+    Fetched objects only queue the relations their selection reads: each
+    loader remembers the selections of the fields it was requested for
+    (see ``get``) and primes the rows it returns with them.
+    """
+
+    def __init__(self):
+        self.customer = DataLoader(self._load_customers)
+        self.orders_by_customer = DataLoader(self._load_orders_by_customer, list)
+        self.products_by_order = DataLoader(self._load_products_by_order, list)
+        self.items_by_order = DataLoader(self._load_items_by_order, list)
+        self.orders_by_product = DataLoader(self._load_orders_by_product, list)
+        self.selections = defaultdict(dict)
+        self._seen = set()
+
+    def get(self, name, info):
+        """The loader ``name``, noting the selection of the field resolving through it."""
+        # sibling objects share the field's AST nodes; read them once
+        key = (name, *map(id, info.field_nodes))
+        if key not in self._seen:
+            self._seen.add(key)
+            _merge(self.selections[name], selection_tree(info))
+        return getattr(self, name)
+
+    def prime(self, instances, selection):
+        """Queue the keys of the relations ``selection`` reads on freshly fetched objects."""
+        for instance in instances:
+            if isinstance(instance, Order):
+                # a deferred customer_id means the selection never reads it
+                if ('customer' in selection and not Order.customer.is_cached(instance)
+                        and 'customer_id' in instance.__dict__):
+                    self.customer.prime([instance.customer_id])
+                if 'products' in selection:
+                    self.products_by_order.prime([instance.pk])
+                if 'items' in selection:
+                    self.items_by_order.prime([instance.pk])
+            elif isinstance(instance, Customer):
+                if 'orders' in selection:
+                    self.orders_by_customer.prime([instance.pk])
+            elif isinstance(instance, Product):
+                if 'orders' in selection:
+                    self.orders_by_product.prime([instance.pk])
+
+    def _load_customers(self, keys):
+        customers = {customer.pk: customer for customer in Customer.objects.filter(pk__in=keys)}
+        self.prime(customers.values(), self.selections['customer'])
+        return customers
+
+    def _load_orders_by_customer(self, keys):
+        grouped = defaultdict(list)
+        for order in Order.objects.filter(customer_id__in=keys).order_by('id'):
+            grouped[order.customer_id].append(order)
+            self.prime([order], self.selections['orders_by_customer'])
+        return grouped
+
+    def _load_products_by_order(self, keys):
+        through = OrderItem.objects.filter(order_id__in=keys)
+        grouped = defaultdict(list)
+        for row in through.select_related('product').order_by('product_id'):
+            grouped[row.order_id].append(row.product)
+            self.prime([row.product], self.selections['products_by_order'])
+        return grouped
+
+    def _load_items_by_order(self, keys):
+        grouped = defaultdict(list)
+        for item in OrderItem.objects.filter(order_id__in=keys).select_related('product').order_by('id'):
+            grouped[item.order_id].append(item)
+            self.prime([item.product], self.selections['items_by_order'].get('product', {}))
+        return grouped
+
+    def _load_orders_by_product(self, keys):
+        through = OrderItem.objects.filter(product_id__in=keys)
+        grouped = defaultdict(list)
+        for row in through.select_related('order').order_by('order_id'):
+            grouped[row.product_id].append(row.order)
+            self.prime([row.order], self.selections['orders_by_product'])
+        return grouped
+
+
+def get_loaders(info):
+    """Return the loaders bound to the current request, creating them on first use."""
+    context = info.context
+    if context is None:
+        return Loaders()
+    loaders = getattr(context, '_crm_loaders', None)
+    if loaders is None:
+        loaders = Loaders()
+        setattr(context, '_crm_loaders', loaders)
+    return loaders
+
+
+def is_async(info):
+    """Whether the current request is executed by the async view."""
+    return getattr(info.context, 'crm_async', False)
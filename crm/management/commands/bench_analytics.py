@@ -0,0 +1,124 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from crm import analytics
+from crm.management.seeding import seed_crm
+from crm.models import LINE_TOTAL, Order, OrderItem
+from crm.signals import recalculate_totals
+
+
+def cents(value):
+    # SQLite sums decimals as floats
+    return round(value * 100)
+
+
+def orm_sales_by_day():
+    orders = (
+        Order.objects.annotate(day=TruncDate('order_date')).order_by('day')
+        .values_list('day').annotate(orders=Count('pk'), revenue=Sum('total_amount'))
+    )
+    sold = dict(
+        OrderItem.objects.annotate(day=TruncDate('order__order_date')).order_by()
+        .values_list('day').annotate(units=Sum('quantity'))
+    )
+    return [(day, count, sold.get(day, 0), cents(revenue)) for day, count, revenue in orders]
+
+
+def orm_top_products(limit):
+    rows = (
+        OrderItem.objects.values_list('product_id')
+        .annotate(orders=Count('order_id'), units=Sum('quantity'), revenue=Sum(LINE_TOTAL))
+        .order_by('-revenue', 'product_id')[:limit]
+    )
+    return [(pk, count, units, cents(revenue)) for pk, count, units, revenue in rows]
+
+
+def orm_top_customers(limit):
+    rows = (
+        Order.objects.values_list('customer_id')
+        .annotate(orders=Count('pk'), revenue=Sum('total_amount'))
+        .order_by('-revenue', 'customer_id')[:limit]
+    )
+    return [(pk, count, cents(revenue)) for pk, count, revenue in rows]
+
+
+def orm_percentiles(percentiles):
+    count = Order.objects.count()
+    totals = Order.objects.order_by('total_amount', 'pk').values_list('total_amount', flat=True)
+    return [cents(totals[int(p / 100 * (count - 1))]) for p in percentiles]
+
+
+def rows(*columns):
+    return [tuple(value.item() for value in row) for row in zip(*columns)]
+
+
+class Command(BaseCommand):
+    help = "Seed a throwaway database and compare NumPy analytics with the equivalent ORM aggregate queries."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=5000000)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--days', type=int, default=365, help="Days the orders are spread over.")
+        parser.add_argument('--limit', type=int, default=10, help="Rows in the top product and customer lists.")
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.seed(options['orders'], options['products'], options['days'])
+            self.compare(options['limit'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, count, products, days):
+        self.stdout.write(f"Seeding {count} orders over {days} days...")
+        seed_crm(customers=max(count // 10, 1), products=products, orders=count)
+        # spread the dates afterwards with one UPDATE per day;
+        # later orders get later days
+        now = timezone.now()
+        first, last = Order.objects.order_by('pk').values_list('pk', flat=True)[0], Order.objects.latest('pk').pk
+        step = (last - first) // days + 1
+        for day in range(days):
+            Order.objects.filter(pk__gte=first + day * step, pk__lt=first + (day + 1) * step).update(
+                order_date=now - timedelta(days=days - 1 - day)
+            )
+        recalculate_totals(Order.objects.values('pk'))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def timed(self, label, function):
+        start = time.perf_counter()
+        result = function()
+        self.stdout.write(f"{label}: {(time.perf_counter() - start) * 1000:.1f} ms")
+        return result
+
+    def compare(self, limit):
+        percentiles = (50, 90, 99)
+        self.stdout.write(self.style.MIGRATE_HEADING("\n== NumPy"))
+        orders = self.timed("load orders", analytics.load_orders)
+        items = self.timed("load items", lambda: analytics.load_items(orders))
+        numpy_results = {
+            'sales by day': rows(*self.timed("sales by day", lambda: analytics.sales_by_day(orders, items))),
+            'top products': rows(*self.timed("top products", lambda: analytics.top_products(items, limit))),
+            'top customers': rows(*self.timed("top customers", lambda: analytics.top_customers(orders, limit))),
+            'percentiles': self.timed(
+                "percentiles", lambda: analytics.order_value_percentiles(orders, percentiles)
+            ).tolist(),
+        }
+        self.timed("cohort retention", lambda: analytics.cohort_retention(orders))
+
+        self.stdout.write(self.style.MIGRATE_HEADING("\n== ORM"))
+        orm_results = {
+            'sales by day': self.timed("sales by day", orm_sales_by_day),
+            'top products': self.timed("top products", lambda: orm_top_products(limit)),
+            'top customers': self.timed("top customers", lambda: orm_top_customers(limit)),
+            'percentiles': self.timed("percentiles", lambda: orm_percentiles(percentiles)),
+        }
+
+        mismatched = [name for name in orm_results if orm_results[name] != numpy_results[name]]
+        if mismatched:
+            raise CommandError(f"NumPy and ORM results differ: {', '.join(mismatched)}")
+        self.stdout.write(self.style.SUCCESS("\nNumPy and ORM results match"))
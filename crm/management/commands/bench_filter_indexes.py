@@ -0,0 +1,98 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from crm.filters import CustomerFilter, ProductFilter, OrderFilter
+from crm.models import Customer, Product, Order, OrderItem
+
+FILTERS = [
+    ('customers created in the last 30 days', CustomerFilter, Customer,
+     lambda now: {'created_at__gte': (now - timedelta(days=30)).isoformat()}),
+    ('customers with +1 phones', CustomerFilter, Customer, lambda now: {'phone_pattern': '+1'}),
+    ('products priced 10..20', ProductFilter, Product, lambda now: {'price__gte': 10, 'price__lte': 20}),
+    ('products with stock >= 990', ProductFilter, Product, lambda now: {'stock__gte': 990}),
+    ('low stock products', ProductFilter, Product, lambda now: {'low_stock': True}),
+    ('orders over 900', OrderFilter, Order, lambda now: {'total_amount__gte': 900}),
+    ('orders in the last 7 days', OrderFilter, Order,
+     lambda now: {'order_date__gte': (now - timedelta(days=7)).isoformat()}),
+    ('orders by customer name', OrderFilter, Order, lambda now: {'customer_name': 'customer 42'}),
+]
+
+
+class Command(BaseCommand):
+    help = "Seed a throwaway database and compare filter plans and latency with and without crm indexes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.seed(options['customers'])
+            indexes = [(model, index) for model in (Customer, Product, Order) for index in model._meta.indexes]
+            with connection.schema_editor() as editor:
+                for model, index in indexes:
+                    editor.remove_index(model, index)
+            self.report('without indexes', options['repeat'])
+            with connection.schema_editor() as editor:
+                for model, index in indexes:
+                    editor.add_index(model, index)
+            self.report('with indexes', options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, count):
+        rng = random.Random(0)
+        now = timezone.now()
+        self.stdout.write(f"Seeding {count} customers, {count // 10} products and {count} orders...")
+        customers = Customer.objects.bulk_create(
+            (Customer(name=f'Customer {i}', email=f'customer{i}@example.com',
+                      phone=rng.choice(['+11234567890', '123-456-7890']))
+             for i in range(count)),
+            batch_size=5000,
+        )
+        # auto_now_add ignores explicit values, so spread the dates afterwards
+        Customer.objects.update(created_at=now - timedelta(days=365))
+        Customer.objects.filter(pk__in=[c.pk for c in customers[-count // 12:]]).update(created_at=now)
+        products = Product.objects.bulk_create(
+            (Product(name=f'Product {i}', price=Decimal(rng.randint(100, 10000)) / 100, stock=rng.randint(0, 1000))
+             for i in range(max(count // 10, 1))),
+            batch_size=5000,
+        )
+        Order.objects.bulk_create(
+            (Order(customer=rng.choice(customers), total_amount=Decimal(rng.randint(100, 100000)) / 100)
+             for _ in range(count)),
+            batch_size=5000,
+        )
+        Order.objects.update(order_date=now - timedelta(days=60))
+        Order.objects.filter(pk__gt=count - count // 50).update(order_date=now)
+
+        def item(order_id):
+            product = rng.choice(products)
+            return OrderItem(order_id=order_id, product_id=product.pk, unit_price=product.price)
+
+        OrderItem.objects.bulk_create(
+            (item(order_id) for order_id in Order.objects.values_list('pk', flat=True).iterator()),
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def report(self, label, repeat):
+        now = timezone.now()
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n== {label}"))
+        for name, filterset_class, model, data in FILTERS:
+            qs = filterset_class(data(now), queryset=model.objects.all()).qs.order_by()
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                qs.count()
+                list(qs[:100])
+                timings.append(time.perf_counter() - start)
+            self.stdout.write(f"{name}: {min(timings) * 1000:.2f} ms")
+            for line in qs.explain().splitlines():
+                self.stdout.write(f"    {line}")
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from crm.cleanup import CLEANUP_BATCH_SIZE, delete_inactive_customers
+
+
+class Command(BaseCommand):
+    help = "Delete customers without orders in the last --days days, with their orders, in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--batch-size', type=int, default=CLEANUP_BATCH_SIZE)
+        parser.add_argument('--sleep', type=float, default=0.0, help="Seconds to pause between batches.")
+        parser.add_argument(
+            '--include-never-ordered', action='store_true',
+            help="Also delete customers older than --days who never ordered.",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Only count the matching customers.")
+
+    def handle(self, *args, **options):
+        count = delete_inactive_customers(
+            days=options['days'],
+            batch_size=options['batch_size'],
+            sleep=options['sleep'],
+            include_never_ordered=options['include_never_ordered'],
+            dry_run=options['dry_run'],
+            progress=lambda deleted: self.stderr.write(f"{deleted} deleted"),
+        )
+        if options['dry_run']:
+            self.stdout.write(f"{count} inactive customers would be deleted")
+        else:
+            # the cron script logs this line
+            self.stdout.write(str(count))
@@ -0,0 +1,44 @@
+import sys
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+from crm.export import EXPORT_CHUNK_SIZE, EXPORTS, FORMATS, encode_rows, export_rows
+
+
+class Command(BaseCommand):
+    help = "Stream customers or orders to a CSV or NDJSON file, filtered like allCustomers/allOrders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson')
+        parser.add_argument('--output', '-o', help="File to write; defaults to stdout.")
+        parser.add_argument(
+            '--filter', action='append', default=[], metavar='NAME=VALUE',
+            help="Filter argument, e.g. --filter total_amount__gte=100. Repeatable.",
+        )
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        params = QueryDict(mutable=True)
+        for item in options['filter']:
+            name, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError(f"Filters look like NAME=VALUE, got {item!r}")
+            params.appendlist(name, value)
+
+        kind = options['kind']
+        rows = export_rows(kind, params, chunk_size=options['chunk_size'])
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        count = 0
+        try:
+            for line in encode_rows(kind, rows, options['format']):
+                output.write(line)
+                count += 1
+        except ValidationError as e:
+            raise CommandError(f"Invalid filters: {e}")
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        if options['format'] == 'csv':
+            count -= 1
+        self.stderr.write(f"Exported {max(count, 0)} {kind}")
@@ -0,0 +1,71 @@
+import json
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from crm.importer import IMPORT_BATCH_SIZE, IMPORTERS, import_records, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Upsert customers (on email) or products (on name) from a CSV or NDJSON file "
+        "in batched transactions, resumable from a checkpoint file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--checkpoint', help="Checkpoint file; defaults to PATH.checkpoint.")
+        parser.add_argument('--resume', action='store_true', help="Skip the records recorded in the checkpoint.")
+        parser.add_argument('--rejects', help="Write rejected records as NDJSON to this file.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        start_after = 0
+        if options['resume'] and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                start_after = json.load(f)['last_record']
+            self.stderr.write(f"Resuming after record {start_after}")
+
+        rejects = open(options['rejects'], 'a') if options['rejects'] else None
+        started = time.monotonic()
+
+        def on_reject(number, record, errors):
+            if rejects is not None:
+                data = record if isinstance(record, dict) else str(record)
+                rejects.write(json.dumps({'record': number, 'errors': errors, 'data': data}) + '\n')
+            else:
+                self.stderr.write(f"record {number}: {json.dumps(errors)}")
+
+        def on_batch(result):
+            # only committed batches are recorded, so a crash replays at most one
+            with open(f'{checkpoint}.tmp', 'w') as f:
+                json.dump({'last_record': result.last_record}, f)
+            os.replace(f'{checkpoint}.tmp', checkpoint)
+            elapsed = time.monotonic() - started
+            self.stderr.write(
+                f"{result.processed} records, {result.imported} upserted, {result.rejected} rejected, "
+                f"{result.processed / elapsed if elapsed else 0:.0f} records/s"
+            )
+
+        try:
+            with open(path, newline='' if fmt == 'csv' else None) as stream:
+                result = import_records(
+                    options['kind'], read_records(stream, fmt), batch_size=options['batch_size'],
+                    start_after=start_after, on_batch=on_batch, on_reject=on_reject,
+                )
+        except OSError as e:
+            raise CommandError(str(e))
+        finally:
+            if rejects is not None:
+                rejects.close()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"Imported {result.imported} {options['kind']} from {result.processed} records "
+            f"({result.rejected} rejected) in {elapsed:.1f}s, "
+            f"{result.processed / elapsed if elapsed else 0:.0f} records/s"
+        )
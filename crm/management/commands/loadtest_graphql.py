@@ -0,0 +1,112 @@
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.test import AsyncClient, Client
+from crm.management.seeding import seed_crm
+
+DEFAULT_QUERY = """
+{
+    allOrders(first: 20) { edges { node { totalAmount customer { email } products { name } } } }
+    allProducts(first: 20, lowStock: true) { edges { node { name stock } } }
+}
+"""
+
+
+def summarize(label, latencies, elapsed):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return (
+        f"{label}: {len(latencies) / elapsed:.1f} req/s, "
+        f"p50 {statistics.median(latencies) * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms"
+    )
+
+
+class Command(BaseCommand):
+    help = "Compare requests/sec and p99 latency of the WSGI and ASGI GraphQL views under concurrent clients."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=2000, help="Requests per server path.")
+        parser.add_argument('--customers', type=int, default=2000)
+        parser.add_argument('--query', default=DEFAULT_QUERY)
+        parser.add_argument(
+            '--wsgi-url', help="Benchmark a running WSGI server's /graphql/jobs/ instead of in-process handlers.",
+        )
+        parser.add_argument(
+            '--asgi-url', help="Benchmark a running ASGI server's /graphql/async/jobs/ instead of in-process handlers.",
+        )
+        parser.add_argument('--token', help="Job endpoint token; defaults to CRM_JOBS['TOKEN'].")
+
+    def handle(self, *args, **options):
+        body = json.dumps({'query': options['query']})
+        if options['wsgi_url'] or options['asgi_url']:
+            for label in ('wsgi', 'asgi'):
+                url = options[f'{label}_url']
+                if url:
+                    self.stdout.write(summarize(label.upper(), *self.run_http(url, body, options)))
+            return
+
+        # response caching would turn the comparison into a cache benchmark
+        settings.CRM_RESPONSE_CACHE = None
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            count = options['customers']
+            seed_crm(customers=count, products=max(count // 10, 1), orders=count * 2)
+            self.stdout.write(summarize('WSGI', *self.run_wsgi(body, options)))
+            self.stdout.write(summarize('ASGI', *asyncio.run(self.run_asgi(body, options))))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run_wsgi(self, body, options):
+        def worker(_):
+            client = Client()
+            start = time.perf_counter()
+            response = client.post('/graphql/', body, content_type='application/json')
+            assert response.status_code == 200, response.content
+            close_old_connections()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['clients']) as pool:
+            latencies = list(pool.map(worker, range(options['requests'])))
+        return latencies, time.perf_counter() - start
+
+    async def run_asgi(self, body, options):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(options['clients'])
+
+        async def worker():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post('/graphql/async/', body, content_type='application/json')
+                assert response.status_code == 200, response.content
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(worker() for _ in range(options['requests'])))
+        return latencies, time.perf_counter() - start
+
+    def run_http(self, url, body, options):
+        import requests
+
+        # the job endpoints skip CSRF checks and authenticate with a token
+        token = options['token'] or (getattr(settings, 'CRM_JOBS', None) or {}).get('TOKEN')
+        headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {token}'}
+
+        def worker(_):
+            session = requests.Session()
+            start = time.perf_counter()
+            response = session.post(url, data=body, headers=headers)
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['clients']) as pool:
+            latencies = list(pool.map(worker, range(options['requests'])))
+        return latencies, time.perf_counter() - start
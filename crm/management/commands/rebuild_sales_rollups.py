@@ -0,0 +1,19 @@
+from datetime import date
+from django.core.management.base import BaseCommand
+from crm.rollups import REBUILD_BATCH_DAYS, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily sales rollups from the orders, for backfills and to repair drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help="First day (YYYY-MM-DD); defaults to the first order.")
+        parser.add_argument('--end', type=date.fromisoformat, help="Last day (YYYY-MM-DD); defaults to the last order.")
+        parser.add_argument('--batch-days', type=int, default=REBUILD_BATCH_DAYS, help="Days recomputed per transaction.")
+
+    def handle(self, *args, **options):
+        days = rebuild_rollups(
+            options['start'], options['end'], options['batch_days'],
+            progress=lambda day: self.stderr.write(f"rebuilt up to {day}"),
+        )
+        self.stdout.write(f"Rebuilt rollups for {days} days")
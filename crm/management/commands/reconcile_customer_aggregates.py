@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from crm.aggregates import reconcile_customer_aggregates
+
+
+class Command(BaseCommand):
+    help = "Recompute Customer.last_order_date/order_count/total_spend where they drifted from the orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Only count drifted customers.")
+
+    def handle(self, *args, **options):
+        checked, drifted = reconcile_customer_aggregates(options['batch_size'], options['dry_run'])
+        verb = "would fix" if options['dry_run'] else "fixed"
+        self.stdout.write(f"Checked {checked} customers, {verb} {drifted}")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from crm.jobs import JOBS, run_job
+from crm import cron  # noqa: F401  registers the jobs
+
+
+class Command(BaseCommand):
+    help = "Run a scheduled crm job in-process."
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(JOBS))
+
+    def handle(self, *args, **options):
+        try:
+            result = run_job(options['name'])
+        except KeyError:
+            raise CommandError(f"Unknown job: {options['name']}")
+        if result is not None:
+            self.stdout.write(str(result))
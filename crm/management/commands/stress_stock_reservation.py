@@ -0,0 +1,74 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from alx_backend_graphql_crm.schema import schema
+from crm.models import Customer, Product, Order
+
+CREATE_ORDER = """
+    mutation ($input: OrderInput!) {
+        createOrder(input: $input) { order { id } }
+    }
+"""
+
+
+def place_orders(customer, products, threads, attempts):
+    """Run ``createOrder`` for all ``products`` from ``threads`` threads at once.
+
+    Every thread makes ``attempts`` calls on its own connection. Returns
+    ``(placed, failed, elapsed)``; failures include stock shortfalls and,
+    on SQLite, lock timeouts.
+    """
+    variables = {'input': {'customerId': customer.pk, 'productIds': [product.pk for product in products]}}
+
+    def worker(_):
+        placed = failed = 0
+        try:
+            for _ in range(attempts):
+                result = schema.execute(CREATE_ORDER, variable_values=variables)
+                if result.data and result.data['createOrder'] and result.data['createOrder']['order']:
+                    placed += 1
+                else:
+                    failed += 1
+        finally:
+            connection.close()
+        return placed, failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(worker, range(threads)))
+    elapsed = time.perf_counter() - start
+    return sum(placed for placed, _ in results), sum(failed for _, failed in results), elapsed
+
+
+class Command(BaseCommand):
+    help = "Place orders from concurrent threads against a test database and check stock never goes negative."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--attempts', type=int, default=100, help="Orders attempted per thread.")
+        parser.add_argument('--products', type=int, default=3, help="Products in every order.")
+        parser.add_argument('--stock', type=int, default=1000, help="Starting stock of every product.")
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            customer = Customer.objects.create(name='Stress', email='stress@example.com')
+            products = Product.objects.bulk_create(
+                Product(name=f'Product {i}', price=Decimal('1.00'), stock=options['stock'])
+                for i in range(options['products'])
+            )
+            placed, failed, elapsed = place_orders(customer, products, options['threads'], options['attempts'])
+            stock = list(Product.objects.values_list('stock', flat=True))
+            orders = Order.objects.count()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(
+            f"{placed} orders placed, {failed} failed in {elapsed:.2f} s: "
+            f"{placed / elapsed:.1f} orders/sec, {(placed + failed) / elapsed:.1f} attempts/sec"
+        )
+        if min(stock) < 0 or orders != placed or stock != [options['stock'] - placed] * len(stock):
+            raise CommandError(f"Stock out of step with {orders} orders: {stock}")
+        self.stdout.write(f"Remaining stock: {stock}")
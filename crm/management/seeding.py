@@ -0,0 +1,29 @@
+import random
+from decimal import Decimal
+from crm.models import Customer, Product, Order, OrderItem
+
+
+def seed_crm(customers, products, orders, products_per_order=2, seed=0, batch_size=5000):
+    """Fill the crm tables with deterministic synthetic data for benchmarks."""
+    rng = random.Random(seed)
+    Customer.objects.bulk_create(
+        (Customer(name=f'Customer {i}', email=f'customer{i}@example.com') for i in range(customers)),
+        batch_size=batch_size,
+    )
+    Product.objects.bulk_create(
+        (Product(name=f'Product {i}', price=Decimal(rng.randint(100, 10000)) / 100, stock=rng.randint(0, 100))
+         for i in range(products)),
+        batch_size=batch_size,
+    )
+    customer_ids = list(Customer.objects.values_list('pk', flat=True))
+    prices = list(Product.objects.values_list('pk', 'price'))
+    Order.objects.bulk_create(
+        (Order(customer_id=rng.choice(customer_ids)) for _ in range(orders)),
+        batch_size=batch_size,
+    )
+    OrderItem.objects.bulk_create(
+        (OrderItem(order_id=order_id, product_id=product_id, unit_price=price)
+         for order_id in Order.objects.values_list('pk', flat=True).iterator()
+         for product_id, price in rng.sample(prices, min(products_per_order, len(prices)))),
+        batch_size=batch_size,
+    )
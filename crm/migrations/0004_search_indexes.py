@@ -0,0 +1,14 @@
+from django.db import migrations
+
+import crm.search
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(crm.search.install_search, crm.search.uninstall_search),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:41
+
+from django.db import migrations, models
+
+import crm.aggregates
+
+
+def backfill_aggregates(apps, schema_editor):
+    Customer = apps.get_model('crm', 'Customer')
+    Order = apps.get_model('crm', 'Order')
+    Customer.objects.using(schema_editor.connection.alias).update(**crm.aggregates.aggregate_updates(Order))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='last_order_date',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='order_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='total_spend',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['last_order_date'], name='crm_customer_last_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['order_count'], name='crm_customer_order_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['total_spend'], name='crm_customer_spend_idx'),
+        ),
+        migrations.RunPython(backfill_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.3 on 2026-10-17 04:49
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_order_products(apps, schema_editor):
+    Order = apps.get_model('crm', 'Order')
+    OrderItem = apps.get_model('crm', 'OrderItem')
+    links = Order._meta.get_field('products').remote_field.through
+    db = schema_editor.connection.alias
+    # the price paid was never recorded; the product's current price is the
+    # closest snapshot there is. Stored order totals are left as they are.
+    rows = links.objects.using(db).order_by('pk').values_list('order_id', 'product_id', 'product__price')
+    batch = []
+    for order_id, product_id, price in rows.iterator(chunk_size=2000):
+        batch.append(OrderItem(order_id=order_id, product_id=product_id, quantity=1, unit_price=price))
+        if len(batch) == 2000:
+            OrderItem.objects.using(db).bulk_create(batch)
+            batch = []
+    OrderItem.objects.using(db).bulk_create(batch)
+
+
+def copy_order_items_back(apps, schema_editor):
+    Order = apps.get_model('crm', 'Order')
+    OrderItem = apps.get_model('crm', 'OrderItem')
+    links = Order._meta.get_field('products').remote_field.through
+    db = schema_editor.connection.alias
+    links.objects.using(db).bulk_create(
+        (links(order_id=order_id, product_id=product_id)
+         for order_id, product_id in OrderItem.objects.using(db).values_list('order_id', 'product_id').iterator(chunk_size=2000)),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_job_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)])),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='crm.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='crm.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('order', 'product'), name='crm_orderitem_order_product_uniq')],
+            },
+        ),
+        migrations.RunPython(copy_order_products, copy_order_items_back),
+        # Django cannot switch an existing many-to-many field to a custom
+        # through model, so the old field and its table are dropped and the
+        # field is added back on top of OrderItem
+        migrations.RemoveField(
+            model_name='order',
+            name='products',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='products',
+            field=models.ManyToManyField(related_name='orders', through='crm.OrderItem', to='crm.product'),
+        ),
+    ]
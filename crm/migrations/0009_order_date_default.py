@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-17 05:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0008_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='order_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
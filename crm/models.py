@@ -1,6 +1,8 @@
 from django.db import models
 import re
 from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
+from django.utils import timezone
 
 def validate_phone(value):
     if value and not re.match(r'^\+?\d{1,4}?[-.\s]?\d{3}[-.\s]?\d{3}[-.\s]?\d{4}$', value):
@@ -11,6 +13,20 @@ class Customer(models.Model):
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=20, blank=True, validators=[validate_phone])
     created_at = models.DateTimeField(auto_now_add=True)
+    # denormalized from the customer's orders, see crm.aggregates
+    last_order_date = models.DateTimeField(null=True, blank=True, editable=False)
+    order_count = models.PositiveIntegerField(default=0, editable=False)
+    total_spend = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='crm_customer_created_idx'),
+            models.Index(fields=['last_order_date'], name='crm_customer_last_order_idx'),
+            models.Index(fields=['order_count'], name='crm_customer_order_count_idx'),
+            models.Index(fields=['total_spend'], name='crm_customer_spend_idx'),
+            # pattern ops let PostgreSQL serve phone__startswith from the index
+            models.Index(fields=['phone'], name='crm_customer_phone_idx', opclasses=['varchar_pattern_ops']),
+        ]
     
     def __str__(self):
         return self.name
@@ -20,6 +36,14 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.IntegerField(default=0)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['price'], name='crm_product_price_idx'),
+            models.Index(fields=['stock'], name='crm_product_stock_idx'),
+            # matches ProductFilter.low_stock and UpdateLowStockProducts
+            models.Index(fields=['stock'], name='crm_product_low_stock_idx', condition=models.Q(stock__lt=10)),
+        ]
+    
     def clean(self):
         if self.price <= 0:
             raise ValidationError('Price must be positive')
@@ -31,12 +55,81 @@ class Product(models.Model):
 
 class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='orders')
-    products = models.ManyToManyField(Product, related_name='orders')
-    order_date = models.DateTimeField(auto_now_add=True)
+    products = models.ManyToManyField(Product, through='OrderItem', related_name='orders')
+    order_date = models.DateTimeField(default=timezone.now)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
-    
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        if self.products.exists():
-            self.total_amount = sum(product.price for product in self.products.all())
-            super().save(update_fields=['total_amount'])
\ No newline at end of file
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order_date', 'customer'], name='crm_order_date_customer_idx'),
+            models.Index(fields=['total_amount'], name='crm_order_total_idx'),
+        ]
+
+
+class OrderItem(models.Model):
+    """A product line of an order, priced when the order was placed."""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_items')
+    quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='crm_orderitem_order_product_uniq'),
+        ]
+
+    @property
+    def line_total(self):
+        return self.quantity * self.unit_price
+
+
+# what an item contributed to its order's total, for aggregates over items
+LINE_TOTAL = models.ExpressionWrapper(
+    models.F('quantity') * models.F('unit_price'),
+    output_field=models.DecimalField(max_digits=12, decimal_places=2),
+)
+
+
+class DailySales(models.Model):
+    """Orders and revenue per day, see crm.rollups."""
+    day = models.DateField(unique=True)
+    order_count = models.PositiveIntegerField(default=0)
+    items_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+
+class DailyProductSales(models.Model):
+    """Units and revenue per product and day, see crm.rollups."""
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    order_count = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='crm_dailyproductsales_uniq'),
+        ]
+
+
+class DailyCustomerSales(models.Model):
+    """Orders and spend per customer and day, see crm.rollups."""
+    day = models.DateField()
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='daily_sales')
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'customer'], name='crm_dailycustomersales_uniq'),
+        ]
+
+
+class JobCheckpoint(models.Model):
+    """Where an incremental job (see crm.cron) stopped on its last run."""
+    name = models.CharField(max_length=100, unique=True)
+    cursor = models.CharField(max_length=255, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,120 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphene_django.registry import get_global_registry
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+
+def _selected_fields(selection_sets, fragments):
+    """Merge the given selection sets into ``{field name: [child selection sets]}``."""
+    fields = {}
+    for selection_set in selection_sets:
+        if selection_set is None:
+            continue
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                fields.setdefault(selection.name.value, []).append(selection.selection_set)
+                continue
+            if isinstance(selection, InlineFragmentNode):
+                nested = _selected_fields([selection.selection_set], fragments)
+            elif isinstance(selection, FragmentSpreadNode):
+                nested = _selected_fields([fragments[selection.name.value].selection_set], fragments)
+            else:
+                continue
+            for name, children in nested.items():
+                fields.setdefault(name, []).extend(children)
+    return fields
+
+
+def _model_field(model, name):
+    try:
+        return model._meta.get_field(to_snake_case(name))
+    except FieldDoesNotExist:
+        return None
+
+
+def _field_columns(model):
+    """``field_columns`` of the object type registered for ``model``.
+
+    Maps computed GraphQL fields to the model columns their resolvers read.
+    """
+    object_type = get_global_registry().get_type_for_model(model)
+    return getattr(object_type, 'field_columns', {})
+
+
+def _plan(model, fields, fragments, prefix=''):
+    """Translate a node selection into ``only``, ``select_related`` and ``Prefetch`` lists."""
+    only = {prefix + model._meta.pk.name}
+    select_related = []
+    prefetch = []
+    computed = _field_columns(model)
+    for name, children in fields.items():
+        field = _model_field(model, name)
+        if field is None:
+            only.update(prefix + column for column in computed.get(to_snake_case(name), ()))
+            continue
+        child_fields = _selected_fields(children, fragments)
+        if field.many_to_one or (field.one_to_one and field.concrete):
+            only.add(prefix + field.name)
+            select_related.append(prefix + field.name)
+            child_only, child_select, child_prefetch = _plan(
+                field.related_model, child_fields, fragments, prefix + field.name + '__'
+            )
+            only |= child_only
+            select_related.extend(child_select)
+            prefetch.extend(child_prefetch)
+        elif field.many_to_many or field.one_to_many:
+            # a reverse FK must be loaded to attach prefetched rows to their parent
+            extra_only = (field.field.name,) if field.one_to_many else ()
+            # the same order as the relation loaders
+            queryset = optimize_queryset(
+                field.related_model._default_manager.order_by('pk'), child_fields, fragments, extra_only
+            )
+            accessor = field.get_accessor_name() if field.auto_created else field.name
+            prefetch.append(Prefetch(prefix + accessor, queryset=queryset))
+        else:
+            only.add(prefix + field.name)
+    return only, select_related, prefetch
+
+
+def optimize_queryset(queryset, fields, fragments, extra_only=()):
+    only, select_related, prefetch = _plan(queryset.model, fields, fragments)
+    queryset = queryset.only(*only, *extra_only)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def _node_fields(selection_sets, fragments):
+    fields = _selected_fields(selection_sets, fragments)
+    if 'edges' in fields:
+        edges = _selected_fields(fields['edges'], fragments)
+        fields = _selected_fields(edges.get('node', []), fragments)
+    return fields
+
+
+def _tree(selection_sets, fragments):
+    return {
+        to_snake_case(name): _tree(children, fragments)
+        for name, children in _node_fields(selection_sets, fragments).items()
+    }
+
+
+def selection_tree(info):
+    """The current field's selection as nested ``{field name: selection}`` dicts.
+
+    Names are snake_case and connections are unwrapped to their nodes, so
+    the keys line up with model relations.
+    """
+    return _tree([node.selection_set for node in info.field_nodes], info.fragments)
+
+
+def optimize(queryset, info):
+    """Restrict ``queryset`` to what the current GraphQL selection actually reads.
+
+    Works for relay connections (``edges { node { ... } }``) and plain lists.
+    """
+    fields = _node_fields([node.selection_set for node in info.field_nodes], info.fragments)
+    return optimize_queryset(queryset, fields, info.fragments)
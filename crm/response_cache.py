@@ -0,0 +1,201 @@
+"""Result cache for read-only GraphQL operations.
+
+Entries are keyed on the printed (normalized) document, the operation name
+and the variables, plus the current version of every model the document
+can read. Saving, deleting or relinking a ``Customer``, ``Product`` or
+``Order`` bumps that model's version once the transaction commits, so every
+entry tagged with it stops matching and ages out of the backend. Object
+types that are not ``DjangoObjectType`` subclasses name the models they
+are computed from in a ``cache_models`` attribute.
+
+Configured with ``CRM_RESPONSE_CACHE``; the cache is off when it is unset.
+Hits, misses, invalidations and in-process evictions are counted in the
+``/metrics/`` counters.
+"""
+import hashlib
+import json
+import threading
+import time
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from graphql import TypeInfo, TypeInfoVisitor, Visitor, get_named_type, print_ast, visit
+from .documents import LRUCache
+from .tracing import metrics
+
+
+class LocMemBackend:
+    """Per-process LRU backend. Other processes never see its invalidations."""
+
+    def __init__(self, maxsize=1024):
+        self._entries = LRUCache(maxsize)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires is not None and expires < time.monotonic():
+            self._entries.pop(key)
+            return None
+        return value
+
+    def set(self, key, value, timeout):
+        expires = time.monotonic() + timeout if timeout else None
+        evicted = self._entries.set(key, (expires, value))
+        if evicted:
+            metrics.inc('crm_response_cache_evictions_total', evicted)
+
+    def get_versions(self, tags):
+        return [self._versions.get(tag, 0) for tag in tags]
+
+    def bump(self, tag):
+        with self._lock:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    @property
+    def evictions(self):
+        return self._entries.evictions
+
+
+class RedisBackend:
+    """Redis backend shared by every worker; entries expire with ``timeout``.
+
+    Redis evicts entries itself; its ``evicted_keys`` stat counts them.
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='crm:rc:', client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, timeout):
+        self.client.set(self.prefix + key, value, ex=timeout or None)
+
+    def get_versions(self, tags):
+        return [int(v or 0) for v in self.client.mget([f'{self.prefix}v:{tag}' for tag in tags])]
+
+    def bump(self, tag):
+        self.client.incr(f'{self.prefix}v:{tag}')
+
+    @property
+    def evictions(self):
+        return int(self.client.info('stats').get('evicted_keys', 0))
+
+
+class _TypeCollector(Visitor):
+    def __init__(self, type_info):
+        super().__init__()
+        self.type_info = type_info
+        self.types = set()
+
+    def enter_field(self, node, *args):
+        field_type = self.type_info.get_type()
+        if field_type is not None:
+            self.types.add(get_named_type(field_type))
+
+
+def document_tags(schema, document):
+    """Names of the Django models whose rows the document can read."""
+    type_info = TypeInfo(schema)
+    collector = _TypeCollector(type_info)
+    visit(document, TypeInfoVisitor(type_info, collector))
+    tags = set()
+    for graphql_type in collector.types:
+        graphene_type = getattr(graphql_type, 'graphene_type', None)
+        model = getattr(getattr(graphene_type, '_meta', None), 'model', None)
+        if model is not None:
+            tags.add(model.__name__)
+        # plain object types computed from the tables list them themselves
+        tags.update(model.__name__ for model in getattr(graphene_type, 'cache_models', ()))
+    return sorted(tags)
+
+
+class ResponseCache:
+    def __init__(self, backend, timeout=60):
+        self.backend = backend
+        self.timeout = timeout
+        self._tags = LRUCache(1024)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.invalidations = 0
+
+    def _count(self, event):
+        with self._lock:
+            setattr(self, event, getattr(self, event) + 1)
+        metrics.inc(f'crm_response_cache_{event}_total')
+
+    def make_key(self, schema, document, operation_name, variables):
+        text = print_ast(document)
+        tags = self._tags.get(text)
+        if tags is None:
+            tags = document_tags(schema, document)
+            self._tags.set(text, tags)
+        versions = self.backend.get_versions(tags)
+        raw = json.dumps(
+            [text, operation_name, variables or {}, list(zip(tags, versions))],
+            sort_keys=True, default=str,
+        )
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return json.loads(value)
+
+    def set(self, key, data):
+        self.backend.set(key, json.dumps(data), self.timeout)
+
+    def invalidate(self, *models):
+        for model in models:
+            self.backend.bump(model.__name__)
+            self._count('invalidations')
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'evictions': self.backend.evictions,
+        }
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    global _response_cache
+    config = getattr(settings, 'CRM_RESPONSE_CACHE', None)
+    if not config:
+        return None
+    if _response_cache is None:
+        backend = import_string(config.get('BACKEND', 'crm.response_cache.LocMemBackend'))
+        _response_cache = ResponseCache(backend(**config.get('OPTIONS', {})), config.get('TIMEOUT', 60))
+    return _response_cache
+
+
+@receiver(setting_changed)
+def _reset_response_cache(setting, **kwargs):
+    global _response_cache
+    if setting == 'CRM_RESPONSE_CACHE':
+        _response_cache = None
+
+
+def invalidate_models(*models):
+    """Expire cached results that read ``models`` once the current transaction commits."""
+    cache = get_response_cache()
+    if cache is not None:
+        transaction.on_commit(lambda: cache.invalidate(*models))
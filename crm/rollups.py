@@ -0,0 +1,225 @@
+"""Daily sales rollups behind ``salesByDay``, ``topProducts`` and ``topCustomers``.
+
+``DailySales``, ``DailyProductSales`` and ``DailyCustomerSales`` hold one
+row per day, per day and product, and per day and customer, so a report
+over a date range reads a few rows per day instead of every order and
+line item in it. New orders, saved one by one or through
+``bulkCreateOrders``, are folded in as ``F()`` deltas on the rows of their
+day, as they are into the customer aggregates. Anything that cannot be
+expressed as a delta (deletes, relinks through the products relation)
+recomputes the affected days from the order tables; deleted orders are
+collected and their days recomputed once the deletion commits. ``rebuild_rollups`` recomputes a whole date range and
+repairs drift left by writes that bypass both, such as edits of saved
+orders.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, Max, Min, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import LINE_TOTAL, DailyCustomerSales, DailyProductSales, DailySales, Order, OrderItem
+from .response_cache import invalidate_models
+
+ROLLUP_MODELS = (DailySales, DailyProductSales, DailyCustomerSales)
+
+REBUILD_BATCH_DAYS = 31
+
+UPDATE_CHUNK_SIZE = 500
+
+TOP_LIMIT = 100
+
+
+def order_day(value):
+    """The rollup day of an ``order_date``, in the current time zone."""
+    return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+
+def _add(model, day, deltas, key=None, chunk_size=UPDATE_CHUNK_SIZE):
+    """Add ``deltas`` to ``model``'s rows for ``day``, creating missing rows first.
+
+    ``deltas`` maps fields to amounts or, with ``key``, ids of ``key`` to
+    such mappings; those rows are changed with one ``UPDATE`` per
+    ``chunk_size`` ids. Each id adds a ``CASE`` branch that every matched
+    row is tested against, so unchunked updates grow quadratically.
+    """
+    if key is None:
+        model.objects.bulk_create([model(day=day)], ignore_conflicts=True)
+        model.objects.filter(day=day).update(**{name: F(name) + Value(amount) for name, amount in deltas.items()})
+        return
+    model.objects.bulk_create([model(day=day, **{key: pk}) for pk in deltas], ignore_conflicts=True)
+    ids = list(deltas)
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        names = {name for pk in chunk for name in deltas[pk]}
+        model.objects.filter(day=day, **{f'{key}__in': chunk}).update(**{
+            name: F(name) + Case(
+                *[When(**{key: pk}, then=Value(deltas[pk].get(name, 0))) for pk in chunk],
+                output_field=model._meta.get_field(name),
+            )
+            for name in names
+        })
+
+
+def record_new_orders(placed, items_only=False):
+    """Fold freshly created ``(order, items)`` pairs into the rollups.
+
+    With ``items_only`` the orders themselves were already folded in by
+    the ``post_save`` handler and only their items are added. Costs two
+    queries per rollup table and day, plus one per further
+    ``UPDATE_CHUNK_SIZE`` products or customers a day receives.
+    """
+    days = defaultdict(lambda: (
+        {'order_count': 0, 'items_sold': 0, 'revenue': Decimal('0.00')},
+        defaultdict(lambda: {'order_count': 0, 'quantity': 0, 'revenue': Decimal('0.00')}),
+        defaultdict(lambda: {'order_count': 0, 'revenue': Decimal('0.00')}),
+    ))
+    for order, items in placed:
+        sales, products, customers = days[order_day(order.order_date)]
+        if not items_only:
+            total = Decimal(order.total_amount or 0)
+            sales['order_count'] += 1
+            sales['revenue'] += total
+            customers[order.customer_id]['order_count'] += 1
+            customers[order.customer_id]['revenue'] += total
+        for item in items:
+            sales['items_sold'] += item.quantity
+            products[item.product_id]['order_count'] += 1
+            products[item.product_id]['quantity'] += item.quantity
+            products[item.product_id]['revenue'] += item.line_total
+    for day, (sales, products, customers) in days.items():
+        _add(DailySales, day, sales)
+        if products:
+            _add(DailyProductSales, day, dict(products), key='product_id')
+        if customers:
+            _add(DailyCustomerSales, day, dict(customers), key='customer_id')
+    if days:
+        invalidate_models(*ROLLUP_MODELS)
+
+
+def day_start(day):
+    """The first instant of ``day`` in the current time zone."""
+    start = datetime.combine(day, time.min)
+    return timezone.make_aware(start) if settings.USE_TZ else start
+
+
+def _ranges(days):
+    """Merge ``days`` into ``(first, last)`` runs of consecutive days."""
+    runs = []
+    for day in sorted(set(days)):
+        if runs and runs[-1][1] + timedelta(days=1) == day:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
+
+
+def _refresh_range(first, last):
+    """Recompute every rollup row from ``first`` to ``last`` inclusive."""
+    start, end = day_start(first), day_start(last + timedelta(days=1))
+    orders = Order.objects.filter(order_date__gte=start, order_date__lt=end)
+    items = OrderItem.objects.filter(order__order_date__gte=start, order__order_date__lt=end)
+    customer_rows = (
+        orders.annotate(day=TruncDate('order_date')).order_by()
+        .values_list('day', 'customer_id').annotate(orders=Count('pk'), revenue_total=Sum('total_amount'))
+    )
+    product_rows = (
+        items.annotate(day=TruncDate('order__order_date')).order_by()
+        .values_list('day', 'product_id')
+        .annotate(orders=Count('order_id'), units=Sum('quantity'), revenue_total=Sum(LINE_TOTAL))
+    )
+
+    daily = defaultdict(lambda: DailySales(order_count=0, items_sold=0, revenue=Decimal('0.00')))
+    customers = []
+    for day, customer_id, order_count, revenue in customer_rows:
+        customers.append(DailyCustomerSales(day=day, customer_id=customer_id, order_count=order_count, revenue=revenue))
+        daily[day].order_count += order_count
+        daily[day].revenue += revenue
+    products = []
+    for day, product_id, order_count, quantity, revenue in product_rows:
+        products.append(DailyProductSales(
+            day=day, product_id=product_id, order_count=order_count, quantity=quantity, revenue=revenue,
+        ))
+        daily[day].items_sold += quantity
+    for day, sales in daily.items():
+        sales.day = day
+
+    for model in ROLLUP_MODELS:
+        model.objects.filter(day__gte=first, day__lte=last)._raw_delete(model.objects.db)
+    DailySales.objects.bulk_create(daily.values())
+    DailyProductSales.objects.bulk_create(products)
+    DailyCustomerSales.objects.bulk_create(customers)
+
+
+def refresh_rollups(days):
+    """Recompute the rollup rows of ``days`` from the order tables."""
+    runs = _ranges(days)
+    if not runs:
+        return
+    with transaction.atomic():
+        for first, last in runs:
+            _refresh_range(first, last)
+        invalidate_models(*ROLLUP_MODELS)
+
+
+def refresh_order_days(order_ids):
+    refresh_rollups(Order.objects.filter(pk__in=order_ids).dates('order_date', 'day'))
+
+
+def rebuild_rollups(first=None, last=None, batch_days=REBUILD_BATCH_DAYS, progress=None):
+    """Recompute the rollups from ``first`` to ``last``, ``batch_days`` days per transaction.
+
+    Without bounds, the range runs from the first to the last order. Returns
+    the number of days covered; ``progress`` is called with each batch's
+    last day.
+    """
+    if first is None or last is None:
+        bounds = Order.objects.aggregate(first=Min('order_date'), last=Max('order_date'))
+        if bounds['first'] is None:
+            return 0
+        first = first or order_day(bounds['first'])
+        last = last or order_day(bounds['last'])
+    day = first
+    while day <= last:
+        batch_last = min(day + timedelta(days=batch_days - 1), last)
+        with transaction.atomic():
+            _refresh_range(day, batch_last)
+            invalidate_models(*ROLLUP_MODELS)
+        if progress is not None:
+            progress(batch_last)
+        day = batch_last + timedelta(days=1)
+    return (last - first).days + 1
+
+
+def sales_by_day(first, last):
+    """Rollup rows from ``first`` to ``last``; days without orders are omitted."""
+    return list(DailySales.objects.filter(day__gte=first, day__lte=last).order_by('day'))
+
+
+def _top(model, relation, fields, first, last, limit):
+    key = f'{relation}_id'
+    rows = list(
+        model.objects.filter(day__gte=first, day__lte=last)
+        .values(key).annotate(**{f'total_{name}': Sum(name) for name in fields})
+        .order_by('-total_revenue', key)[:max(1, min(limit, TOP_LIMIT))]
+    )
+    related = model._meta.get_field(relation).related_model.objects.in_bulk([row[key] for row in rows])
+    top = []
+    for row in rows:
+        instance = model(**{relation: related[row[key]]}, **{name: row[f'total_{name}'] for name in fields})
+        # SQLite sums decimals as floats
+        instance.revenue = Decimal(instance.revenue).quantize(Decimal('0.01'))
+        top.append(instance)
+    return top
+
+
+def top_products(first, last, limit=10):
+    """Products by revenue over the range, as unsaved ``DailyProductSales`` totals."""
+    return _top(DailyProductSales, 'product', ('order_count', 'quantity', 'revenue'), first, last, limit)
+
+
+def top_customers(first, last, limit=10):
+    """Customers by spend over the range, as unsaved ``DailyCustomerSales`` totals."""
+    return _top(DailyCustomerSales, 'customer', ('order_count', 'revenue'), first, last, limit)
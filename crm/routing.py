@@ -0,0 +1,101 @@
+"""Read-replica routing for GraphQL operations.
+
+``ReplicaRouter`` sends every write to the primary (``default``). Reads go
+to the primary too, except while a GraphQL query runs through the crm
+views: its resolvers read from one of the configured replicas, picked per
+operation so all of its fields see the same copy. Mutations run entirely
+on the primary and pin the client to it, so the queries that follow read
+their own writes while the replicas catch up.
+
+Configured with ``CRM_DATABASE_ROUTING``; without replicas every read
+stays on the primary. Keys:
+
+* ``REPLICAS``: aliases in ``DATABASES`` to read queries from.
+* ``STICKY_SECONDS``: how long after a mutation a client with a session
+  keeps reading from the primary. The deadline lives in the default cache
+  under the session key, so routing never creates sessions; clients
+  without one read from the primary for the rest of the request only.
+
+Like the response cache, stickiness is only shared between workers when
+the default cache is.
+"""
+import random
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from graphql import OperationType
+
+DEFAULT_STICKY_SECONDS = 5
+
+CACHE_PREFIX = 'crm:primary:'
+
+_read_alias = ContextVar('crm_read_alias', default=None)
+
+
+def get_routing_config():
+    return getattr(settings, 'CRM_DATABASE_ROUTING', None) or {}
+
+
+def get_replicas():
+    return [alias for alias in get_routing_config().get('REPLICAS', ()) if alias in settings.DATABASES]
+
+
+class ReplicaRouter:
+    """Route reads to the replica chosen for the current operation, writes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold copies of the primary's rows
+        return True
+
+
+@contextmanager
+def read_from(alias):
+    """Route the reads made inside the block to ``alias``."""
+    token = _read_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        _read_alias.reset(token)
+
+
+def _sticky_key(request):
+    session = getattr(request, 'session', None)
+    session_key = getattr(session, 'session_key', None)
+    return None if session_key is None else CACHE_PREFIX + session_key
+
+
+def pin_to_primary(request):
+    """Send the following reads of ``request``'s client to the primary."""
+    request.crm_read_primary = True
+    seconds = get_routing_config().get('STICKY_SECONDS', DEFAULT_STICKY_SECONDS)
+    key = _sticky_key(request)
+    if key is not None and seconds:
+        cache.set(key, True, seconds)
+
+
+def reads_pinned(request):
+    if getattr(request, 'crm_read_primary', False):
+        return True
+    key = _sticky_key(request)
+    return key is not None and cache.get(key, False)
+
+
+def route_operation(request, operation_ast):
+    """Context manager routing the reads of one GraphQL operation."""
+    replicas = get_replicas()
+    if operation_ast is None or not replicas:
+        return nullcontext()
+    if operation_ast.operation == OperationType.MUTATION:
+        pin_to_primary(request)
+        return nullcontext()
+    if operation_ast.operation != OperationType.QUERY or reads_pinned(request):
+        return nullcontext()
+    return read_from(random.choice(replicas))
@@ -1,12 +1,22 @@
 import graphene
 from graphene_django import DjangoObjectType
-from graphene_django.filter import DjangoFilterConnectionField
 from django.db import transaction, IntegrityError
-from .models import Customer, Product, Order
+from django.db.models import F
+from .models import Customer, Product, Order, OrderItem, DailySales, DailyProductSales, DailyCustomerSales
 from .filters import CustomerFilter, ProductFilter, OrderFilter
+from .fields import CRMFilterConnectionField, KeysetConnection
+from .loaders import get_loaders, is_async
+from .optimizer import optimize, selection_tree
+from .bulk import bulk_create_customers, bulk_create_orders
+from .inventory import InsufficientStock, order_quantities, reserve_stock, stock_report
+from .response_cache import invalidate_models
+from .rollups import TOP_LIMIT, record_new_orders, sales_by_day, top_customers, top_products
+from .cost import FieldCost
 from django.core.exceptions import ValidationError
+from datetime import timedelta
 from decimal import Decimal
-from datetime import datetime
+from functools import cached_property
+from django.utils import timezone
 import graphene
 from graphene_django.types import DjangoObjectType
 from crm.models import Product
@@ -16,51 +26,246 @@ class LowStockProductType(DjangoObjectType):
         model = Product
         fields = ('id', 'name', 'stock')
 
+# products restocked per call; callers sweep the catalog with ``after``
+MAX_RESTOCK_BATCH = 1000
+
 class UpdateLowStockProducts(graphene.Mutation):
     class Arguments:
-        pass
+        threshold = graphene.Int(default_value=10)
+        increment = graphene.Int(default_value=10)
+        limit = graphene.Int(default_value=MAX_RESTOCK_BATCH)
+        after = graphene.ID(required=False)
 
     success_message = graphene.String()
+    updated_count = graphene.Int()
     updated_products = graphene.List(LowStockProductType)
+    end_cursor = graphene.ID()
+    has_next_page = graphene.Boolean()
 
-    def mutate(self, info):
-        low_stock_products = Product.objects.filter(stock__lt=10)
-        updated_products = []
-        for product in low_stock_products:
-            product.stock += 10
-            product.save()
-            updated_products.append(product)
+    def mutate(self, info, threshold=10, increment=10, limit=MAX_RESTOCK_BATCH, after=None):
+        if increment <= 0:
+            raise Exception("Increment must be positive")
+        limit = max(1, min(limit, MAX_RESTOCK_BATCH))
+        with transaction.atomic():
+            low_stock_products = Product.objects.filter(stock__lt=threshold)
+            if after is not None:
+                low_stock_products = low_stock_products.filter(id__gt=after)
+            # the next page of low-stock ids, locked until the update commits
+            ids = list(
+                low_stock_products.select_for_update().order_by('id').values_list('id', flat=True)[:limit + 1]
+            )
+            has_next_page = len(ids) > limit
+            ids = ids[:limit]
+            updated_count = Product.objects.filter(id__in=ids).update(stock=F('stock') + increment)
+            invalidate_models(Product)
+        updated_products = list(Product.objects.filter(id__in=ids).only('id', 'name', 'stock').order_by('id'))
         
         return UpdateLowStockProducts(
-            success_message=f"Updated {len(updated_products)} low-stock products", # type: ignore
-            updated_products=updated_products # type: ignore
+            success_message=f"Updated {updated_count} low-stock products", # type: ignore
+            updated_count=updated_count, # type: ignore
+            updated_products=updated_products, # type: ignore
+            end_cursor=ids[-1] if ids else after, # type: ignore
+            has_next_page=has_next_page # type: ignore
         )
 
-# class Mutation(graphene.ObjectType):
-#     update_low_stock_products = UpdateLowStockProducts.Field()
-
-# schema = graphene.Schema(mutation=Mutation)
+def _prefetched(instance, name):
+    cache = getattr(instance, '_prefetched_objects_cache', {})
+    if name in cache:
+        return list(cache[name])
+    return None
 
 class CustomerType(DjangoObjectType):
+    keyset_key = 'created_at'
+    field_costs = {'orders': FieldCost(list_size=20)}
+    orders = graphene.List(graphene.NonNull(lambda: OrderType), required=True)
+
     class Meta:
         model = Customer
-        fields = ('id', 'name', 'email', 'phone', 'created_at')
+        fields = ('id', 'name', 'email', 'phone', 'created_at', 'last_order_date', 'order_count', 'total_spend', 'orders')
         filterset_class = CustomerFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = KeysetConnection
+
+    def resolve_orders(self, info):
+        orders = _prefetched(self, 'orders')
+        if orders is not None:
+            return orders
+        loader = get_loaders(info).get('orders_by_customer', info)
+        if is_async(info):
+            return loader.aload(self.pk)
+        return loader.load(self.pk)
 
 class ProductType(DjangoObjectType):
+    keyset_key = 'id'
+    # popular products collect far more orders than a customer does
+    field_costs = {'orders': FieldCost(cost=2, list_size=100)}
+    orders = graphene.List(graphene.NonNull(lambda: OrderType), required=True)
+
     class Meta:
         model = Product
-        fields = ('id', 'name', 'price', 'stock')
+        fields = ('id', 'name', 'price', 'stock', 'orders')
         filterset_class = ProductFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = KeysetConnection
+
+    def resolve_orders(self, info):
+        orders = _prefetched(self, 'orders')
+        if orders is not None:
+            return orders
+        loader = get_loaders(info).get('orders_by_product', info)
+        if is_async(info):
+            return loader.aload(self.pk)
+        return loader.load(self.pk)
+
+class OrderItemType(DjangoObjectType):
+    field_columns = {'line_total': ('quantity', 'unit_price')}
+    line_total = graphene.Decimal()
+
+    class Meta:
+        model = OrderItem
+        fields = ('product', 'quantity', 'unit_price')
+
+    def resolve_line_total(self, info):
+        return self.line_total
 
 class OrderType(DjangoObjectType):
+    keyset_key = 'order_date'
+    field_costs = {'products': FieldCost(list_size=5), 'items': FieldCost(list_size=5)}
+    products = graphene.List(graphene.NonNull(ProductType), required=True)
+    items = graphene.List(graphene.NonNull(OrderItemType), required=True)
+
     class Meta:
         model = Order
-        fields = ('id', 'customer', 'products', 'order_date', 'total_amount')
+        fields = ('id', 'customer', 'products', 'items', 'order_date', 'total_amount')
         filterset_class = OrderFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = KeysetConnection
+
+    def resolve_customer(self, info):
+        if Order.customer.is_cached(self):
+            return self.customer
+        loader = get_loaders(info).get('customer', info)
+        if is_async(info):
+            return loader.aload(self.customer_id)
+        return loader.load(self.customer_id)
+
+    def resolve_products(self, info):
+        products = _prefetched(self, 'products')
+        if products is not None:
+            return products
+        loader = get_loaders(info).get('products_by_order', info)
+        if is_async(info):
+            return loader.aload(self.pk)
+        return loader.load(self.pk)
+
+    def resolve_items(self, info):
+        items = _prefetched(self, 'items')
+        if items is not None:
+            return items
+        loader = get_loaders(info).get('items_by_order', info)
+        if is_async(info):
+            return loader.aload(self.pk)
+        return loader.load(self.pk)
+
+class DailySalesType(DjangoObjectType):
+    class Meta:
+        model = DailySales
+        fields = ('day', 'order_count', 'items_sold', 'revenue')
+
+class ProductSalesType(DjangoObjectType):
+    class Meta:
+        model = DailyProductSales
+        fields = ('product', 'order_count', 'quantity', 'revenue')
+
+class CustomerSalesType(DjangoObjectType):
+    class Meta:
+        model = DailyCustomerSales
+        fields = ('customer', 'order_count', 'revenue')
+
+class PercentileType(graphene.ObjectType):
+    percentile = graphene.Float()
+    value = graphene.Decimal()
+
+class CohortType(graphene.ObjectType):
+    month = graphene.Date()
+    customers = graphene.Int()
+    retention = graphene.List(graphene.Float)
+
+# orderAnalytics loads every order of its range into memory
+MAX_ANALYTICS_DAYS = 366
+
+def _dollars(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+class OrderReport:
+    """Orders of a date range as NumPy columns; line items load on first use."""
+
+    def __init__(self, analytics, start, end, percentiles, limit):
+        self.analytics = analytics
+        self.start, self.end = start, end
+        self.percentiles = percentiles
+        self.limit = limit
+        self.orders = analytics.load_orders(start, end)
+
+    @cached_property
+    def items(self):
+        return self.analytics.load_items(self.orders, self.start, self.end)
+
+class OrderAnalyticsType(graphene.ObjectType):
+    """Computed from an ``OrderReport``; each field runs only its own group-by."""
+    cache_models = (Order, OrderItem, Customer)
+    field_costs = {
+        'sales_by_day': FieldCost(list_size=31),
+    }
+
+    order_count = graphene.Int()
+    revenue = graphene.Decimal()
+    order_value_percentiles = graphene.List(PercentileType)
+    cohorts = graphene.List(CohortType)
+    sales_by_day = graphene.List(graphene.NonNull(DailySalesType))
+    top_products = graphene.List(graphene.NonNull(ProductSalesType))
+    top_customers = graphene.List(graphene.NonNull(CustomerSalesType))
+
+    def resolve_order_count(report, info):
+        return len(report.orders)
+
+    def resolve_revenue(report, info):
+        return _dollars(report.orders.totals.sum())
+
+    def resolve_order_value_percentiles(report, info):
+        values = report.analytics.order_value_percentiles(report.orders, report.percentiles)
+        return [PercentileType(percentile=p, value=_dollars(value)) for p, value in zip(report.percentiles, values)] # type: ignore
+
+    def resolve_cohorts(report, info):
+        first_orders = report.analytics.first_order_days(report.start, report.end)
+        months, sizes, retention = report.analytics.cohort_retention(report.orders, first_orders)
+        return [
+            CohortType(month=month.item(), customers=int(size), retention=[round(float(share), 4) for share in shares]) # type: ignore
+            for month, size, shares in zip(months, sizes, retention)
+        ]
+
+    def resolve_sales_by_day(report, info):
+        days, counts, sold, revenue = report.analytics.sales_by_day(report.orders, report.items)
+        return [
+            DailySales(day=day.item(), order_count=int(count), items_sold=int(units), revenue=_dollars(cents))
+            for day, count, units, cents in zip(days, counts, sold, revenue)
+        ]
+
+    def resolve_top_products(report, info):
+        ids, counts, quantities, revenue = report.analytics.top_products(report.items, report.limit)
+        products = Product.objects.in_bulk(ids.tolist())
+        return [
+            DailyProductSales(product=products[pk], order_count=int(count), quantity=int(units), revenue=_dollars(cents))
+            for pk, count, units, cents in zip(ids.tolist(), counts, quantities, revenue)
+        ]
+
+    def resolve_top_customers(report, info):
+        ids, counts, revenue = report.analytics.top_customers(report.orders, report.limit)
+        customers = Customer.objects.in_bulk(ids.tolist())
+        return [
+            DailyCustomerSales(customer=customers[pk], order_count=int(count), revenue=_dollars(cents))
+            for pk, count, cents in zip(ids.tolist(), counts, revenue)
+        ]
 
 class CustomerInput(graphene.InputObjectType):
     name = graphene.String(required=True)
@@ -75,15 +280,30 @@ class ProductInput(graphene.InputObjectType):
     price = graphene.Decimal(required=True)
     stock = graphene.Int(required=False, default_value=0)
 
+class OrderItemInput(graphene.InputObjectType):
+    product_id = graphene.ID(required=True)
+    quantity = graphene.Int(required=False, default_value=1)
+
 class OrderInput(graphene.InputObjectType):
     customer_id = graphene.ID(required=True)
-    product_ids = graphene.List(graphene.ID, required=True)
+    # each product id adds one unit and each item its quantity; repeats add up
+    product_ids = graphene.List(graphene.ID, required=False)
+    items = graphene.List(graphene.NonNull(OrderItemInput), required=False)
     order_date = graphene.DateTime(required=False)
 
+class BulkOrderInput(graphene.InputObjectType):
+    orders = graphene.List(OrderInput, required=True)
+
 class ErrorType(graphene.ObjectType):
     index = graphene.Int(required=False)
     message = graphene.String(required=False)
 
+class StockResultType(graphene.ObjectType):
+    product_id = graphene.ID()
+    requested = graphene.Int()
+    stock = graphene.Int()
+    sufficient = graphene.Boolean()
+
 class CustomerFilterInput(graphene.InputObjectType):
     name = graphene.String()
     email = graphene.String()
@@ -137,25 +357,12 @@ class BulkCreateCustomers(graphene.Mutation):
     customers = graphene.List(CustomerType)
     errors = graphene.List(ErrorType)
     
-    @transaction.atomic
     def mutate(self, info, input):
-        customers = []
-        errors = []
-        
-        for index, customer_data in enumerate(input.customers):
-            try:
-                customer = Customer(
-                    name=customer_data.name,
-                    email=customer_data.email,
-                    phone=customer_data.phone or ''
-                )
-                customer.full_clean()
-                customer.save()
-                customers.append(customer)
-            except (ValidationError, IntegrityError) as e:
-                errors.append(ErrorType(index=index, message=str(e))) # type: ignore
-        
-        return BulkCreateCustomers(customers=customers, errors=errors) # type: ignore
+        customers, errors = bulk_create_customers(input.customers)
+        return BulkCreateCustomers(
+            customers=customers, # type: ignore
+            errors=[ErrorType(index=index, message=message) for index, message in errors] # type: ignore
+        )
 
 class CreateProduct(graphene.Mutation):
     class Arguments:
@@ -181,54 +388,147 @@ class CreateOrder(graphene.Mutation):
         input = OrderInput(required=True)
     
     order = graphene.Field(OrderType)
+    stock = graphene.List(StockResultType)
     
     def mutate(self, info, input):
         try:
-            if not input.product_ids:
+            quantities = order_quantities(input)
+            if not quantities:
                 raise Exception("At least one product is required")
             
             customer = Customer.objects.filter(id=input.customer_id).first()
             if not customer:
                 raise Exception("Invalid customer ID")
             
-            products = Product.objects.filter(id__in=input.product_ids)
-            if not products or len(products) != len(input.product_ids):
+            prices = dict(Product.objects.filter(id__in=quantities).values_list('id', 'price'))
+            if len(prices) != len(quantities):
                 raise Exception("One or more invalid product IDs")
             
-            with transaction.atomic():
-                order = Order.objects.create(
-                    customer=customer,
-                    order_date=input.order_date or datetime.now()
-                )
-                order.products.set(products)
-                order.save()
-                return CreateOrder(order=order) # type: ignore
+            try:
+                with transaction.atomic():
+                    reserve_stock(quantities)
+                    order = Order.objects.create(
+                        customer=customer,
+                        order_date=input.order_date or timezone.now(),
+                        total_amount=sum(prices[pk] * quantity for pk, quantity in quantities.items())
+                    )
+                    items = OrderItem.objects.bulk_create(
+                        OrderItem(order=order, product_id=pk, quantity=quantity, unit_price=prices[pk])
+                        for pk, quantity in quantities.items()
+                    )
+                    # the post_save handler has folded in the order itself
+                    record_new_orders([(order, items)], items_only=True)
+            except InsufficientStock:
+                # the atomic block has already undone the partial reservation
+                return CreateOrder.payload(None, quantities, reserved=False)
+            invalidate_models(OrderItem, Product)
+            return CreateOrder.payload(order, quantities, reserved=True)
         except Exception as e:
             raise Exception(f"Error creating order: {str(e)}")
 
+    @classmethod
+    def payload(cls, order, quantities, reserved):
+        # stock levels are only read if the client selects ``stock``
+        payload = cls(order=order)
+        payload.quantities = quantities
+        payload.reserved = reserved
+        return payload
+
+    def resolve_stock(self, info):
+        quantities, reserved = self.quantities, self.reserved
+        return [
+            StockResultType(product_id=pk, requested=requested, stock=stock, sufficient=sufficient)
+            for pk, requested, stock, sufficient in stock_report(quantities, reserved)
+        ]
+
+class BulkCreateOrders(graphene.Mutation):
+    class Arguments:
+        input = BulkOrderInput(required=True)
+
+    orders = graphene.List(OrderType)
+    errors = graphene.List(ErrorType)
+
+    def mutate(self, info, input):
+        orders, errors = bulk_create_orders(input.orders)
+        get_loaders(info).prime(orders, selection_tree(info).get('orders', {}))
+        return BulkCreateOrders(
+            orders=orders, # type: ignore
+            errors=[ErrorType(index=index, message=message) for index, message in errors] # type: ignore
+        )
+
 class Query(graphene.ObjectType):
+    field_costs = {
+        'sales_by_day': FieldCost(list_size=31),
+        'top_products': FieldCost(list_size=10),
+        'top_customers': FieldCost(list_size=10),
+        # reads every order in the range, at most MAX_ANALYTICS_DAYS
+        'order_analytics': FieldCost(cost=100),
+    }
     hello = graphene.String()
-    all_customers = DjangoFilterConnectionField(CustomerType, filterset_class=CustomerFilter)
-    all_products = DjangoFilterConnectionField(ProductType, filterset_class=ProductFilter)
-    all_orders = DjangoFilterConnectionField(OrderType, filterset_class=OrderFilter)
+    all_customers = CRMFilterConnectionField(CustomerType, filterset_class=CustomerFilter)
+    all_products = CRMFilterConnectionField(ProductType, filterset_class=ProductFilter)
+    all_orders = CRMFilterConnectionField(OrderType, filterset_class=OrderFilter)
+    # served from the daily rollup tables, see crm.rollups
+    sales_by_day = graphene.List(
+        graphene.NonNull(DailySalesType), required=True,
+        start=graphene.Date(required=True), end=graphene.Date(required=True),
+    )
+    top_products = graphene.List(
+        graphene.NonNull(ProductSalesType), required=True,
+        start=graphene.Date(required=True), end=graphene.Date(required=True), limit=graphene.Int(default_value=10),
+    )
+    top_customers = graphene.List(
+        graphene.NonNull(CustomerSalesType), required=True,
+        start=graphene.Date(required=True), end=graphene.Date(required=True), limit=graphene.Int(default_value=10),
+    )
+    # computed with NumPy over the orders, see crm.analytics
+    order_analytics = graphene.Field(
+        OrderAnalyticsType,
+        start=graphene.Date(required=True), end=graphene.Date(required=True),
+        percentiles=graphene.List(graphene.NonNull(graphene.Float), default_value=[50, 90, 99]),
+        limit=graphene.Int(default_value=10, description="Rows in topProducts and topCustomers."),
+    )
     
     def resolve_hello(self, info):
         return "Hello, GraphQL!"
     
     def resolve_all_customers(self, info, **kwargs):
-        return CustomerFilter(kwargs).qs
+        # the connection fields apply their filterset to whatever is returned here
+        return optimize(Customer.objects.all(), info)
     
     def resolve_all_products(self, info, **kwargs):
-        return ProductFilter(kwargs).qs
+        return optimize(Product.objects.all(), info)
     
     def resolve_all_orders(self, info, **kwargs):
-        return OrderFilter(kwargs).qs
+        return optimize(Order.objects.all(), info)
+    
+    def resolve_sales_by_day(self, info, start, end):
+        return sales_by_day(start, end)
+    
+    def resolve_top_products(self, info, start, end, limit=10):
+        return top_products(start, end, limit)
+    
+    def resolve_top_customers(self, info, start, end, limit=10):
+        return top_customers(start, end, limit)
+    
+    def resolve_order_analytics(self, info, start, end, percentiles=(50, 90, 99), limit=10):
+        try:
+            from . import analytics
+        except ImportError:
+            raise Exception("Order analytics require NumPy")
+        if any(not 0 <= p <= 100 for p in percentiles):
+            raise Exception("Percentiles must be between 0 and 100")
+        if not timedelta(0) <= end - start < timedelta(days=MAX_ANALYTICS_DAYS):
+            raise Exception(f"Order analytics cover 1 to {MAX_ANALYTICS_DAYS} days")
+        return OrderReport(analytics, start, end, percentiles, max(1, min(limit, TOP_LIMIT)))
 
 class Mutation(graphene.ObjectType):
     create_customer = CreateCustomer.Field()
     bulk_create_customers = BulkCreateCustomers.Field()
     create_product = CreateProduct.Field()
     create_order = CreateOrder.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
+    update_low_stock_products = UpdateLowStockProducts.Field()
 
 schema = graphene.Schema(mutation=Mutation)
 
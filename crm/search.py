@@ -0,0 +1,164 @@
+"""Indexed substring search for the ``icontains`` name/email filters.
+
+The backend is picked from the database vendor unless ``CRM_SEARCH_BACKEND``
+names one explicitly:
+
+* SQLite: FTS5 tables with the trigram tokenizer, kept in sync with their
+  source tables by triggers and ranked with ``bm25``.
+* PostgreSQL: ``pg_trgm`` GIN indexes on ``UPPER(column)`` (the expression
+  Django's ``icontains`` compiles to), ranked by trigram word similarity.
+* Anything else: plain ``icontains``.
+
+Trigram matching has the same case-insensitive substring semantics as
+``icontains`` for terms of three or more characters; shorter terms fall back
+to ``icontains``.
+"""
+from django.conf import settings
+from django.db import connections
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+# searchable source table -> indexed columns
+SEARCH_COLUMNS = {
+    'crm_customer': ('name', 'email'),
+    'crm_product': ('name',),
+}
+
+MIN_TERM_LENGTH = 3
+
+
+def _resolve(model, field_name):
+    """Split ``customer__name`` into (``customer``, target model, ``name``)."""
+    *path, column = field_name.split('__')
+    for part in path:
+        model = model._meta.get_field(part).related_model
+    return '__'.join(path), model, column
+
+
+class IcontainsSearchBackend:
+    def filter(self, queryset, field_name, value):
+        return queryset.filter(**{f'{field_name}__icontains': value})
+
+    def install(self, schema_editor):
+        pass
+
+    def uninstall(self, schema_editor):
+        pass
+
+
+class SQLiteFTSSearchBackend(IcontainsSearchBackend):
+    def filter(self, queryset, field_name, value):
+        path, model, column = _resolve(queryset.model, field_name)
+        table = model._meta.db_table
+        if len(value) < MIN_TERM_LENGTH or column not in SEARCH_COLUMNS.get(table, ()):
+            return super().filter(queryset, field_name, value)
+        fts = f'{table}_fts'
+        match = '%s : "%s"' % (column, value.replace('"', '""'))
+        if path or fts in queryset.query.extra_tables:
+            ids = RawSQL(f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s', [match])
+            return queryset.filter(**{f'{path or "pk"}__in': ids})
+        return queryset.extra(
+            tables=[fts],
+            where=[f'{fts}.rowid = {table}.id', f'{fts} MATCH %s'],
+            params=[match],
+            select={'search_rank': f'{fts}.rank'},
+            order_by=['search_rank', 'id'],
+        )
+
+    def install(self, schema_editor):
+        with schema_editor.connection.cursor() as cursor:
+            for table, columns in SEARCH_COLUMNS.items():
+                fts = f'{table}_fts'
+                cols = ', '.join(columns)
+                new = ', '.join(f'new.{c}' for c in columns)
+                old = ', '.join(f'old.{c}' for c in columns)
+                cursor.execute(
+                    f"SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s AND name LIKE %s",
+                    [table, f'{fts}_%'],
+                )
+                if cursor.fetchone()[0] == 3:
+                    continue
+                # Django rebuilds SQLite tables for many ALTERs, which drops
+                # their triggers; recreate them and resync the index.
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                    f"{cols}, content='{table}', content_rowid='id', tokenize='trigram')"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+                    f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+                    f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END"
+                )
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+                    f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+                    f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END"
+                )
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    def uninstall(self, schema_editor):
+        with schema_editor.connection.cursor() as cursor:
+            for table in SEARCH_COLUMNS:
+                fts = f'{table}_fts'
+                for suffix in ('ai', 'ad', 'au'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+                cursor.execute(f'DROP TABLE IF EXISTS {fts}')
+
+
+class PostgresTrigramSearchBackend(IcontainsSearchBackend):
+    def filter(self, queryset, field_name, value):
+        queryset = super().filter(queryset, field_name, value)
+        path, _, column = _resolve(queryset.model, field_name)
+        if path or len(value) < MIN_TERM_LENGTH or 'search_rank' in queryset.query.annotations:
+            return queryset
+        from django.contrib.postgres.search import TrigramWordSimilarity
+        return queryset.annotate(search_rank=TrigramWordSimilarity(value, column)).order_by('-search_rank', 'pk')
+
+    def install(self, schema_editor):
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, columns in SEARCH_COLUMNS.items():
+            for column in columns:
+                schema_editor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm ON {table} '
+                    f'USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+                )
+
+    def uninstall(self, schema_editor):
+        for table, columns in SEARCH_COLUMNS.items():
+            for column in columns:
+                schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm')
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTSSearchBackend,
+    'postgresql': PostgresTrigramSearchBackend,
+}
+
+
+def get_search_backend(connection=None):
+    connection = connection or connections['default']
+    path = getattr(settings, 'CRM_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    return VENDOR_BACKENDS.get(connection.vendor, IcontainsSearchBackend)()
+
+
+def install_search(apps, schema_editor):
+    """Migration hook creating the backend's index structures."""
+    get_search_backend(schema_editor.connection).install(schema_editor)
+
+
+def uninstall_search(apps, schema_editor):
+    get_search_backend(schema_editor.connection).uninstall(schema_editor)
+
+
+def ensure_search_installed(sender, using, **kwargs):
+    """Re-create search triggers dropped by later table rebuilds."""
+    connection = connections[using]
+    if not set(SEARCH_COLUMNS) <= set(connection.introspection.table_names()):
+        return
+    with connection.schema_editor() as schema_editor:
+        get_search_backend(connection).install(schema_editor)
@@ -0,0 +1,99 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from .aggregates import record_new_order, record_total_change, refresh_customer_aggregates, refresh_order_customers
+from .models import LINE_TOTAL, Customer, Product, Order, OrderItem
+from .response_cache import invalidate_models
+from .rollups import order_day, record_new_orders, refresh_order_days, refresh_rollups
+
+
+def recalculate_totals(order_ids):
+    """Recompute ``total_amount`` for ``order_ids`` with a single UPDATE."""
+    totals = (
+        OrderItem.objects.filter(order_id=OuterRef('pk'))
+        .values('order_id')
+        .annotate(total=Sum(LINE_TOTAL))
+        .values('total')
+    )
+    Order.objects.filter(pk__in=order_ids).update(
+        total_amount=Coalesce(Subquery(totals), Decimal('0.00'))
+    )
+
+
+@receiver(m2m_changed, sender=OrderItem)
+def update_order_total(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # the affected orders are gone from the through table after the clear
+        instance._cleared_order_ids = list(instance.orders.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        total = instance.items.aggregate(total=Sum(LINE_TOTAL))['total'] or Decimal('0.00')
+        total = total.quantize(Decimal('0.01'))
+        Order.objects.filter(pk=instance.pk).update(total_amount=total)
+        record_total_change(instance, instance.total_amount, total)
+        instance.total_amount = total
+        refresh_rollups([order_day(instance.order_date)])
+        return
+    if action == 'post_clear':
+        order_ids = instance.__dict__.pop('_cleared_order_ids', [])
+    else:
+        order_ids = pk_set
+    recalculate_totals(order_ids)
+    refresh_order_customers(order_ids)
+    refresh_order_days(order_ids)
+
+
+@receiver(post_save, sender=Order)
+def update_customer_aggregates(sender, instance, created, raw=False, **kwargs):
+    # totals change through the products relation; other edits of saved
+    # orders are left to reconcile_customer_aggregates and rebuild_rollups
+    if created and not raw:
+        record_new_order(instance)
+        record_new_orders([(instance, [])])
+
+
+def _refresh_deleted(connection):
+    customer_ids, days = connection.crm_deleted_orders
+    if not customer_ids:
+        return
+    connection.crm_deleted_orders = (set(), set())
+    refresh_customer_aggregates(customer_ids)
+    refresh_rollups(days)
+
+
+@receiver(post_delete, sender=Order)
+def remove_from_aggregates(sender, instance, using, **kwargs):
+    # a cascade deletes many orders, mostly of the same customers and days;
+    # collect them and recompute each once, when the deletion commits. The
+    # first callback refreshes everything collected, the rest find nothing
+    # left. Orders of rolled back deletes are recomputed with the next ones.
+    connection = transaction.get_connection(using)
+    if not hasattr(connection, 'crm_deleted_orders'):
+        connection.crm_deleted_orders = (set(), set())
+    customer_ids, days = connection.crm_deleted_orders
+    customer_ids.add(instance.customer_id)
+    days.add(order_day(instance.order_date))
+    transaction.on_commit(lambda: _refresh_deleted(connection), using=using)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def invalidate_cached_responses(sender, **kwargs):
+    invalidate_models(sender)
+
+
+@receiver(m2m_changed, sender=OrderItem)
+def invalidate_cached_order_products(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_models(Order, OrderItem, Product)
@@ -1,3 +1,1452 @@
-from django.test import TestCase
+import importlib.util
+import io
+import math
+import json
+import unittest
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+from datetime import timedelta
+from decimal import Decimal
+import graphene
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, Client, RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphql_relay import from_global_id
+from alx_backend_graphql_crm.schema import schema
+from .documents import document_cache, query_hash
+from .aggregates import reconcile_customer_aggregates, refresh_customer_aggregates
+from .bulk import bulk_create_orders
+from .cleanup import delete_inactive_customers
+from .export import export_rows
+from .importer import import_records, read_records
+from .cron import LOW_STOCK_MUTATION, reminder_logger, send_order_reminders
+from .jobs import HTTPExecutor, JobError, run_job
+from .loaders import Loaders
+from .management.commands.stress_stock_reservation import place_orders
+from .models import Customer, DailyCustomerSales, Product, Order, OrderItem
+from .response_cache import get_response_cache
+from .rollups import _add, rebuild_rollups, top_products
+from .signals import recalculate_totals
+from .tracing import Tracer, metrics
+from .views import CRMGraphQLView
 
-# Create your tests here.
+
+def seed_orders(count, products_per_order=2):
+    customers = Customer.objects.bulk_create(
+        Customer(name=f'Customer {i}', email=f'customer{i}@example.com') for i in range(count)
+    )
+    products = Product.objects.bulk_create(
+        Product(name=f'Product {i}', price=Decimal('10.00'), stock=5) for i in range(products_per_order)
+    )
+    orders = Order.objects.bulk_create(
+        Order(customer=customer, total_amount=Decimal('10.00') * products_per_order) for customer in customers
+    )
+    OrderItem.objects.bulk_create(
+        OrderItem(order_id=order.pk, product_id=product.pk, unit_price=product.price)
+        for order in orders for product in products
+    )
+    return customers, products, orders
+
+
+def add_products(order, *products):
+    for product in products:
+        order.products.add(product, through_defaults={'unit_price': product.price})
+
+
+class DataLoaderTests(TestCase):
+    ORDERS_QUERY = """
+        query ($first: Int) {
+            allOrders(first: $first) {
+                edges { node { id customer { email orders { id } } products { name } } }
+            }
+        }
+    """
+
+    def execute(self, query, **variables):
+        result = schema.execute(query, variable_values=variables, context_value=SimpleNamespace())
+        self.assertIsNone(result.errors)
+        return result.data
+
+    def test_order_relations_cost_fixed_number_of_queries(self):
+        seed_orders(50)
+        # page joined with customers, customer orders, order products
+        with self.assertNumQueries(3):
+            small = self.execute(self.ORDERS_QUERY, first=5)
+        with self.assertNumQueries(3):
+            large = self.execute(self.ORDERS_QUERY, first=50)
+        self.assertEqual(len(small['allOrders']['edges']), 5)
+        self.assertEqual(len(large['allOrders']['edges']), 50)
+        node = large['allOrders']['edges'][0]['node']
+        self.assertEqual(len(node['products']), 2)
+        self.assertEqual(node['customer']['orders'], [{'id': node['id']}])
+
+    def test_reverse_relations_are_batched(self):
+        seed_orders(20)
+        query = """
+            query {
+                allCustomers { edges { node { orders { totalAmount } } } }
+                allProducts { edges { node { orders { id } } } }
+            }
+        """
+        # page + batched relation per connection
+        with self.assertNumQueries(4):
+            data = self.execute(query)
+        self.assertEqual(len(data['allCustomers']['edges']), 20)
+        self.assertEqual(len(data['allProducts']['edges'][0]['node']['orders']), 20)
+
+    def test_only_selected_relations_are_primed(self):
+        _, _, orders = seed_orders(20)
+        loaders = Loaders()
+        # orders read without their products, then one that selects them
+        loaders.prime(orders, {'customer': {}})
+        loaders.prime(orders[:1], {'products': {'name': {}}})
+        with self.assertNumQueries(1) as ctx:
+            loaders.products_by_order.load(orders[0].pk)
+        self.assertIn(f'"order_id" IN ({orders[0].pk})', ctx.captured_queries[0]['sql'])
+
+    def test_items_keep_their_order_on_every_path(self):
+        customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        first, second = Product.objects.bulk_create(
+            Product(name=name, price=Decimal('1.00'), stock=5) for name in ('First', 'Second')
+        )
+        order = Order.objects.create(customer=customer)
+        add_products(order, second, first)
+        data = self.execute("""
+            query {
+                allOrders { edges { node { items { product { name } } } } }
+                allCustomers { edges { node { orders { items { product { name } } } } } }
+            }
+        """)
+        prefetched = data['allOrders']['edges'][0]['node']['items']
+        loaded = data['allCustomers']['edges'][0]['node']['orders'][0]['items']
+        self.assertEqual(prefetched, [{'product': {'name': 'Second'}}, {'product': {'name': 'First'}}])
+        self.assertEqual(loaded, prefetched)
+
+
+class QueryOptimizerTests(TestCase):
+    def test_only_selected_columns_are_loaded(self):
+        seed_orders(3)
+        query = """
+            query {
+                allOrders { edges { node { ...OrderFields } } }
+            }
+            fragment OrderFields on OrderType {
+                customer { email }
+                products { name }
+            }
+        """
+        with self.assertNumQueries(2) as ctx:
+            result = schema.execute(query, context_value=SimpleNamespace())
+        self.assertIsNone(result.errors)
+        page_sql, products_sql = ctx.captured_queries[0]['sql'], ctx.captured_queries[1]['sql']
+        self.assertIn('"crm_customer"."email"', page_sql)
+        self.assertNotIn('total_amount', page_sql)
+        self.assertNotIn('"crm_customer"."phone"', page_sql)
+        self.assertIn('"crm_product"."name"', products_sql)
+        self.assertNotIn('"crm_product"."price"', products_sql)
+        self.assertEqual(result.data['allOrders']['edges'][0]['node']['products'][0]['name'], 'Product 0')
+
+    def test_computed_fields_load_their_columns(self):
+        seed_orders(20)
+        query = """
+            query {
+                allOrders(first: 20) { edges { node { items { lineTotal } } } }
+                allCustomers { edges { node { orders { items { lineTotal } } } } }
+            }
+        """
+        # two pages, the customers' orders and two prefetches of items
+        with self.assertNumQueries(5):
+            result = schema.execute(query, context_value=SimpleNamespace())
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data['allOrders']['edges'][0]['node']['items'], [{'lineTotal': '10.00'}] * 2)
+
+
+class BulkCreateCustomersTests(TestCase):
+    MUTATION = """
+        mutation ($customers: [CustomerInput]!) {
+            bulkCreateCustomers(input: {customers: $customers}) {
+                customers { email }
+                errors { index message }
+            }
+        }
+    """
+
+    def run_bulk(self, customers):
+        result = schema.execute(self.MUTATION, variable_values={'customers': customers})
+        self.assertIsNone(result.errors)
+        return result.data['bulkCreateCustomers']
+
+    def test_reports_errors_per_index(self):
+        Customer.objects.create(name='Existing', email='taken@example.com')
+        data = self.run_bulk([
+            {'name': 'Ada', 'email': 'ada@example.com', 'phone': '+11234567890'},
+            {'name': 'Taken', 'email': 'taken@example.com'},
+            {'name': 'Bad phone', 'email': 'phone@example.com', 'phone': 'abc'},
+            {'name': 'Ada again', 'email': 'ada@example.com'},
+            {'name': 'Not an email', 'email': 'nope'},
+        ])
+        self.assertEqual(data['customers'], [{'email': 'ada@example.com'}])
+        self.assertEqual([error['index'] for error in data['errors']], [1, 2, 3, 4])
+        self.assertIn('already exists', data['errors'][0]['message'])
+        self.assertIn('Invalid phone format', data['errors'][1]['message'])
+        self.assertEqual(Customer.objects.count(), 2)
+
+    def test_query_count_grows_only_with_insert_batches(self):
+        def rows(prefix, count):
+            return [{'name': f'{prefix} {i}', 'email': f'{prefix}{i}@example.com'} for i in range(count)]
+
+        with self.assertNumQueries(4) as small:
+            self.run_bulk(rows('small', 5))
+        # the backend caps the parameters of one INSERT, so bulk_create
+        # splits a large chunk into several statements
+        fields = [field for field in Customer._meta.concrete_fields if not field.primary_key]
+        batches = math.ceil(200 / connection.ops.bulk_batch_size(fields, [None] * 200))
+        self.assertGreater(batches, 1)
+        with self.assertNumQueries(len(small.captured_queries) + batches - 1):
+            data = self.run_bulk(rows('large', 200))
+        self.assertEqual(len(data['customers']), 200)
+        self.assertEqual(data['errors'], [])
+
+
+class BulkCreateOrdersTests(TestCase):
+    MUTATION = """
+        mutation ($orders: [OrderInput]!) {
+            bulkCreateOrders(input: {orders: $orders}) {
+                orders { totalAmount customer { email } products { name } }
+                errors { index message }
+            }
+        }
+    """
+
+    def test_creates_orders_with_in_memory_totals(self):
+        customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        cheap = Product.objects.create(name='Cheap', price=Decimal('2.50'), stock=100)
+        dear = Product.objects.create(name='Dear', price=Decimal('10.00'), stock=100)
+        orders = [{'customerId': customer.pk, 'productIds': [cheap.pk, dear.pk]} for _ in range(100)]
+        orders += [
+            {'customerId': 999, 'productIds': [cheap.pk]},
+            {'customerId': customer.pk, 'productIds': [999]},
+            {'customerId': customer.pk, 'productIds': []},
+        ]
+        # customers, products, savepoint, stock reservation in its own
+        # savepoint, orders, line items, customer aggregates, the day's
+        # rollups (six), release, then one batched read each for the
+        # payload's customers and products
+        with self.assertNumQueries(18):
+            result = schema.execute(
+                self.MUTATION, variable_values={'orders': orders}, context_value=SimpleNamespace()
+            )
+        self.assertIsNone(result.errors)
+        data = result.data['bulkCreateOrders']
+        self.assertEqual(len(data['orders']), 100)
+        self.assertEqual(data['orders'][0]['totalAmount'], '12.50')
+        self.assertEqual(
+            data['errors'],
+            [
+                {'index': 100, 'message': 'Invalid customer ID'},
+                {'index': 101, 'message': 'One or more invalid product IDs'},
+                {'index': 102, 'message': 'At least one product is required'},
+            ]
+        )
+        self.assertEqual(Order.objects.count(), 100)
+        self.assertEqual(OrderItem.objects.count(), 200)
+        self.assertEqual(set(Product.objects.values_list('stock', flat=True)), {0})
+
+    def test_order_dates_are_kept(self):
+        customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        product = Product.objects.create(name='Cheap', price=Decimal('2.50'), stock=100)
+        orders = [
+            {'customerId': customer.pk, 'productIds': [product.pk], 'orderDate': '2020-01-01T12:00:00+00:00'},
+            {'customerId': customer.pk, 'productIds': [product.pk]},
+        ]
+        result = schema.execute(self.MUTATION, variable_values={'orders': orders}, context_value=SimpleNamespace())
+        self.assertIsNone(result.errors)
+        dates = [order.order_date for order in Order.objects.order_by('pk')]
+        self.assertEqual(dates[0].isoformat(), '2020-01-01T12:00:00+00:00')
+        self.assertEqual(dates[1].date(), timezone.now().date())
+
+    def test_orders_beyond_stock_are_rejected(self):
+        customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        cheap = Product.objects.create(name='Cheap', price=Decimal('2.50'), stock=2)
+        dear = Product.objects.create(name='Dear', price=Decimal('10.00'), stock=1)
+        rows = [
+            SimpleNamespace(customer_id=customer.pk, product_ids=ids, order_date=None)
+            for ids in ([cheap.pk, dear.pk], [dear.pk], [cheap.pk])
+        ]
+        orders, errors = bulk_create_orders(rows)
+        self.assertEqual([order.total_amount for order in orders], [Decimal('12.50'), Decimal('2.50')])
+        self.assertEqual(errors, [(1, 'Insufficient stock')])
+        self.assertEqual(dict(Product.objects.values_list('name', 'stock')), {'Cheap': 0, 'Dear': 0})
+
+
+class OrderTotalTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        self.cheap = Product.objects.create(name='Cheap', price=Decimal('2.50'), stock=10)
+        self.dear = Product.objects.create(name='Dear', price=Decimal('10.00'), stock=10)
+
+    def test_plain_save_is_one_query(self):
+        order = Order.objects.create(customer=self.customer)
+        with self.assertNumQueries(1):
+            order.save()
+
+    def test_total_follows_product_changes(self):
+        order = Order.objects.create(customer=self.customer)
+        add_products(order, self.cheap, self.dear)
+        self.assertEqual(order.total_amount, Decimal('12.50'))
+        order.products.remove(self.dear)
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal('2.50'))
+        self.dear.orders.add(order, through_defaults={'unit_price': self.dear.price, 'quantity': 2})
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal('22.50'))
+        self.cheap.orders.clear()
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal('20.00'))
+
+    def test_total_keeps_prices_paid(self):
+        order = Order.objects.create(customer=self.customer)
+        add_products(order, self.cheap, self.dear)
+        Product.objects.filter(pk=self.dear.pk).update(price=Decimal('99.00'))
+        recalculate_totals([order.pk])
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal('12.50'))
+
+    def test_create_order_mutation_query_count(self):
+        mutation = """
+            mutation ($input: OrderInput!) {
+                createOrder(input: $input) { order { totalAmount } }
+            }
+        """
+        variables = {'input': {'customerId': self.customer.pk, 'productIds': [self.cheap.pk, self.dear.pk]}}
+        # customer, prices, savepoint, stock reservation, insert, customer
+        # aggregates, the order's daily and customer rollups, line items,
+        # their daily and product rollups, release; each rollup is an insert
+        # and an update
+        with self.assertNumQueries(16):
+            result = schema.execute(mutation, variable_values=variables)
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data['createOrder']['order']['totalAmount'], '12.50')
+
+
+    def test_create_order_with_line_items(self):
+        mutation = """
+            mutation ($input: OrderInput!) {
+                createOrder(input: $input) {
+                    order { totalAmount items { product { name } quantity unitPrice lineTotal } }
+                }
+            }
+        """
+        items = [{'productId': self.cheap.pk, 'quantity': 3}, {'productId': self.dear.pk}]
+        variables = {'input': {'customerId': self.customer.pk, 'productIds': [self.cheap.pk], 'items': items}}
+        result = schema.execute(mutation, variable_values=variables, context_value=SimpleNamespace())
+        self.assertIsNone(result.errors)
+        order = result.data['createOrder']['order']
+        self.assertEqual(order['totalAmount'], '20.00')
+        self.assertEqual(order['items'], [
+            {'product': {'name': 'Cheap'}, 'quantity': 4, 'unitPrice': '2.50', 'lineTotal': '10.00'},
+            {'product': {'name': 'Dear'}, 'quantity': 1, 'unitPrice': '10.00', 'lineTotal': '10.00'},
+        ])
+        self.assertEqual(dict(Product.objects.values_list('name', 'stock')), {'Cheap': 6, 'Dear': 9})
+
+
+class StockReservationTests(TestCase):
+    MUTATION = """
+        mutation ($input: OrderInput!) {
+            createOrder(input: $input) {
+                order { totalAmount }
+                stock { productId requested stock sufficient }
+            }
+        }
+    """
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        self.cheap = Product.objects.create(name='Cheap', price=Decimal('2.50'), stock=1)
+        self.dear = Product.objects.create(name='Dear', price=Decimal('10.00'), stock=0)
+
+    def create_order(self, *products):
+        variables = {'input': {'customerId': self.customer.pk, 'productIds': [p.pk for p in products]}}
+        result = schema.execute(self.MUTATION, variable_values=variables)
+        self.assertIsNone(result.errors)
+        return result.data['createOrder']
+
+    def test_reserves_stock(self):
+        data = self.create_order(self.cheap)
+        self.assertEqual(data['order'], {'totalAmount': '2.50'})
+        self.assertEqual(
+            data['stock'], [{'productId': str(self.cheap.pk), 'requested': 1, 'stock': 0, 'sufficient': True}]
+        )
+
+    def test_shortfall_rolls_back(self):
+        data = self.create_order(self.cheap, self.dear)
+        self.assertIsNone(data['order'])
+        self.assertEqual(
+            sorted(data['stock'], key=lambda row: row['productId']),
+            [
+                {'productId': str(self.cheap.pk), 'requested': 1, 'stock': 1, 'sufficient': True},
+                {'productId': str(self.dear.pk), 'requested': 1, 'stock': 0, 'sufficient': False},
+            ]
+        )
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.cheap.pk).stock, 1)
+
+
+class StockReservationStressTests(TransactionTestCase):
+    def test_concurrent_orders_never_oversell(self):
+        customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        products = Product.objects.bulk_create(
+            Product(name=f'Product {i}', price=Decimal('1.00'), stock=20) for i in range(2)
+        )
+        placed, failed, elapsed = place_orders(customer, products, threads=8, attempts=10)
+        self.assertEqual(placed + failed, 80)
+        self.assertGreater(placed, 0)
+        self.assertGreater(placed / elapsed, 0)
+        self.assertEqual(Order.objects.count(), placed)
+        self.assertEqual(list(Product.objects.values_list('stock', flat=True)), [20 - placed] * 2)
+
+
+class UpdateLowStockProductsTests(TestCase):
+    MUTATION = """
+        mutation ($limit: Int, $after: ID) {
+            updateLowStockProducts(limit: $limit, after: $after) {
+                successMessage
+                updatedCount
+                updatedProducts { name stock }
+                endCursor
+                hasNextPage
+            }
+        }
+    """
+
+    def test_restocks_page_by_page(self):
+        Product.objects.bulk_create(
+            Product(name=f'Product {i}', price=Decimal('1.00'), stock=i) for i in range(20)
+        )
+        pages = []
+        variables = {'limit': 4, 'after': None}
+        while True:
+            # savepoint, page ids, update, release, page fetch
+            with self.assertNumQueries(5):
+                result = schema.execute(self.MUTATION, variable_values=variables)
+            self.assertIsNone(result.errors)
+            data = result.data['updateLowStockProducts']
+            pages.append(data)
+            if not data['hasNextPage']:
+                break
+            variables['after'] = data['endCursor']
+        self.assertEqual([page['updatedCount'] for page in pages], [4, 4, 2])
+        self.assertEqual(pages[0]['successMessage'], 'Updated 4 low-stock products')
+        self.assertEqual(
+            pages[0]['updatedProducts'][:2], [{'name': 'Product 0', 'stock': 10}, {'name': 'Product 1', 'stock': 11}]
+        )
+        self.assertEqual(
+            [product['name'] for page in pages for product in page['updatedProducts']],
+            [f'Product {i}' for i in range(10)]
+        )
+        self.assertFalse(Product.objects.filter(stock__lt=10).exists())
+
+
+class SearchFilterTests(TestCase):
+    def setUp(self):
+        ada = Customer.objects.create(name='Ada Lovelace', email='ada@example.com')
+        grace = Customer.objects.create(name='Grace Hopper', email='grace@navy.mil')
+        widget = Product.objects.create(name='Blue Widget', price=Decimal('1.00'))
+        gadget = Product.objects.create(name='Red Gadget', price=Decimal('1.00'))
+        add_products(Order.objects.create(customer=ada), widget)
+        add_products(Order.objects.create(customer=grace), gadget)
+
+    def names(self, query):
+        result = schema.execute(query, context_value=SimpleNamespace())
+        self.assertIsNone(result.errors)
+        connection = next(iter(result.data.values()))
+        return [edge['node'] for edge in connection['edges']]
+
+    def test_substring_matches_like_icontains(self):
+        self.assertEqual(self.names('{ allCustomers(name: "LOVEL") { edges { node { name } } } }'),
+                         [{'name': 'Ada Lovelace'}])
+        self.assertEqual(self.names('{ allCustomers(email: "navy", name: "hop") { edges { node { name } } } }'),
+                         [{'name': 'Grace Hopper'}])
+        # terms shorter than a trigram fall back to icontains
+        self.assertEqual(len(self.names('{ allCustomers(name: "a") { edges { node { name } } } }')), 2)
+        # ranked: the shorter name is the closer match
+        self.assertEqual(self.names('{ allProducts(name: "dget") { edges { node { name } } } }'),
+                         [{'name': 'Red Gadget'}, {'name': 'Blue Widget'}])
+
+    def test_related_name_filters(self):
+        self.assertEqual(
+            self.names('{ allOrders(customerName: "grace", productName: "gadget") { edges { node { customer { name } } } } }'),
+            [{'customer': {'name': 'Grace Hopper'}}]
+        )
+        self.assertEqual(self.names('{ allOrders(productName: "widget") { edges { node { customer { name } } } } }'),
+                         [{'customer': {'name': 'Ada Lovelace'}}])
+
+    def test_index_follows_updates_and_deletes(self):
+        Customer.objects.filter(name='Ada Lovelace').update(name='Ada Byron')
+        self.assertEqual(self.names('{ allCustomers(name: "lovelace") { edges { node { name } } } }'), [])
+        self.assertEqual(len(self.names('{ allCustomers(name: "byron") { edges { node { name } } } }')), 1)
+        Customer.objects.filter(name='Ada Byron').delete()
+        self.assertEqual(self.names('{ allCustomers(name: "byron") { edges { node { name } } } }'), [])
+
+
+class KeysetPaginationTests(TestCase):
+    QUERY = """
+        query ($first: Int, $after: String, $last: Int, $before: String) {
+            allOrders(first: $first, after: $after, last: $last, before: $before) {
+                edges { cursor node { totalAmount } }
+                pageInfo { hasNextPage hasPreviousPage endCursor startCursor }
+            }
+        }
+    """
+
+    def page(self, **variables):
+        result = schema.execute(self.QUERY, variable_values=variables, context_value=SimpleNamespace())
+        self.assertIsNone(result.errors)
+        return result.data['allOrders']
+
+    def test_walks_every_row_once_with_constant_queries(self):
+        customers, _, orders = seed_orders(25)
+        Order.objects.update(order_date=orders[0].order_date)  # force ties on the order key
+        seen = []
+        after = None
+        while True:
+            with self.assertNumQueries(1) as ctx:
+                page = self.page(first=10, after=after)
+            self.assertNotIn('OFFSET', ctx.captured_queries[0]['sql'])
+            seen += [edge['cursor'] for edge in page['edges']]
+            if not page['pageInfo']['hasNextPage']:
+                break
+            after = page['pageInfo']['endCursor']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+        backwards = self.page(last=10, before=seen[15])
+        self.assertEqual([edge['cursor'] for edge in backwards['edges']], seen[5:15])
+        self.assertTrue(backwards['pageInfo']['hasPreviousPage'])
+
+    def test_rejects_cursors_with_bad_values(self):
+        # ["x", 1]: well-formed, but "x" is no order date
+        result = schema.execute(self.QUERY, variable_values={'first': 1, 'after': 'WyJ4IiwxXQ=='}, context_value=SimpleNamespace())
+        self.assertEqual(result.errors[0].message, "Invalid cursor: WyJ4IiwxXQ==")
+
+    def test_total_count_only_when_selected(self):
+        seed_orders(3)
+        with self.assertNumQueries(2):
+            result = schema.execute('{ allCustomers(first: 2) { totalCount edges { node { name } } } }')
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data['allCustomers']['totalCount'], 3)
+        self.assertEqual(len(result.data['allCustomers']['edges']), 2)
+
+
+class PersistedQueryTests(TestCase):
+    QUERY = '{ hello }'
+
+    def post(self, body):
+        return self.client.post('/graphql/', json.dumps(body), content_type='application/json').json()
+
+    def test_hash_only_requests_after_registration(self):
+        metrics.clear()
+        extensions = {'persistedQuery': {'version': 1, 'sha256Hash': query_hash(self.QUERY)}}
+        missing = self.post({'extensions': extensions})
+        self.assertEqual(missing['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_NOT_FOUND')
+        self.assertEqual(self.post({'query': self.QUERY, 'extensions': extensions})['data'],
+                         {'hello': 'Hello, GraphQL!'})
+        self.assertEqual(self.post({'extensions': extensions})['data'], {'hello': 'Hello, GraphQL!'})
+        mismatch = self.post({'query': '{ __typename }', 'extensions': extensions})
+        self.assertEqual(mismatch['errors'][0]['extensions']['code'], 'PERSISTED_QUERY_HASH_MISMATCH')
+        published = self.client.get('/metrics/').content.decode()
+        self.assertIn('crm_persisted_query_hits_total 1\n', published)
+        self.assertIn('crm_persisted_query_misses_total 1\n', published)
+
+    def test_documents_are_parsed_and_validated_once(self):
+        document_cache.clear()
+        metrics.clear()
+        for _ in range(3):
+            self.assertEqual(self.post({'query': self.QUERY})['data'], {'hello': 'Hello, GraphQL!'})
+        invalid = self.post({'query': '{ nope }'})
+        self.assertIn('nope', invalid['errors'][0]['message'])
+        stats = document_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (2, 2, 2))
+        published = self.client.get('/metrics/').content.decode()
+        self.assertIn('crm_document_cache_hits_total 2\n', published)
+        self.assertIn('crm_document_cache_misses_total 2\n', published)
+
+
+class FlaggedCreateCustomer(graphene.Mutation):
+    ok = graphene.Boolean()
+
+    def mutate(self, info):
+        Customer.objects.create(name='Ada', email='ada@example.com')
+        # what graphene-django's form mutations do on invalid input
+        setattr(info.context, MUTATION_ERRORS_FLAG, True)
+        return FlaggedCreateCustomer(ok=False)
+
+
+class FlaggedMutations(graphene.ObjectType):
+    create_customer = FlaggedCreateCustomer.Field()
+
+
+class GraphQLViewBehaviourTests(TestCase):
+    # CRMGraphQLView.execute_operation copies these parts of graphene-django's
+    # GraphQLView.execute_graphql_request
+
+    def test_mutations_need_post(self):
+        mutation = 'mutation { updateLowStockProducts { updatedCount } }'
+        response = self.client.get('/graphql/', {'query': mutation}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response.json()['errors'][0]['message'], "Can only perform a mutation operation from a POST request.")
+
+    def test_atomic_mutations_roll_back_flagged_errors(self):
+        flagged = graphene.Schema(query=schema.query, mutation=FlaggedMutations)
+        view = CRMGraphQLView.as_view(schema=flagged)
+        body = json.dumps({'query': 'mutation { createCustomer { ok } }'})
+        # the per-database switch; GRAPHENE changes do not reach the imported settings
+        connection.settings_dict['ATOMIC_MUTATIONS'] = True
+        try:
+            response = view(RequestFactory().post('/graphql/', body, content_type='application/json'))
+        finally:
+            del connection.settings_dict['ATOMIC_MUTATIONS']
+        self.assertEqual(json.loads(response.content)['data'], {'createCustomer': {'ok': False}})
+        self.assertFalse(Customer.objects.exists())
+
+
+class FakeRedis:
+    """Just enough of redis.Redis for RedisBackend."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode() if isinstance(value, str) else value
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1).encode()
+
+    def info(self, section):
+        return {'evicted_keys': 0}
+
+
+class ResponseCacheTests(TestCase):
+    QUERY = '{ allProducts(lowStock: true) { edges { node { name stock } } } }'
+
+    def post(self, query):
+        return self.client.post('/graphql/', json.dumps({'query': query}), content_type='application/json').json()
+
+    def setUp(self):
+        metrics.clear()
+
+    def check_backend(self):
+        cache = get_response_cache()
+        Product.objects.create(name='Widget', price=Decimal('1.00'), stock=1)
+        first = self.post(self.QUERY)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.post('{allProducts(lowStock:true){edges{node{name stock}}}}'), first)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Gadget', price=Decimal('1.00'), stock=2)
+        self.assertEqual(len(self.post(self.QUERY)['data']['allProducts']['edges']), 2)
+        # an untouched model keeps its entries
+        self.post('{ allCustomers { edges { node { name } } } }')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Gizmo', price=Decimal('1.00'), stock=3)
+        with self.assertNumQueries(0):
+            self.post('{ allCustomers { edges { node { name } } } }')
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['invalidations']), (2, 3, 2))
+        published = self.client.get('/metrics/').content.decode()
+        for line in ['crm_response_cache_hits_total 2', 'crm_response_cache_misses_total 3',
+                     'crm_response_cache_invalidations_total 2']:
+            self.assertIn(line + '\n', published)
+
+    def test_locmem_backend(self):
+        with self.settings(CRM_RESPONSE_CACHE={'BACKEND': 'crm.response_cache.LocMemBackend'}):
+            self.check_backend()
+
+    def test_locmem_evictions_are_published(self):
+        config = {'BACKEND': 'crm.response_cache.LocMemBackend', 'OPTIONS': {'maxsize': 1}}
+        with self.settings(CRM_RESPONSE_CACHE=config):
+            self.post('{ allCustomers { edges { node { name } } } }')
+            self.post('{ allProducts { edges { node { name } } } }')
+        self.assertIn('crm_response_cache_evictions_total 1\n', self.client.get('/metrics/').content.decode())
+
+    def test_redis_backend(self):
+        config = {'BACKEND': 'crm.response_cache.RedisBackend', 'OPTIONS': {'client': FakeRedis()}}
+        with self.settings(CRM_RESPONSE_CACHE=config):
+            self.check_backend()
+
+    def test_new_orders_expire_customer_aggregates(self):
+        customer = Customer.objects.create(name='Ada', email='ada@example.com')
+        product = Product.objects.create(name='Widget', price=Decimal('5.00'), stock=5)
+        query = '{ allCustomers { edges { node { orderCount totalSpend } } } }'
+        mutation = f'mutation {{ createOrder(input: {{customerId: {customer.pk}, productIds: [{product.pk}]}}) {{ order {{ id }} }} }}'
+        with self.settings(CRM_RESPONSE_CACHE={'BACKEND': 'crm.response_cache.LocMemBackend'}):
+            self.assertEqual(self.post(query)['data']['allCustomers']['edges'], [{'node': {'orderCount': 0, 'totalSpend': '0.00'}}])
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post(mutation)
+            self.assertEqual(self.post(query)['data']['allCustomers']['edges'], [{'node': {'orderCount': 1, 'totalSpend': '5.00'}}])
+
+    def test_mutations_are_not_cached(self):
+        with self.settings(CRM_RESPONSE_CACHE={'BACKEND': 'crm.response_cache.LocMemBackend'}):
+            mutation = 'mutation { updateLowStockProducts { updatedCount } }'
+            self.post(mutation)
+            self.post(mutation)
+            self.assertEqual(get_response_cache().stats()['hits'], 0)
+
+
+class AsyncViewTests(TestCase):
+    async def post(self, query, variables=None):
+        response = await self.async_client.post(
+            '/graphql/async/', json.dumps({'query': query, 'variables': variables}), content_type='application/json'
+        )
+        return response.json()
+
+    async def test_query_matches_sync_view(self):
+        await sync_to_async(seed_orders)(12)
+        query = """
+            {
+                hello
+                allOrders(first: 5) {
+                    totalCount
+                    edges { node { totalAmount customer { email orders { id } } products { name orders { id } } } }
+                    pageInfo { hasNextPage endCursor }
+                }
+                allCustomers(last: 2) { edges { node { name orders { totalAmount } } } }
+            }
+        """
+        with self.settings(CRM_RESPONSE_CACHE=None):
+            async_result = await self.post(query)
+            sync_result = await sync_to_async(
+                lambda: self.client.post('/graphql/', json.dumps({'query': query}), content_type='application/json').json()
+            )()
+        self.assertNotIn('errors', async_result)
+        self.assertEqual(async_result, sync_result)
+        self.assertEqual(async_result['data']['allOrders']['totalCount'], 12)
+
+    async def test_mutations_run_in_sync_thread(self):
+        mutation = """
+            mutation ($input: CustomerInput!) {
+                createCustomer(input: $input) { customer { email orders { id } } }
+            }
+        """
+        result = await self.post(mutation, {'input': {'name': 'Ada', 'email': 'ada@example.com'}})
+        self.assertEqual(result['data']['createCustomer']['customer'], {'email': 'ada@example.com', 'orders': []})
+        self.assertTrue(await Customer.objects.filter(email='ada@example.com').aexists())
+
+    async def test_tracing_records_sql(self):
+        await sync_to_async(seed_orders)(5)
+        body = {'query': '{ allOrders(first: 5) { edges { node { products { name } } } } }', 'extensions': {'tracing': True}}
+        with self.settings(CRM_RESPONSE_CACHE=None):
+            response = await self.async_client.post('/graphql/async/', json.dumps(body), content_type='application/json')
+        sql = response.json()['extensions']['sql']
+        self.assertGreater(sql['count'], 0)
+        self.assertIn('Query.allOrders', sql['byField'])
+
+
+class QueryCostTests(TestCase):
+    def post(self, query, variables=None):
+        body = {'query': query, 'variables': variables}
+        return self.client.post('/graphql/', json.dumps(body), content_type='application/json')
+
+    def test_reports_cost_in_extensions(self):
+        query = """
+            query ($first: Int) {
+                allOrders(first: $first) { edges { node { customer { name } products { name } } } }
+            }
+        """
+        result = self.post(query, {'first': 4}).json()
+        self.assertNotIn('errors', result)
+        # allOrders 1 + 4 * (edges 1 + node 1 + customer 1 + products 1)
+        self.assertEqual(result['extensions']['cost']['requested'], 17)
+
+    def test_rejects_expensive_queries_before_execution(self):
+        query = """
+            {
+                allCustomers(first: 100) { edges { node {
+                    orders { products { orders { customer { name } } } }
+                } } }
+            }
+        """
+        with self.assertNumQueries(0):
+            response = self.post(query)
+        self.assertEqual(response.status_code, 400)
+        result = response.json()
+        self.assertNotIn('data', result)
+        self.assertEqual(result['errors'][0]['extensions']['code'], 'QUERY_TOO_COSTLY')
+        self.assertGreater(result['extensions']['cost']['requested'], result['extensions']['cost']['limit'])
+
+    def test_negative_page_sizes_do_not_offset_siblings(self):
+        query = """
+            {
+                a: allCustomers(first: 100) { edges { node {
+                    orders { products { orders { customer { name } } } }
+                } } }
+                b: allCustomers(first: -100000) { edges { node {
+                    orders { products { orders { customer { name } } } }
+                } } }
+            }
+        """
+        with self.assertNumQueries(0):
+            response = self.post(query)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['extensions']['code'], 'QUERY_TOO_COSTLY')
+
+    def test_rejects_deep_queries(self):
+        with self.settings(CRM_QUERY_DEPTH_LIMIT=3):
+            response = self.post('{ allOrders(first: 1) { edges { node { customer { name } } } } }')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['extensions']['code'], 'QUERY_TOO_DEEP')
+
+
+class TracingTests(TestCase):
+    QUERY = """
+        query Orders {
+            allOrders(first: 5) { edges { node { customer { email } products { name } } } }
+        }
+    """
+
+    def post(self, extensions=None):
+        body = {'query': self.QUERY, 'extensions': extensions}
+        return self.client.post('/graphql/', json.dumps(body), content_type='application/json').json()
+
+    def setUp(self):
+        metrics.clear()
+        seed_orders(5)
+
+    def test_trace_on_request(self):
+        with self.settings(CRM_RESPONSE_CACHE=None), self.assertNumQueries(2):
+            result = self.post({'tracing': True})
+        tracing = result['extensions']['tracing']
+        paths = [resolver['path'] for resolver in tracing['execution']['resolvers']]
+        self.assertIn(['allOrders'], paths)
+        self.assertIn(['allOrders', 'edges', 0, 'node', 'customer', 'email'], paths)
+        sql = result['extensions']['sql']
+        # the page and its prefetched products are both fetched by allOrders
+        self.assertEqual(sql['count'], 2)
+        self.assertEqual(set(sql['byField']), {'Query.allOrders'})
+        self.assertEqual(sql['nPlusOne'], [])
+        self.assertEqual(metrics.get('crm_graphql_sql_queries_total', field='Query.allOrders'), 2)
+        self.assertIn('crm_graphql_operations_total{operation_type="query"} 1', self.client.get('/metrics/').content.decode())
+
+    def test_untraced_by_default(self):
+        result = self.post()
+        self.assertNotIn('tracing', result['extensions'])
+        with self.settings(CRM_TRACING={'REQUESTABLE': False}):
+            self.assertNotIn('tracing', self.post({'tracing': True})['extensions'])
+        # only the document cache counted the requests
+        self.assertNotIn('crm_graphql_', metrics.render())
+
+    def test_detects_repeated_statements(self):
+        tracer = Tracer(n_plus_one_threshold=3)
+        with tracer.capture():
+            for customer in Customer.objects.all():
+                list(Order.objects.filter(customer=customer))
+            list(Order.objects.filter(customer_id__in=[1, 2, 3]))
+            list(Order.objects.filter(customer_id__in=[1, 2]))
+        [repeated] = tracer.n_plus_one()
+        self.assertEqual(repeated['count'], 5)
+        self.assertIn('"customer_id" = %s', repeated['sql'])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.customers, self.products, self.orders = seed_orders(5)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+
+    def get(self, path, **params):
+        response = self.client.get(path, params)
+        return response, b''.join(response.streaming_content).decode() if response.streaming else None
+
+    def test_orders_ndjson_with_filters(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(total_amount=Decimal('99.00'))
+        response, body = self.get('/export/orders/', total_amount__gte='50')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        [row] = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(row['id'], self.orders[0].pk)
+        self.assertEqual(row['customer_email'], 'customer0@example.com')
+        self.assertEqual([p['name'] for p in row['products']], ['Product 0', 'Product 1'])
+
+    def test_customers_csv(self):
+        response, body = self.get('/export/customers/', format='csv', email='customer3')
+        lines = body.splitlines()
+        self.assertEqual(lines[0], 'id,name,email,phone,created_at')
+        self.assertEqual(len(lines), 2)
+        self.assertIn('customer3@example.com', lines[1])
+
+    def test_order_products_flattened_in_csv(self):
+        _, body = self.get('/export/orders/', format='csv')
+        header, first, *rest = body.splitlines()
+        self.assertTrue(header.endswith('product_ids,product_names,product_quantities'))
+        self.assertTrue(first.endswith(f'{self.products[0].pk};{self.products[1].pk},Product 0;Product 1,1;1'))
+        self.assertEqual(len(rest), 4)
+
+    def test_one_prefetch_per_chunk(self):
+        # the order rows plus one products query per chunk of two
+        with self.assertNumQueries(4):
+            rows = list(export_rows('orders', {}, chunk_size=2))
+        self.assertEqual(len(rows), 5)
+
+    def test_invalid_filters(self):
+        response, _ = self.get('/export/orders/', total_amount__gte='lots')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('total_amount__gte', response.json()['errors'])
+        self.assertEqual(self.client.get('/export/products/').status_code, 404)
+
+    def test_requires_view_permissions(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/export/customers/').status_code, 403)
+        clerk = User.objects.create_user('clerk', 'clerk@example.com', 'secret')
+        clerk.user_permissions.add(Permission.objects.get(codename='view_order'))
+        self.client.force_login(clerk)
+        # order rows include customer details
+        self.assertEqual(self.client.get('/export/orders/').status_code, 403)
+        clerk.user_permissions.add(Permission.objects.get(codename='view_customer'))
+        self.assertEqual(self.client.get('/export/orders/').status_code, 200)
+
+
+class ImportTests(TestCase):
+    def run_import(self, kind, text, fmt, **kwargs):
+        return import_records(kind, read_records(io.StringIO(text), fmt), **kwargs)
+
+    def test_upserts_customers_on_email(self):
+        Customer.objects.create(name='Old', email='ada@example.com')
+        text = (
+            'name,email,phone\n'
+            'Ada,ada@example.com,+11234567890\n'
+            'Bob,bob@example.com,\n'
+            'Bad,not-an-email,\n'
+            'Eve,eve@example.com,12345\n'
+        )
+        result = self.run_import('customers', text, 'csv', batch_size=2)
+        self.assertEqual((result.processed, result.imported, result.rejected), (4, 2, 2))
+        self.assertEqual([number for number, _ in result.rejects], [3, 4])
+        self.assertIn('phone', result.rejects[1][1])
+        self.assertEqual(
+            list(Customer.objects.order_by('email').values_list('name', 'phone')),
+            [('Ada', '+11234567890'), ('Bob', '')],
+        )
+
+    def test_upserts_products_on_name(self):
+        existing = Product.objects.create(name='Laptop', price=Decimal('999.99'), stock=1)
+        text = '\n'.join([
+            '{"name": "Laptop", "price": "899.00", "stock": 4}',
+            '{"name": "Mouse", "price": "-1"}',
+            'not json',
+            '{"name": "Mouse", "price": "19.99", "stock": 10}',
+        ])
+        # savepoint, name lookup, insert, upsert, release
+        with self.assertNumQueries(5):
+            result = self.run_import('products', text, 'ndjson')
+        self.assertEqual((result.imported, result.rejected), (2, 2))
+        existing.refresh_from_db()
+        self.assertEqual((existing.price, existing.stock), (Decimal('899.00'), 4))
+        self.assertEqual(Product.objects.get(name='Mouse').price, Decimal('19.99'))
+
+    def test_resumes_after_checkpoint(self):
+        text = ''.join(f'{{"name": "C{i}", "email": "c{i}@example.com"}}\n' for i in range(5))
+        checkpoints = []
+        self.run_import('customers', text, 'ndjson', batch_size=2,
+                        on_batch=lambda result: checkpoints.append(result.last_record))
+        self.assertEqual(checkpoints, [2, 4, 5])
+        Customer.objects.filter(email__in=['c3@example.com', 'c4@example.com']).delete()
+        result = self.run_import('customers', text, 'ndjson', start_after=2)
+        self.assertEqual(result.processed, 3)
+        self.assertEqual(Customer.objects.count(), 5)
+
+
+class CustomerAggregateTests(TestCase):
+    def setUp(self):
+        self.ada = Customer.objects.create(name='Ada', email='ada@example.com')
+        self.cheap = Product.objects.create(name='Cheap', price=Decimal('2.50'), stock=10)
+        self.dear = Product.objects.create(name='Dear', price=Decimal('10.00'), stock=10)
+
+    def assertAggregates(self, customer, count, spend):
+        customer.refresh_from_db()
+        self.assertEqual((customer.order_count, customer.total_spend), (count, Decimal(spend)))
+        expected = customer.orders.order_by('-order_date').values_list('order_date', flat=True).first()
+        self.assertEqual(customer.last_order_date, expected)
+
+    def test_follows_orders_and_products(self):
+        first = Order.objects.create(customer=self.ada)
+        add_products(first, self.cheap, self.dear)
+        second = Order.objects.create(customer=self.ada)
+        add_products(second, self.dear)
+        self.assertAggregates(self.ada, 2, '22.50')
+        self.dear.orders.remove(first)
+        self.assertAggregates(self.ada, 2, '12.50')
+        self.dear.orders.clear()
+        self.assertAggregates(self.ada, 2, '2.50')
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertAggregates(self.ada, 1, '2.50')
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertAggregates(self.ada, 0, '0.00')
+
+    def test_bulk_orders_and_reconcile(self):
+        rows = [SimpleNamespace(customer_id=self.ada.pk, product_ids=[self.cheap.pk], order_date=None)] * 3
+        bulk_create_orders(rows)
+        self.assertAggregates(self.ada, 3, '7.50')
+        bob = Customer.objects.create(name='Bob', email='bob@example.com')
+        Customer.objects.filter(pk=self.ada.pk).update(order_count=0)
+        self.assertEqual(reconcile_customer_aggregates(batch_size=1, dry_run=True), (2, 1))
+        self.assertEqual(reconcile_customer_aggregates(batch_size=1), (2, 1))
+        self.assertAggregates(self.ada, 3, '7.50')
+        self.assertAggregates(bob, 0, '0.00')
+
+    def test_segment_filters_and_ordering(self):
+        for index, spend in enumerate([5, 50, 20, 80]):
+            customer = Customer.objects.create(name=f'C{index}', email=f'c{index}@example.com')
+            Customer.objects.filter(pk=customer.pk).update(total_spend=spend, order_count=index)
+        query = """
+            query ($after: String) {
+                allCustomers(first: 2, after: $after, orderBy: "-total_spend", totalSpend_Gte: 10) {
+                    edges { node { name totalSpend orderCount } }
+                    pageInfo { hasNextPage endCursor }
+                }
+            }
+        """
+        pages = []
+        after = None
+        while True:
+            result = schema.execute(query, variable_values={'after': after}, context_value=SimpleNamespace())
+            self.assertIsNone(result.errors)
+            connection = result.data['allCustomers']
+            pages.append([edge['node']['name'] for edge in connection['edges']])
+            if not connection['pageInfo']['hasNextPage']:
+                break
+            after = connection['pageInfo']['endCursor']
+        self.assertEqual(pages, [['C3', 'C1'], ['C2']])
+
+
+class SalesRollupTests(TestCase):
+    REPORT = """
+        query ($start: Date!, $end: Date!) {
+            salesByDay(start: $start, end: $end) { day orderCount itemsSold revenue }
+            topProducts(start: $start, end: $end, limit: 2) { product { name } orderCount quantity revenue }
+            topCustomers(start: $start, end: $end) { customer { email } orderCount revenue }
+        }
+    """
+
+    def setUp(self):
+        self.ada = Customer.objects.create(name='Ada', email='ada@example.com')
+        self.bob = Customer.objects.create(name='Bob', email='bob@example.com')
+        self.cheap = Product.objects.create(name='Cheap', price=Decimal('2.50'), stock=100)
+        self.dear = Product.objects.create(name='Dear', price=Decimal('10.00'), stock=100)
+        self.mid = Product.objects.create(name='Mid', price=Decimal('5.00'), stock=100)
+        rows = [
+            SimpleNamespace(customer_id=self.ada.pk, product_ids=[self.cheap.pk, self.dear.pk], order_date=None),
+            SimpleNamespace(customer_id=self.bob.pk, product_ids=[self.cheap.pk] * 3, order_date=None),
+            SimpleNamespace(customer_id=self.bob.pk, product_ids=[self.mid.pk], order_date=None),
+        ]
+        bulk_create_orders(rows)
+        self.today = timezone.localdate()
+
+    def report(self):
+        variables = {'start': str(self.today - timedelta(days=7)), 'end': str(self.today)}
+        result = schema.execute(self.REPORT, variable_values=variables, context_value=SimpleNamespace())
+        self.assertIsNone(result.errors)
+        return result.data
+
+    def test_reports_follow_new_and_deleted_orders(self):
+        data = self.report()
+        self.assertEqual(data['salesByDay'], [
+            {'day': str(self.today), 'orderCount': 3, 'itemsSold': 6, 'revenue': '25.00'},
+        ])
+        self.assertEqual(data['topProducts'], [
+            {'product': {'name': 'Cheap'}, 'orderCount': 2, 'quantity': 4, 'revenue': '10.00'},
+            {'product': {'name': 'Dear'}, 'orderCount': 1, 'quantity': 1, 'revenue': '10.00'},
+        ])
+        self.assertEqual(data['topCustomers'], [
+            {'customer': {'email': 'ada@example.com'}, 'orderCount': 1, 'revenue': '12.50'},
+            {'customer': {'email': 'bob@example.com'}, 'orderCount': 2, 'revenue': '12.50'},
+        ])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.get(customer=self.ada).delete()
+        data = self.report()
+        self.assertEqual(data['salesByDay'], [
+            {'day': str(self.today), 'orderCount': 2, 'itemsSold': 4, 'revenue': '12.50'},
+        ])
+        self.assertEqual([row['product']['name'] for row in data['topProducts']], ['Cheap', 'Mid'])
+
+    def test_incremental_rollups_match_a_rebuild(self):
+        # an order without items, on a day nothing else touches
+        Order.objects.create(customer=self.bob, order_date=timezone.now() - timedelta(days=2))
+        order = Order.objects.create(customer=self.ada)
+        add_products(order, self.dear, self.mid)
+        self.dear.orders.remove(order)
+        incremental = self.report()
+        rebuild_rollups()
+        self.assertEqual(self.report(), incremental)
+
+    def test_cascades_refresh_each_day_once(self):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            self.bob.delete()
+        refreshes = [query for query in queries if query['sql'].startswith('DELETE FROM "crm_dailysales"')]
+        self.assertEqual(len(refreshes), 1)
+        self.assertEqual(self.report()['salesByDay'], [
+            {'day': str(self.today), 'orderCount': 1, 'itemsSold': 2, 'revenue': '12.50'},
+        ])
+
+    def test_updates_are_chunked(self):
+        deltas = {
+            self.ada.pk: {'order_count': 1, 'revenue': Decimal('1.00')},
+            self.bob.pk: {'order_count': 2, 'revenue': Decimal('3.00')},
+        }
+        # the insert, then one UPDATE per customer
+        with self.assertNumQueries(3):
+            _add(DailyCustomerSales, self.today, deltas, key='customer_id', chunk_size=1)
+        rows = DailyCustomerSales.objects.filter(day=self.today).order_by('customer__name')
+        self.assertEqual(
+            [(row.order_count, row.revenue) for row in rows],
+            [(2, Decimal('13.50')), (4, Decimal('15.50'))],
+        )
+
+    def test_rebuild_command_backfills(self):
+        # update() bypasses the rollups
+        Order.objects.filter(customer=self.ada).update(order_date=timezone.now() - timedelta(days=1))
+        out = io.StringIO()
+        call_command('rebuild_sales_rollups', '--batch-days', '1', stdout=out, stderr=io.StringIO())
+        self.assertEqual(out.getvalue(), "Rebuilt rollups for 2 days\n")
+        self.assertEqual(self.report()['salesByDay'], [
+            {'day': str(self.today - timedelta(days=1)), 'orderCount': 1, 'itemsSold': 2, 'revenue': '12.50'},
+            {'day': str(self.today), 'orderCount': 2, 'itemsSold': 4, 'revenue': '12.50'},
+        ])
+
+    def test_reports_read_only_the_rollups(self):
+        # one range read for salesByDay, then a grouped read and one for the
+        # products or customers for each top list
+        with self.assertNumQueries(5):
+            self.report()
+
+
+
+@unittest.skipUnless(importlib.util.find_spec('numpy'), "NumPy is not installed")
+class OrderAnalyticsTests(TestCase):
+    def setUp(self):
+        self.ada = Customer.objects.create(name='Ada', email='ada@example.com')
+        self.bob = Customer.objects.create(name='Bob', email='bob@example.com')
+        self.cheap = Product.objects.create(name='Cheap', price=Decimal('2.50'), stock=100)
+        self.dear = Product.objects.create(name='Dear', price=Decimal('10.00'), stock=100)
+        bulk_create_orders([
+            SimpleNamespace(customer_id=self.ada.pk, product_ids=[self.cheap.pk, self.dear.pk], order_date=None),
+            SimpleNamespace(customer_id=self.bob.pk, product_ids=[self.cheap.pk] * 3, order_date=None),
+            SimpleNamespace(customer_id=self.bob.pk, product_ids=[self.dear.pk], order_date=None),
+        ])
+        # Ada's order moves back a month, ahead of everyone else's
+        Order.objects.filter(customer=self.ada).update(order_date=timezone.now() - timedelta(days=40))
+        self.today = timezone.localdate()
+
+    def test_arrays_match_the_rollups(self):
+        from . import analytics
+        rebuild_rollups()
+        orders = analytics.load_orders()
+        items = analytics.load_items(orders)
+        days, counts, sold, revenue = analytics.sales_by_day(orders, items)
+        self.assertEqual(days.tolist(), [self.today - timedelta(days=40), self.today])
+        self.assertEqual((counts.tolist(), sold.tolist(), revenue.tolist()), ([1, 2], [2, 4], [1250, 1750]))
+        expected = [
+            (row.product.pk, row.order_count, row.quantity, int(row.revenue * 100))
+            for row in top_products(self.today - timedelta(days=40), self.today)
+        ]
+        self.assertEqual(list(zip(*(column.tolist() for column in analytics.top_products(items)))), expected)
+
+    def test_order_analytics_query(self):
+        query = """
+            query ($start: Date!, $end: Date!) {
+                orderAnalytics(start: $start, end: $end, percentiles: [0, 50, 100]) {
+                    orderCount revenue
+                    orderValuePercentiles { percentile value }
+                    cohorts { month customers retention }
+                }
+            }
+        """
+        # Ada comes back this month
+        bulk_create_orders([SimpleNamespace(customer_id=self.ada.pk, product_ids=[self.cheap.pk], order_date=None)])
+        variables = {'start': str(self.today - timedelta(days=60)), 'end': str(self.today)}
+        result = schema.execute(query, variable_values=variables, context_value=SimpleNamespace())
+        self.assertIsNone(result.errors)
+        data = result.data['orderAnalytics']
+        self.assertEqual((data['orderCount'], data['revenue']), (4, '32.50'))
+        self.assertEqual([row['value'] for row in data['orderValuePercentiles']], ['2.50', '7.50', '12.50'])
+        first_month = (self.today - timedelta(days=40)).replace(day=1)
+        this_month = self.today.replace(day=1)
+        months = (this_month.year - first_month.year) * 12 + this_month.month - first_month.month
+        self.assertEqual(data['cohorts'], [
+            {'month': str(first_month), 'customers': 1, 'retention': [1.0] + [0.0] * (months - 1) + [1.0]},
+            {'month': str(this_month), 'customers': 1, 'retention': [1.0] + [0.0] * months},
+        ])
+
+
+    def analytics(self, selection, start, **arguments):
+        query = """
+            query ($start: Date!, $end: Date!, $limit: Int) {
+                orderAnalytics(start: $start, end: $end, limit: $limit) { %s }
+            }
+        """ % selection
+        variables = {'start': str(start), 'end': str(self.today), **arguments}
+        return schema.execute(query, variable_values=variables, context_value=SimpleNamespace())
+
+    def test_group_bys_match_the_rollup_reports(self):
+        rebuild_rollups()
+        start = self.today - timedelta(days=60)
+        reports = schema.execute("""
+            query ($start: Date!, $end: Date!) {
+                salesByDay(start: $start, end: $end) { day orderCount itemsSold revenue }
+                topProducts(start: $start, end: $end, limit: 1) { product { name } orderCount quantity revenue }
+                topCustomers(start: $start, end: $end, limit: 1) { customer { email } orderCount revenue }
+            }
+        """, variable_values={'start': str(start), 'end': str(self.today)}, context_value=SimpleNamespace())
+        result = self.analytics("""
+            salesByDay { day orderCount itemsSold revenue }
+            topProducts { product { name } orderCount quantity revenue }
+            topCustomers { customer { email } orderCount revenue }
+        """, start, limit=1)
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data['orderAnalytics'], reports.data)
+
+    def test_range_is_bounded(self):
+        result = self.analytics('orderCount', self.today - timedelta(days=400))
+        self.assertEqual(result.errors[0].message, "Order analytics cover 1 to 366 days")
+
+    def test_cohorts_start_at_the_first_order_ever(self):
+        bulk_create_orders([SimpleNamespace(customer_id=self.ada.pk, product_ids=[self.cheap.pk], order_date=None)])
+        # Ada's first order falls before the range: she starts no cohort
+        result = self.analytics('cohorts { month customers retention }', self.today - timedelta(days=20))
+        self.assertEqual(result.data['orderAnalytics']['cohorts'], [
+            {'month': str(self.today.replace(day=1)), 'customers': 1, 'retention': [1.0]},
+        ])
+
+    def test_cached_analytics_expire_with_new_orders(self):
+        query = '{ orderAnalytics(start: "%s", end: "%s") { orderCount } }' % (self.today - timedelta(days=60), self.today)
+        post = lambda: self.client.post('/graphql/', json.dumps({'query': query}), content_type='application/json').json()
+        with self.settings(CRM_RESPONSE_CACHE={'BACKEND': 'crm.response_cache.LocMemBackend'}):
+            self.assertEqual(post()['data']['orderAnalytics'], {'orderCount': 3})
+            with self.captureOnCommitCallbacks(execute=True):
+                bulk_create_orders([SimpleNamespace(customer_id=self.ada.pk, product_ids=[self.cheap.pk], order_date=None)])
+            self.assertEqual(post()['data']['orderAnalytics'], {'orderCount': 4})
+
+
+class InactiveCustomerCleanupTests(TestCase):
+    def setUp(self):
+        customers, self.products, orders = seed_orders(6)
+        long_ago = timezone.now() - timedelta(days=400)
+        # customers 0-3 last ordered long ago, 4 recently, 5 never
+        Order.objects.filter(customer__in=customers[:4]).update(order_date=long_ago)
+        Order.objects.filter(customer=customers[5]).delete()
+        Customer.objects.filter(pk=customers[5].pk).update(created_at=long_ago)
+        refresh_customer_aggregates(Customer.objects.all())
+        self.customers = customers
+
+    def test_deletes_in_batches_with_their_orders(self):
+        self.assertEqual(delete_inactive_customers(dry_run=True), 4)
+        batches = []
+        # per batch: savepoint, id select, order days, links, orders,
+        # customer rollups, customers, release, then the day's rollup
+        # refresh (savepoint, two reads, three deletes, three inserts unless
+        # the day is now empty, release); then the empty final select
+        with self.assertNumQueries((8 + 10) + (8 + 7) + 3) as ctx:
+            deleted = delete_inactive_customers(batch_size=2, progress=batches.append)
+        self.assertEqual((deleted, batches), (4, [2, 4]))
+        statements = [query['sql'].split(' "')[0] for query in ctx.captured_queries[:18]]
+        # the refresh starts once the batch has released its savepoint
+        self.assertEqual(statements[7:9], ['RELEASE SAVEPOINT', 'SAVEPOINT'])
+        self.assertEqual(set(Customer.objects.values_list('email', flat=True)),
+                         {'customer4@example.com', 'customer5@example.com'})
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderItem.objects.count(), 2)
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_never_ordered_customers_are_opt_in(self):
+        self.assertEqual(delete_inactive_customers(include_never_ordered=True), 5)
+        self.assertEqual(list(Customer.objects.values_list('email', flat=True)), ['customer4@example.com'])
+
+
+class ClientAdapter(requests.adapters.BaseAdapter):
+    """Send ``requests`` calls through Django's test client with CSRF checks on."""
+
+    def __init__(self):
+        super().__init__()
+        self.client = Client(enforce_csrf_checks=True)
+        self.sent = []
+
+    def send(self, request, **kwargs):
+        self.sent.append(json.loads(request.body))
+        headers = {name: value for name, value in request.headers.items() if name.lower() != 'content-type'}
+        handled = self.client.generic(
+            request.method, urlsplit(request.url).path, request.body,
+            content_type=request.headers.get('Content-Type'), headers=headers,
+        )
+        response = requests.Response()
+        response.status_code = handled.status_code
+        response.headers.update(handled.headers)
+        response._content = handled.content
+        response.url, response.request = request.url, request
+        return response
+
+    def close(self):
+        pass
+
+
+class JobTests(TestCase):
+    def setUp(self):
+        metrics.clear()
+
+    def test_jobs_run_in_process(self):
+        Product.objects.create(name='Low', price=Decimal('1.00'), stock=2)
+        run_job('update_low_stock')
+        self.assertEqual(Product.objects.get(name='Low').stock, 12)
+        self.assertEqual(metrics.get('crm_job_runs_total', job='update_low_stock', status='ok'), 1)
+        self.assertGreater(metrics.get('crm_job_seconds_total', job='update_low_stock'), 0)
+
+        _, _, orders = seed_orders(3)
+        Order.objects.update(order_date=timezone.now() - timedelta(hours=1))
+        self.assertEqual(run_job('send_order_reminders'), 3)
+
+    def http_executor(self, path, token='secret'):
+        adapter = ClientAdapter()
+        session = requests.Session()
+        session.mount('http://testserver/', adapter)
+        return HTTPExecutor(f'http://testserver{path}', session=session, token=token), adapter
+
+    def test_http_mode_validates_locally_and_reuses_the_session(self):
+        with self.settings(CRM_JOBS={'MODE': 'http', 'TOKEN': 'secret'}):
+            executor, adapter = self.http_executor('/graphql/jobs/')
+            self.assertEqual(executor.execute('{ hello }'), {'hello': 'Hello, GraphQL!'})
+            self.assertEqual(executor.execute('{ hello }'), {'hello': 'Hello, GraphQL!'})
+            with self.assertRaises(JobError):
+                executor.execute('{ orders { id } }')
+            # one POST per valid operation and no introspection query
+            self.assertEqual([body['query'] for body in adapter.sent], ['{ hello }', '{ hello }'])
+
+            Product.objects.create(name='Low', price=Decimal('1.00'), stock=2)
+            data = executor.execute(LOW_STOCK_MUTATION, {'after': None})
+            self.assertEqual(data['updateLowStockProducts']['updatedCount'], 1)
+
+    def test_http_mode_surfaces_http_errors(self):
+        with self.settings(CRM_JOBS={'MODE': 'http', 'TOKEN': 'secret'}):
+            # the public endpoint wants a CSRF token, the job endpoint its own
+            for path, token, status in [('/graphql/', 'secret', 403), ('/graphql/jobs/', 'wrong', 401)]:
+                executor, _ = self.http_executor(path, token)
+                with self.assertRaises(requests.HTTPError) as raised:
+                    executor.execute('{ hello }')
+                self.assertEqual(raised.exception.response.status_code, status)
+
+    async def test_async_job_endpoint(self):
+        client = AsyncClient(enforce_csrf_checks=True)
+        with self.settings(CRM_JOBS={'TOKEN': 'secret'}):
+            response = await client.post(
+                '/graphql/async/jobs/', json.dumps({'query': '{ hello }'}), content_type='application/json',
+                headers={'Authorization': 'Bearer secret'},
+            )
+        self.assertEqual(response.json()['data'], {'hello': 'Hello, GraphQL!'})
+
+
+class OrderReminderTests(TestCase):
+    def setUp(self):
+        _, _, self.orders = seed_orders(6)
+        now = timezone.now()
+        for index, order in enumerate(self.orders):
+            Order.objects.filter(pk=order.pk).update(order_date=now - timedelta(hours=10 - index))
+        # outside the first run's window
+        Order.objects.filter(pk=self.orders[0].pk).update(order_date=now - timedelta(days=8))
+
+    def reminders(self, **kwargs):
+        with self.assertLogs('order_reminders') as logs:
+            count = send_order_reminders(**kwargs)
+            reminder_logger.info('done')
+        ids = [line.split(':', 2)[2].split(' - ')[0].strip() for line in logs.output[:-1]]
+        return count, [int(from_global_id(global_id).id) for global_id in ids]
+
+    def test_only_new_orders_are_read(self):
+        count, logged = self.reminders(batch_size=2)
+        self.assertEqual(count, 5)
+        self.assertEqual(logged, [order.pk for order in self.orders[1:]])
+
+        # checkpoint lookup and one page read
+        with self.assertNumQueries(2):
+            self.assertEqual(self.reminders(), (0, []))
+
+        customer = Customer.objects.get(pk=self.orders[0].customer_id)
+        late = Order.objects.create(customer=customer)
+        Order.objects.filter(pk=late.pk).update(order_date=timezone.now() - timedelta(minutes=5))
+        fresh = Order.objects.create(customer=customer)  # inside the settle lag
+        self.assertEqual(self.reminders(), (1, [late.pk]))
+        Order.objects.filter(pk=fresh.pk).update(order_date=timezone.now() - timedelta(minutes=2))
+        self.assertEqual(self.reminders(), (1, [fresh.pk]))
+
+
+class RoutingWithoutReplicasTests(TestCase):
+    def test_mutations_leave_no_session(self):
+        mutation = 'mutation { createCustomer(input: {name: "Ada", email: "ada@example.com"}) { customer { id } } }'
+        with self.settings(CRM_RESPONSE_CACHE=None, CRM_DATABASE_ROUTING={'REPLICAS': ['replica']}):
+            response = self.client.post('/graphql/', json.dumps({'query': mutation}), content_type='application/json')
+        self.assertIsNone(response.json().get('errors'))
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertFalse(Session.objects.exists())
+
+
+@unittest.skipUnless('replica' in settings.DATABASES, "CRM_REPLICA_DATABASE is not set")
+class ReplicaRoutingTests(TestCase):
+    # 'replica' is a separate SQLite database that never receives the
+    # primary's writes, so each read shows where it was routed; the runner
+    # sets up the databases of skipped classes too
+    databases = {'default', 'replica'} & set(settings.DATABASES)
+    QUERY = '{ allCustomers { edges { node { name } } } }'
+    MUTATION = 'mutation { createCustomer(input: {name: "Ada", email: "ada@example.com"}) { customer { id } } }'
+
+    def setUp(self):
+        Customer.objects.using('replica').bulk_create([Customer(name='Replica', email='replica@example.com')])
+        Customer.objects.create(name='Primary', email='primary@example.com')
+
+    def post(self, query):
+        response = self.client.post('/graphql/', json.dumps({'query': query}), content_type='application/json')
+        return response.json()
+
+    def names(self):
+        return [edge['node']['name'] for edge in self.post(self.QUERY)['data']['allCustomers']['edges']]
+
+    def test_queries_read_replicas_until_a_mutation(self):
+        with self.settings(CRM_RESPONSE_CACHE=None, CRM_DATABASE_ROUTING={'REPLICAS': ['replica']}):
+            self.assertEqual(self.names(), ['Replica'])
+            self.client.session  # start a session
+            self.assertIsNone(self.post(self.MUTATION).get('errors'))
+            # the session reads its own write from the primary
+            self.assertEqual(self.names(), ['Primary', 'Ada'])
+            self.assertFalse(Customer.objects.using('replica').filter(email='ada@example.com').exists())
+
+            self.client.cookies.clear()
+            self.assertEqual(self.names(), ['Replica'])
+            # operations outside the views stay on the primary
+            result = schema.execute(self.QUERY, context_value=SimpleNamespace())
+            self.assertEqual(len(result.data['allCustomers']['edges']), 2)
+
+    def test_stickiness_can_be_limited_to_the_request(self):
+        routing = {'REPLICAS': ['replica'], 'STICKY_SECONDS': 0}
+        with self.settings(CRM_RESPONSE_CACHE=None, CRM_DATABASE_ROUTING=routing):
+            self.client.session
+            self.post(self.MUTATION)
+            self.assertEqual(self.names(), ['Replica'])
+        with self.settings(CRM_RESPONSE_CACHE=None, CRM_DATABASE_ROUTING=None):
+            self.assertEqual(self.names(), ['Primary', 'Ada'])
+
+    async def test_async_view_routes_queries(self):
+        routing = {'REPLICAS': ['replica']}
+        with self.settings(CRM_RESPONSE_CACHE=None, CRM_DATABASE_ROUTING=routing):
+            response = await self.async_client.post(
+                '/graphql/async/', json.dumps({'query': self.QUERY}), content_type='application/json'
+            )
+        self.assertEqual(response.json()['data']['allCustomers']['edges'], [{'node': {'name': 'Replica'}}])
@@ -0,0 +1,308 @@
+"""Resolver tracing and SQL instrumentation for GraphQL operations.
+
+A traced operation runs with ``TracingMiddleware`` and a database execute
+wrapper. Every resolver call is timed by its response path and every SQL
+statement is charged to the field (``Type.field``) whose resolver issued
+it. Statements of the same shape repeated ``N_PLUS_ONE_THRESHOLD`` times or
+more are reported as N+1 candidates.
+
+Configured with ``CRM_TRACING``; when it is unset nothing is installed and
+untraced operations pay nothing. Keys:
+
+* ``REQUESTABLE``: clients may ask for a trace by sending the
+  ``{"tracing": true}`` request extension; it is returned in the
+  response ``extensions`` in the Apollo tracing format plus an ``sql`` entry.
+* ``SAMPLE_RATE``: fraction of all operations traced for logs and metrics.
+* ``LOG``: log a JSON summary of each traced operation to ``crm.tracing``.
+* ``METRICS``: add each traced operation to the counters served at
+  ``/metrics/`` in the Prometheus text format.
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from inspect import isawaitable
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('crm.tracing')
+
+DEFAULT_N_PLUS_ONE_THRESHOLD = 3
+
+_current_field = ContextVar('crm_tracing_field', default=None)
+
+_current_tracer = ContextVar('crm_tracer', default=None)
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def sql_shape(sql):
+    """Normalize ``sql`` so batches of different sizes share one shape."""
+    return _IN_LIST.sub('IN (...)', sql)
+
+
+def _path_list(path):
+    return list(path.as_list()) if path is not None else []
+
+
+class Tracer:
+    """Timings and SQL statements recorded for one operation."""
+
+    def __init__(self, operation_name=None, operation_type=None, in_response=False,
+                 n_plus_one_threshold=DEFAULT_N_PLUS_ONE_THRESHOLD):
+        self.operation_name = operation_name
+        self.operation_type = operation_type
+        self.in_response = in_response
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.start_time = datetime.now(timezone.utc)
+        self.start = time.perf_counter_ns()
+        self.end = None
+        self.resolvers = []
+        self.sql_by_field = defaultdict(lambda: [0, 0])
+        self.shapes = defaultdict(lambda: [0, set()])
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter_ns()) - self.start
+
+    def record_resolver(self, info, start, end):
+        self.resolvers.append({
+            'path': _path_list(info.path),
+            'parentType': info.parent_type.name,
+            'fieldName': info.field_name,
+            'returnType': str(info.return_type),
+            'startOffset': start - self.start,
+            'duration': end - start,
+        })
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        field = _current_field.get() or 'Query'
+        start = time.perf_counter_ns()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats = self.sql_by_field[field]
+            stats[0] += 1
+            stats[1] += time.perf_counter_ns() - start
+            shape = self.shapes[sql_shape(sql)]
+            shape[0] += 1
+            shape[1].add(field)
+
+    @contextmanager
+    def capture(self):
+        """Record the statements run in this context on every database connection.
+
+        Connections belong to their thread: threads other than the current
+        one that run the operation's queries must call ``install_sql_tracing``.
+        """
+        install_sql_tracing()
+        token = _current_tracer.set(self)
+        try:
+            yield self
+        finally:
+            _current_tracer.reset(token)
+
+    def n_plus_one(self):
+        return [
+            {'sql': sql, 'count': count, 'fields': sorted(fields)}
+            for sql, (count, fields) in self.shapes.items()
+            if count >= self.n_plus_one_threshold
+        ]
+
+    def sql_summary(self):
+        return {
+            'count': sum(count for count, _ in self.sql_by_field.values()),
+            'duration': sum(duration for _, duration in self.sql_by_field.values()),
+            'byField': {
+                field: {'count': count, 'duration': duration}
+                for field, (count, duration) in sorted(self.sql_by_field.items())
+            },
+            'nPlusOne': self.n_plus_one(),
+        }
+
+    def apollo_tracing(self):
+        return {
+            'version': 1,
+            'startTime': self.start_time.isoformat(),
+            'endTime': (self.start_time + timedelta(microseconds=self.duration / 1000)).isoformat(),
+            'duration': self.duration,
+            'execution': {'resolvers': self.resolvers},
+        }
+
+    def finish(self, extensions):
+        """Stop the clock, emit logs and metrics and fill in ``extensions``."""
+        self.end = time.perf_counter_ns()
+        config = get_tracing_config() or {}
+        sql = self.sql_summary()
+        if config.get('METRICS', True):
+            record_metrics(self, sql)
+        if config.get('LOG', False):
+            logger.info(json.dumps(self.log_record(sql), sort_keys=True))
+        if self.in_response:
+            extensions['tracing'] = self.apollo_tracing()
+            extensions['sql'] = sql
+        return extensions
+
+    def log_record(self, sql):
+        by_field = defaultdict(int)
+        for resolver in self.resolvers:
+            by_field[f"{resolver['parentType']}.{resolver['fieldName']}"] += resolver['duration']
+        slowest = sorted(by_field.items(), key=lambda item: item[1], reverse=True)[:5]
+        return {
+            'event': 'graphql.operation',
+            'operation': self.operation_name,
+            'operation_type': self.operation_type,
+            'duration_ms': round(self.duration / 1e6, 3),
+            'resolvers': len(self.resolvers),
+            'sql_count': sql['count'],
+            'sql_ms': round(sql['duration'] / 1e6, 3),
+            'slowest_fields_ms': {field: round(duration / 1e6, 3) for field, duration in slowest},
+            'n_plus_one': [{'sql': item['sql'], 'count': item['count']} for item in sql['nPlusOne']],
+        }
+
+
+class TracingMiddleware:
+    """Graphene middleware timing each resolver and tagging its SQL with the field."""
+
+    def resolve(self, next, root, info, **args):
+        tracer = getattr(info.context, 'crm_tracer', None)
+        if tracer is None:
+            return next(root, info, **args)
+        field = f'{info.parent_type.name}.{info.field_name}'
+        start = time.perf_counter_ns()
+        token = _current_field.set(field)
+        try:
+            result = next(root, info, **args)
+        finally:
+            _current_field.reset(token)
+        if isawaitable(result):
+            return self._finish_async(result, tracer, info, field, start)
+        tracer.record_resolver(info, start, time.perf_counter_ns())
+        return result
+
+    async def _finish_async(self, result, tracer, info, field, start):
+        token = _current_field.set(field)
+        try:
+            return await result
+        finally:
+            _current_field.reset(token)
+            tracer.record_resolver(info, start, time.perf_counter_ns())
+
+
+def _trace_execute(execute, sql, params, many, context):
+    tracer = _current_tracer.get()
+    if tracer is None:
+        return execute(sql, params, many, context)
+    return tracer.execute_wrapper(execute, sql, params, many, context)
+
+
+def install_sql_tracing():
+    """Hand the statements of this thread's connections to the tracer of their context."""
+    for connection in connections.all():
+        if _trace_execute not in connection.execute_wrappers:
+            connection.execute_wrappers.append(_trace_execute)
+
+
+def get_tracing_config():
+    return getattr(settings, 'CRM_TRACING', None)
+
+
+def start_tracing(request, extensions, operation_ast, operation_name=None):
+    """Return a ``Tracer`` when this operation is traced, otherwise None."""
+    config = get_tracing_config()
+    if not config:
+        return None
+    requested = bool(config.get('REQUESTABLE', False) and extensions.get('tracing'))
+    sampled = random.random() < config.get('SAMPLE_RATE', 0.0)
+    if not (requested or sampled):
+        return None
+    operation_type = operation_ast.operation.value if operation_ast is not None else None
+    if operation_name is None and operation_ast is not None and operation_ast.name:
+        operation_name = operation_ast.name.value
+    return Tracer(
+        operation_name, operation_type, in_response=requested,
+        n_plus_one_threshold=config.get('N_PLUS_ONE_THRESHOLD', DEFAULT_N_PLUS_ONE_THRESHOLD),
+    )
+
+
+class Metrics:
+    """Process-wide counters rendered in the Prometheus text exposition format."""
+
+    HELP = {
+        'crm_graphql_operations_total': 'Traced GraphQL operations.',
+        'crm_graphql_operation_seconds_total': 'Wall time of traced GraphQL operations.',
+        'crm_graphql_resolver_calls_total': 'Resolver calls by field.',
+        'crm_graphql_resolver_seconds_total': 'Resolver wall time by field.',
+        'crm_graphql_sql_queries_total': 'SQL statements by the field that issued them.',
+        'crm_graphql_sql_seconds_total': 'SQL time by the field that issued it.',
+        'crm_graphql_n_plus_one_total': 'Operations with repeated SQL shapes, by field.',
+        'crm_job_runs_total': 'Scheduled job runs by outcome.',
+        'crm_job_seconds_total': 'Wall time of scheduled job runs.',
+        'crm_document_cache_hits_total': 'Parsed-document cache hits.',
+        'crm_document_cache_misses_total': 'Parsed-document cache misses.',
+        'crm_document_cache_evictions_total': 'Documents evicted from the parsed-document cache.',
+        'crm_persisted_query_hits_total': 'Hash-only requests answered from the persisted-query store.',
+        'crm_persisted_query_misses_total': 'Hash-only requests for unknown persisted queries.',
+        'crm_persisted_query_registrations_total': 'Documents registered in the persisted-query store.',
+        'crm_response_cache_hits_total': 'Response cache hits.',
+        'crm_response_cache_misses_total': 'Response cache misses.',
+        'crm_response_cache_invalidations_total': 'Model versions bumped in the response cache.',
+        'crm_response_cache_evictions_total': 'Entries evicted from the in-process response cache.',
+    }
+
+    def __init__(self):
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] += value
+
+    def get(self, name, **labels):
+        return self._values.get((name, tuple(sorted(labels.items()))), 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = []
+        seen = set()
+        for (name, labels), value in values:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# HELP {name} {self.HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} counter')
+            label_text = ','.join(
+                '%s="%s"' % (key, str(val).replace('\\', '\\\\').replace('"', '\\"')) for key, val in labels
+            )
+            lines.append(f'{name}{{{label_text}}} {value:g}' if label_text else f'{name} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def record_metrics(tracer, sql):
+    operation_type = tracer.operation_type or 'unknown'
+    metrics.inc('crm_graphql_operations_total', operation_type=operation_type)
+    metrics.inc('crm_graphql_operation_seconds_total', tracer.duration / 1e9, operation_type=operation_type)
+    for resolver in tracer.resolvers:
+        field = f"{resolver['parentType']}.{resolver['fieldName']}"
+        metrics.inc('crm_graphql_resolver_calls_total', field=field)
+        metrics.inc('crm_graphql_resolver_seconds_total', resolver['duration'] / 1e9, field=field)
+    for field, stats in sql['byField'].items():
+        metrics.inc('crm_graphql_sql_queries_total', stats['count'], field=field)
+        metrics.inc('crm_graphql_sql_seconds_total', stats['duration'] / 1e9, field=field)
+    for item in sql['nPlusOne']:
+        for field in item['fields']:
+            metrics.inc('crm_graphql_n_plus_one_total', field=field)
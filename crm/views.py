@@ -1,3 +1,368 @@
-from django.shortcuts import render
+import hmac
+import json
+from contextlib import nullcontext
+from inspect import isawaitable
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.http.response import HttpResponseBadRequest
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, HttpError
+from graphql import ExecutionResult, OperationType, execute, get_operation_ast, validate_schema
+from .cost import check_cost
+from .documents import get_document, resolve_persisted_query
+from .export import EXPORT_PERMISSIONS, EXPORTS, FORMATS, encode_rows, export_rows
+from .response_cache import get_response_cache
+from .routing import route_operation
+from .tracing import TracingMiddleware, install_sql_tracing, metrics, start_tracing
 
-# Create your views here.
+
+class CRMGraphQLView(GraphQLView):
+    """GraphQLView with persisted queries, document and response caches, cost limits, tracing and replica routing."""
+
+    def get_extensions(self, request, data):
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        return extensions or {}
+
+    def get_response(self, request, data, show_graphiql=False):
+        request.crm_extensions = None
+        return super().get_response(request, data, show_graphiql)
+
+    def json_encode(self, request, d, pretty=False):
+        # GraphQLView.get_response drops ExecutionResult.extensions (cost,
+        # tracing); put them back into the operation's response
+        extensions = getattr(request, 'crm_extensions', None)
+        if extensions and ('data' in d or 'errors' in d):
+            d = {**d, 'extensions': extensions}
+            request.crm_extensions = None
+        return super().json_encode(request, d, pretty)
+
+    def prepare_document(self, request, data, query, operation_name, show_graphiql=False):
+        """Resolve, parse and validate the request's document.
+
+        Returns ``(document, operation_ast, result)``; when ``document`` is
+        None, ``result`` is the response to send instead of executing.
+        """
+        query, error = resolve_persisted_query(query, self.get_extensions(request, data))
+        if error is not None:
+            return None, None, ExecutionResult(data=None, errors=[error])
+        if not query:
+            if show_graphiql:
+                return None, None, None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return None, None, ExecutionResult(data=None, errors=schema_validation_errors)
+
+        document, errors = get_document(schema, query, self.validation_rules)
+        if document is None or errors:
+            return None, None, ExecutionResult(data=None, errors=errors)
+
+        operation_ast = get_operation_ast(document, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None, None, None
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+        return document, operation_ast, None
+
+    def get_response_cache(self, operation_ast):
+        if operation_ast is not None and operation_ast.operation == OperationType.QUERY:
+            return get_response_cache()
+        return None
+
+    def get_middleware(self, request):
+        middleware = list(self.middleware or [])
+        if getattr(request, 'crm_tracer', None) is not None:
+            # the last middleware is the outermost one
+            middleware.append(TracingMiddleware())
+        return middleware
+
+    def start_tracing(self, request, data, operation_ast, operation_name):
+        request.crm_tracer = start_tracing(
+            request, self.get_extensions(request, data), operation_ast, operation_name
+        )
+        if request.crm_tracer is None:
+            return nullcontext()
+        return request.crm_tracer.capture()
+
+    def finish_tracing(self, request, extensions):
+        tracer = getattr(request, 'crm_tracer', None)
+        if tracer is not None:
+            tracer.finish(extensions)
+        return extensions
+
+    def get_execute_options(self, request, variables, operation_name):
+        execute_options = {
+            "root_value": self.get_root_value(request),
+            "context_value": self.get_context(request),
+            "variable_values": variables,
+            "operation_name": operation_name,
+            "middleware": self.get_middleware(request),
+        }
+        if self.execution_context_class:
+            execute_options["execution_context_class"] = self.execution_context_class
+        return execute_options
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        result = self.execute_operation(request, data, query, variables, operation_name, show_graphiql)
+        if result is not None:
+            request.crm_extensions = result.extensions
+        return result
+
+    def execute_operation(self, request, data, query, variables, operation_name, show_graphiql=False):
+        # Follows GraphQLView.execute_graphql_request of graphene-django,
+        # which parses and validates every request itself, with the document,
+        # cost and response cache steps added. Its GET-mutation check,
+        # ATOMIC_MUTATIONS and rollback handling are copied here and in
+        # prepare_document; GraphQLViewBehaviourTests cover them.
+        document, operation_ast, result = self.prepare_document(
+            request, data, query, operation_name, show_graphiql
+        )
+        if document is None:
+            return result
+
+        schema = self.schema.graphql_schema
+        extensions, error = check_cost(schema, document, operation_name, variables)
+        if error is not None:
+            return ExecutionResult(data=None, errors=[error], extensions=extensions)
+
+        response_cache = self.get_response_cache(operation_ast)
+        if response_cache is not None:
+            cache_key = response_cache.make_key(schema, document, operation_name, variables)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return ExecutionResult(data=cached, extensions=extensions)
+
+        try:
+            trace = self.start_tracing(request, data, operation_ast, operation_name)
+            execute_options = self.get_execute_options(request, variables, operation_name)
+
+            if (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                )
+            ):
+                with trace, route_operation(request, operation_ast), transaction.atomic():
+                    result = execute(schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                result.extensions = self.finish_tracing(request, extensions)
+                return result
+
+            with trace, route_operation(request, operation_ast):
+                result = execute(schema, document, **execute_options)
+            if response_cache is not None and not result.errors:
+                response_cache.set(cache_key, result.data)
+            result.extensions = self.finish_tracing(request, extensions)
+            return result
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+
+class SyncMutationMiddleware:
+    """Run root mutation resolvers, which use the sync ORM, in Django's sync thread."""
+
+    def resolve(self, next, root, info, **args):
+        if info.operation.operation == OperationType.MUTATION and info.path.prev is None:
+            return sync_to_async(next)(root, info, **args)
+        return next(root, info, **args)
+
+
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """ASGI-native GraphQL endpoint.
+
+    Runs the schema with graphql-core's async executor, so query root fields
+    resolve concurrently and the connection fields and relation loaders use
+    Django's async ORM. Mutations keep their sync resolvers and run in the
+    sync thread. GraphiQL, batching and ATOMIC_MUTATIONS are not supported here.
+    """
+
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+            data = self.parse_body(request)
+            result, status_code = await self.aget_response(request, data)
+            return HttpResponse(status=status_code, content=result, content_type="application/json")
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+            return response
+
+    async def aget_response(self, request, data):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        execution_result = await self.aexecute_graphql_request(
+            request, data, query, variables, operation_name
+        )
+        response = {}
+        status_code = 200
+        if execution_result.errors:
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+        if execution_result.errors and any(
+            not getattr(e, "path", None) for e in execution_result.errors
+        ):
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+        if execution_result.extensions:
+            response["extensions"] = execution_result.extensions
+        return self.json_encode(request, response), status_code
+
+    def get_context(self, request):
+        request.crm_async = True
+        return request
+
+    def get_middleware(self, request):
+        return [SyncMutationMiddleware(), *super().get_middleware(request)]
+
+    async def aexecute_graphql_request(self, request, data, query, variables, operation_name):
+        document, operation_ast, result = self.prepare_document(request, data, query, operation_name)
+        if document is None:
+            return result
+
+        schema = self.schema.graphql_schema
+        extensions, error = check_cost(schema, document, operation_name, variables)
+        if error is not None:
+            return ExecutionResult(data=None, errors=[error], extensions=extensions)
+
+        response_cache = self.get_response_cache(operation_ast)
+        if response_cache is not None:
+            cache_key = response_cache.make_key(schema, document, operation_name, variables)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return ExecutionResult(data=cached, extensions=extensions)
+
+        # the session and the cache are read with sync APIs
+        routing = await sync_to_async(route_operation)(request, operation_ast)
+        try:
+            trace = self.start_tracing(request, data, operation_ast, operation_name)
+            if request.crm_tracer is not None:
+                # the ORM runs in the sync thread, on that thread's connections
+                await sync_to_async(install_sql_tracing)()
+            with trace, routing:
+                result = execute(schema, document, **self.get_execute_options(request, variables, operation_name))
+                if isawaitable(result):
+                    result = await result
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+        if response_cache is not None and not result.errors:
+            response_cache.set(cache_key, result.data)
+        result.extensions = self.finish_tracing(request, extensions)
+        return result
+
+
+def job_token_valid(request):
+    """Whether ``request`` carries ``CRM_JOBS['TOKEN']`` as a bearer token."""
+    token = (getattr(settings, 'CRM_JOBS', None) or {}).get('TOKEN')
+    header = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode())
+
+
+def _job_token_rejected():
+    return JsonResponse({'errors': [{'message': "A valid job token is required"}]}, status=401)
+
+
+class JobGraphQLView(CRMGraphQLView):
+    """GraphQL endpoint for scheduled jobs and load tests.
+
+    Authenticated with ``CRM_JOBS['TOKEN']`` instead of a session, so it
+    skips the CSRF checks browsers need; without a token it rejects every
+    request.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    def dispatch(self, request, *args, **kwargs):
+        if not job_token_valid(request):
+            return _job_token_rejected()
+        return super().dispatch(request, *args, **kwargs)
+
+
+class AsyncJobGraphQLView(AsyncCRMGraphQLView):
+    """``JobGraphQLView`` on the ASGI-native endpoint."""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        if not job_token_valid(request):
+            return _job_token_rejected()
+        return await super().dispatch(request, *args, **kwargs)
+
+
+def metrics_view(request):
+    """Tracing, job and cache counters in the Prometheus text exposition format."""
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_GET
+def export_view(request, kind):
+    """Stream customers or orders as NDJSON or CSV.
+
+    Query parameters are the ``CustomerFilter``/``OrderFilter`` arguments
+    plus ``format`` (``ndjson`` by default or ``csv``). Requires the view
+    permissions of every model the export contains.
+    """
+    if kind not in EXPORTS:
+        raise Http404(f"Unknown export: {kind}")
+    if not request.user.has_perms(EXPORT_PERMISSIONS[kind]):
+        return JsonResponse({'errors': ["You do not have permission to export " + kind]}, status=403)
+    params = request.GET.copy()
+    fmt = params.pop('format', ['ndjson'])[-1]
+    if fmt not in FORMATS:
+        return JsonResponse({'errors': {'format': [f"Unknown format: {fmt}"]}}, status=400)
+    try:
+        rows = export_rows(kind, params)
+        # surface filter errors before the response starts streaming
+        first = next(rows, None)
+    except ValidationError as e:
+        return JsonResponse({'errors': e.message_dict if hasattr(e, 'error_dict') else e.messages}, status=400)
+
+    def stream():
+        if first is not None:
+            yield first
+        yield from rows
+
+    response = StreamingHttpResponse(encode_rows(kind, stream(), fmt), content_type=FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response